@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# ⏱️ Benchmark: clean_dataframe (old two-call loop vs schema-driven single pass)
+# ──────────────────────────────────────────────────────────────────────────────
+Runs both versions on the bundled raw data/*.csv and prints wall time and
+peak traced memory (tracemalloc, which also sees NumPy / pandas buffers) for
+each table.
+
+    python benchmarks/bench_clean.py
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'etl scripts'))
+
+from cleaning import clean_dataframe  # noqa: E402
+
+RAW_DIR = os.path.join(REPO_DIR, 'raw data')
+TABLES = ['customers', 'orders', 'products', 'order_items', 'reviews']
+REPEATS = 3
+
+
+def legacy_clean_dataframe(df, table_name=None):
+    """The pre-schema clean_dataframe, kept here only as the baseline (debug print removed)."""
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            df[col] = df[col].astype(str).str.strip()
+            df[col] = df[col].replace({'': pd.NA, ' ': pd.NA, 'nan': pd.NA, 'NaN': pd.NA})
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(0)
+
+    table_date_cols = {
+        'customers': ['signup_date', 'dob'],
+        'orders': ['order_date'],
+        'reviews': ['review_date'],
+    }
+    for col in table_date_cols.get(table_name, []):
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip().replace({'': pd.NA})
+            df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True).dt.date
+
+    for col in ['order_id', 'customer_id', 'order_item_id', 'product_id']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip()
+    return df
+
+
+def legacy_clean(df, table_name):
+    # The old ETL loop called it twice per table
+    df = legacy_clean_dataframe(df, table_name)
+    return legacy_clean_dataframe(df)
+
+
+def measure(clean, raw, table_name):
+    """
+    Best wall time over REPEATS runs, then peak traced memory from one extra
+    run (tracemalloc slows pandas down a lot, so it is kept out of the timing).
+    """
+    best_seconds = float('inf')
+    for _ in range(REPEATS):
+        df = raw.copy()
+        start = time.perf_counter()
+        clean(df, table_name)
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+
+    df = raw.copy()
+    tracemalloc.start()
+    clean(df, table_name)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best_seconds, peak / 1024 ** 2
+
+
+def main():
+    warnings.simplefilter('ignore', UserWarning)  # dayfirst=True on ISO dates warns on every call
+    print(f"{'table':<12} {'rows':>8} | {'old s':>7} {'new s':>7} {'speedup':>7} | {'old MiB':>8} {'new MiB':>8}")
+    for table_name in TABLES:
+        raw = pd.read_csv(os.path.join(RAW_DIR, f'{table_name}.csv'))
+        old_s, old_mib = measure(legacy_clean, raw, table_name)
+        new_s, new_mib = measure(clean_dataframe, raw, table_name)
+        print(f"{table_name:<12} {len(raw):>8} | {old_s:>7.3f} {new_s:>7.3f} {old_s / new_s:>6.1f}x"
+              f" | {old_mib:>8.1f} {new_mib:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
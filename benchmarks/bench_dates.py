@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# ⏱️ Benchmark: date parsing on customers.csv (signup_date, dob)
+# ──────────────────────────────────────────────────────────────────────────────
+Old:  pd.to_datetime(col, errors='coerce', dayfirst=True).dt.date
+New:  dates.parse_dates(col, '%Y-%m-%d')  (fixed-format fast path + cached fallback)
+
+Also shows how many values the two versions disagree on (the dayfirst guess
+swaps day and month on ISO dates).
+
+    python benchmarks/bench_dates.py
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'etl scripts'))
+
+from dates import parse_dates  # noqa: E402
+from schemas import DATE_FORMATS, read_dtypes  # noqa: E402
+
+REPEATS = 5
+
+
+def best_time(func):
+    best, result = float('inf'), None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    warnings.simplefilter('ignore', UserWarning)  # dayfirst=True on ISO dates warns on every call
+    customers = pd.read_csv(os.path.join(REPO_DIR, 'raw data', 'customers.csv'), dtype=read_dtypes('customers'))
+
+    print(f"{'column':<12} {'rows':>8} | {'old s':>7} {'new s':>7} {'speedup':>7} | {'differ':>7} {'bad':>5}")
+    for col, date_format in DATE_FORMATS['customers'].items():
+        s = customers[col]
+        old_s, old = best_time(lambda: pd.to_datetime(s, errors='coerce', dayfirst=True).dt.date)
+        new_s, (new, bad) = best_time(lambda: parse_dates(s, date_format))
+        differ = int((pd.to_datetime(old) != new).sum())
+        print(f"{col:<12} {len(s):>8} | {old_s:>7.3f} {new_s:>7.3f} {old_s / new_s:>6.1f}x | {differ:>7} {int(bad.sum()):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import warnings
+
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# ⏱️ Benchmark: whole ETL on synthetic data (extract → clean → ... → materialize)
+# ──────────────────────────────────────────────────────────────────────────────
+Generates (once) the synthetic CSVs for a scale (generate_data.py) and runs
+them through etl_pipeline itself: etl_table() per table in foreign-key order
+(extract, clean, staging, FK check, load, swap, indexes, rejects,
+order_stats), then the materialized tables, i.e. what `etl_pipeline.py
+--workers 1 --force` does. Every stage is timed by the pipeline's own
+metrics.MetricsRecorder. The target defaults to a throwaway SQLite file and
+the Parquet staging goes to a throwaway folder; pass --engine to use e.g. a
+scratch PostgreSQL database.
+
+    python benchmarks/bench_etl.py --scale 1                  # compare with baseline
+    python benchmarks/bench_etl.py --scale 1 --save-baseline  # store as new baseline
+    python benchmarks/bench_etl.py --scale 100 --chunk-size 1000000
+
+Baselines live in benchmarks/results/baseline_<scale>x_<dialect>.json. When
+one exists, every stage's wall time is compared with it and stages that got
+more than REGRESSION_PCT slower are flagged.
+Peak MiB is each stage's own peak (metrics.StagePeaks), so generating the
+data beforehand does not show up in it.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'etl scripts'))
+
+import etl_pipeline  # noqa: E402
+from generate_data import ensure_data  # noqa: E402
+from metrics import MetricsRecorder  # noqa: E402
+from scheduler import tables_in_load_order  # noqa: E402
+from staging import staging_available  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+# A stage this much slower than its baseline is reported as a regression
+# (stages shorter than MIN_COMPARE_SECONDS are too noisy to flag)
+REGRESSION_PCT = 10
+MIN_COMPARE_SECONDS = 0.1
+
+
+def configure_pipeline(engine_url, staging_dir, metrics):
+    """Point etl_pipeline's settings at the scratch database / staging folder for a full replace load."""
+    etl_pipeline.DATABASE_URL = engine_url
+    etl_pipeline._engine = None
+    etl_pipeline.STAGING_DIR = staging_dir
+    etl_pipeline.STAGE_TABLES = staging_available()
+    etl_pipeline.METRICS = metrics
+    etl_pipeline.LOAD_MODE = 'replace'
+    etl_pipeline.LOAD_FROM_STAGING = False
+    etl_pipeline.DRY_RUN = False
+
+
+def run_benchmark(scale, engine_url=None, chunk_size=None):
+    table_files = ensure_data(scale)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        metrics = MetricsRecorder()
+        configure_pipeline(engine_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+                           os.path.join(tmp_dir, 'staging'), metrics)
+        start = time.perf_counter()
+        etl_pipeline.start_run()
+        tables = tables_in_load_order(list(table_files))
+        for table_name in tables:
+            etl_pipeline.etl_table(table_name, table_files[table_name], chunk_size)
+        etl_pipeline.refresh_materialized(tables)
+        etl_pipeline.REJECTS.close()
+        total_seconds = time.perf_counter() - start
+        engine = etl_pipeline.get_engine()
+        dialect = engine.dialect.name
+        engine.dispose()
+
+    return {
+        'run_id': metrics.run_id,
+        'scale': scale,
+        'dialect': dialect,
+        'chunk_size': chunk_size,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'total_wall_s': total_seconds,
+        'stages': metrics.records(),
+    }, metrics
+
+
+def baseline_path(scale, dialect, results_dir=RESULTS_DIR):
+    return os.path.join(results_dir, f'baseline_{scale}x_{dialect}.json')
+
+
+def compare(result, baseline):
+    """Print wall time per table + stage against the baseline; returns the regressed stages."""
+    old = {(r['table'], r['stage']): r for r in baseline['stages']}
+    regressions = []
+    print(f"\nAgainst baseline {baseline['run_id']} (python {baseline['python']}, pandas {baseline['pandas']})")
+    print(f"{'table':<12} {'stage':<12} {'base s':>8} {'now s':>8} {'change':>8}")
+    for record in result['stages']:
+        key = (record['table'], record['stage'])
+        if key not in old:
+            continue
+        base_s, now_s = old[key]['wall_s'], record['wall_s']
+        change = (now_s - base_s) / base_s * 100 if base_s > 0 else 0.0
+        flag = '  ← slower' if change > REGRESSION_PCT and base_s >= MIN_COMPARE_SECONDS else ''
+        if flag:
+            regressions.append(key)
+        print(f"{key[0]:<12} {key[1]:<12} {base_s:>8.2f} {now_s:>8.2f} {change:>+7.0f}%{flag}")
+    print(f"{'total':<25} {baseline['total_wall_s']:>8.2f} {result['total_wall_s']:>8.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the ETL stages on synthetic data')
+    parser.add_argument('--scale', type=int, default=1, help='1, 10, 100, ... times the sample size')
+    parser.add_argument('--engine', help='SQLAlchemy URL of a scratch database (default: temporary SQLite file)')
+    parser.add_argument('--chunk-size', type=int, help='stream the files in chunks of this many rows')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', UserWarning)
+    result, metrics = run_benchmark(args.scale, args.engine, args.chunk_size)
+    print(metrics.summary())
+    print(f"Total: {result['total_wall_s']:.2f}s at scale {args.scale}x on {result['dialect']}")
+
+    path = baseline_path(args.scale, result['dialect'])
+    if args.save_baseline:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved baseline to {path}")
+    elif os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f))
+        if regressions:
+            print(f"{len(regressions)} stage(s) more than {REGRESSION_PCT}% slower than the baseline")
+    else:
+        print(f"No baseline at {path} yet (run with --save-baseline)")
+
+
+if __name__ == '__main__':
+    main()
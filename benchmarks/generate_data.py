@@ -0,0 +1,242 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🏭 Synthetic data generator (customers / orders / products / order_items / reviews)
+# ──────────────────────────────────────────────────────────────────────────────
+Writes CSVs with the same columns, formats and value mix as raw data/, at any
+multiple of the sample size (1x ≈ 100k customers, 99k orders, 300k items):
+
+    python benchmarks/generate_data.py --scale 10        → benchmarks/data/10x/*.csv
+
+The dirty patterns clean_dataframe and the table rules deal with are kept:
+  - blanks ('', ' ') and the 'nan' / 'null' / 'NULL' / 'None' / 'N/A' strings
+    in text and category columns, blank names and review texts
+  - 'invalid_email', 'Unknown' gender, -100 order amounts, -1 unit prices
+  - mixed date formats: most values use the declared format, a few use a
+    slash format the fallback parser has to read, a few are garbage
+  - missing order_status (≈1/6) and COD orders without a status
+  - order_items pointing at order_ids that do not exist in orders
+
+Same seed + scale → byte-identical files. Rows are generated and written in
+blocks of BLOCK_ROWS, so 100x runs in bounded memory.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, 'benchmarks', 'data')
+
+# Rows per table at scale 1 (same order of magnitude as raw data/)
+BASE_ROWS = {
+    'customers': 100_000,
+    'products': 21_500,
+    'orders': 99_000,
+    'order_items': 300_000,
+    'reviews': 40_000,
+}
+
+BLOCK_ROWS = 1_000_000
+SEED = 42
+
+NA_TOKENS = np.array(['', ' ', 'nan', 'NaN', 'null', 'NULL', 'None', 'N/A'])
+
+FIRST_NAMES = np.array(['Michael', 'Ashley', 'Gary', 'Jennifer', 'David', 'Maria', 'James', 'Linda',
+                        'Robert', 'Susan', 'John', 'Karen', 'Daniel', 'Lisa', 'Brian', 'Nancy'])
+LAST_NAMES = np.array(['Smith', 'Brown', 'Mendez', 'Harrison', 'Johnson', 'Garcia', 'Miller', 'Davis',
+                       'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Martin', 'Lee'])
+EMAIL_DOMAINS = np.array(['gmail.com', 'yahoo.com', 'hotmail.com', 'example.org', 'carney.net'])
+CITIES = np.array(['Phoenix', 'Houston', 'Los Angeles', 'New York', 'Chicago'])
+STATES = np.array(['TX', 'NY', 'CA', 'IL', 'AZ'])
+COUNTRIES = np.array(['Germany', 'USA', 'Australia', 'UK', 'Canada'])
+GENDERS = np.array(['Female', 'Male', 'Other', 'Unknown'])
+PAYMENT_METHODS = np.array(['Net Banking', 'Debit Card', 'Cash', 'Credit Card', 'PayPal', 'COD'])
+ORDER_STATUSES = np.array(['Pending', 'Shipped', 'Returned', 'Completed', 'Cancelled'])
+CATEGORIES = np.array(['Accessories', 'Home Appliances', 'Books', 'Furniture', 'Electronics',
+                       'Grocery', 'Computers', 'Clothing', 'Beauty', 'Sports'])
+PRODUCT_NAMES = np.array(['MacBook Air M3', 'Nilkamal Wardrobe', 'Dove Shampoo', 'Levi’s 511 Jeans',
+                          'Prestige Cooker', 'Atomic Habits', 'Boat Earbuds', 'Yonex Racket'])
+WORDS = np.array(['moment', 'movie', 'politics', 'none', 'medical', 'recent', 'people', 'benefit',
+                  'bag', 'computer', 'remain', 'popular', 'prevent', 'focus', 'study', 'great'])
+RATING_WEIGHTS = [0.05, 0.10, 0.15, 0.35, 0.35]
+
+
+def _choice(rng, values, n, blank_rate=0.0):
+    """Random picks from values; blank_rate of them become '' (like the sample's empty cells)."""
+    out = values[rng.integers(0, len(values), n)].astype(object)
+    if blank_rate:
+        out[rng.random(n) < blank_rate] = ''
+    return out
+
+
+def _dirty(rng, values, rate):
+    """Replace about rate of the values with a random missing-value token."""
+    mask = rng.random(len(values)) < rate
+    values[mask] = NA_TOKENS[rng.integers(0, len(NA_TOKENS), int(mask.sum()))]
+    return values
+
+
+def _dates(rng, n, start, end, date_format, alt_format, alt_rate=0.01, garbage_rate=0.001):
+    """
+    Dates between start and end in date_format; about alt_rate use alt_format
+    and garbage_rate are not dates at all. Only the distinct days are
+    formatted (a few thousand), every row is then a lookup.
+    """
+    days = pd.date_range(start, end, freq='D')
+    labels = days.strftime(date_format).to_numpy(dtype=object)
+    alt_labels = days.strftime(alt_format).to_numpy(dtype=object)
+
+    picks = rng.integers(0, len(days), n)
+    out = labels[picks]
+    alt = rng.random(n) < alt_rate
+    out[alt] = alt_labels[picks[alt]]
+    garbage = rng.random(n) < garbage_rate
+    out[garbage] = np.array(['not a date', '31-31-2031', '2023/13/45', 'TBD'])[rng.integers(0, 4, int(garbage.sum()))]
+    return out
+
+
+def _money(rng, n, low, high):
+    return np.round(rng.uniform(low, high, n), 2)
+
+
+def _ids(start, n, prefix=''):
+    ids = np.arange(start, start + n).astype(str).astype(object)
+    return prefix + ids if prefix else ids
+
+
+def customers_block(rng, start, n, scale):
+    first = _choice(rng, FIRST_NAMES, n)
+    last = _choice(rng, LAST_NAMES, n)
+    name = first + ' ' + last
+    name[rng.random(n) < 0.01] = ''
+    email = (first + last + (rng.integers(1, 100, n).astype(str)) + '@' + _choice(rng, EMAIL_DOMAINS, n))
+    email[rng.random(n) < 0.03] = 'invalid_email'
+    return pd.DataFrame({
+        'customer_id': _ids(start, n),
+        'name': name,
+        'email': email,
+        'signup_date': _dates(rng, n, '2015-01-01', '2024-12-31', '%Y-%m-%d', '%m/%d/%Y'),
+        'city': _dirty(rng, _choice(rng, CITIES, n, blank_rate=1 / 6), 0.005),
+        'state': _dirty(rng, _choice(rng, STATES, n, blank_rate=1 / 6), 0.005),
+        'country': _dirty(rng, _choice(rng, COUNTRIES, n, blank_rate=1 / 6), 0.005),
+        'dob': _dates(rng, n, '1950-01-01', '2007-12-31', '%Y-%m-%d', '%m/%d/%Y'),
+        'gender': _dirty(rng, _choice(rng, GENDERS, n, blank_rate=0.25), 0.005),
+    })
+
+
+def products_block(rng, start, n, scale):
+    return pd.DataFrame({
+        'product_id': _ids(start, n),
+        'product_name': _choice(rng, PRODUCT_NAMES, n) + ' ' + rng.integers(1, 1000, n).astype(str),
+        'category': _choice(rng, CATEGORIES, n),
+        'price': _money(rng, n, 5, 1000),
+        'cost': rng.integers(5, 500, n),
+    })
+
+
+def orders_block(rng, start, n, scale):
+    amount = _money(rng, n, 10, 5000).astype(object)
+    amount[rng.random(n) < 0.01] = -100
+    return pd.DataFrame({
+        'order_id': _ids(start, n),
+        'order_date': _dates(rng, n, '2021-01-01', '2025-12-31', '%d-%m-%Y', '%d/%m/%Y'),
+        'customer_id': (rng.integers(1, BASE_ROWS['customers'] * scale + 1, n)).astype(str),
+        'order_amount': amount,
+        'payment_method': _dirty(rng, _choice(rng, PAYMENT_METHODS, n, blank_rate=1 / 6), 0.005),
+        'order_status': _dirty(rng, _choice(rng, ORDER_STATUSES, n, blank_rate=1 / 6), 0.005),
+    })
+
+
+def order_items_block(rng, start, n, scale):
+    # ~1% of items point past the last order id (orphans, like the sample)
+    n_orders = BASE_ROWS['orders'] * scale
+    price = _money(rng, n, 5, 1000).astype(object)
+    price[rng.random(n) < 0.01] = -1
+    return pd.DataFrame({
+        'order_item_id': _ids(start, n, 'oiid'),
+        'order_id': rng.integers(1, int(n_orders * 1.01) + 1, n).astype(str),
+        'product_id': rng.integers(1, BASE_ROWS['products'] * scale + 1, n).astype(str),
+        'quantity': rng.integers(1, 6, n),
+        'unit_price': price,
+    })
+
+
+def reviews_block(rng, start, n, scale):
+    text = (_choice(rng, WORDS, n) + ' ' + _choice(rng, WORDS, n) + ' ' + _choice(rng, WORDS, n) + '.')
+    text[rng.random(n) < 0.05] = ''
+    rating = rng.choice(np.arange(1, 6), n, p=RATING_WEIGHTS).astype(object)
+    rating[rng.random(n) < 0.002] = ''
+    return pd.DataFrame({
+        'review_id': _ids(start, n, 'r'),
+        'order_id': rng.integers(1, BASE_ROWS['orders'] * scale + 1, n).astype(str),
+        'customer_id': rng.integers(1, BASE_ROWS['customers'] * scale + 1, n).astype(str),
+        'rating': rating,
+        'review_text': text,
+        'review_date': _dates(rng, n, '2021-01-01', '2025-12-31', '%Y-%m-%d', '%m/%d/%Y'),
+    })
+
+
+BLOCK_GENERATORS = {
+    'customers': customers_block,
+    'products': products_block,
+    'orders': orders_block,
+    'order_items': order_items_block,
+    'reviews': reviews_block,
+}
+
+
+def data_dir(scale, base_dir=DATA_DIR):
+    return os.path.join(base_dir, f'{scale}x')
+
+
+def generate(scale, out_dir=None, seed=SEED, tables=None):
+    """
+    Write the synthetic CSVs for one scale; returns {table_name: csv path}
+    (ready to use as table_files). Each table gets its own random stream, so
+    regenerating one table does not change the others.
+    """
+    out_dir = out_dir or data_dir(scale)
+    os.makedirs(out_dir, exist_ok=True)
+    table_files = {}
+
+    for table_index, (table_name, make_block) in enumerate(BLOCK_GENERATORS.items()):
+        if tables is not None and table_name not in tables:
+            continue
+        rng = np.random.default_rng([seed, scale, table_index])
+        total = BASE_ROWS[table_name] * scale
+        path = os.path.join(out_dir, f'{table_name}.csv')
+
+        for start in range(0, total, BLOCK_ROWS):
+            block = make_block(rng, start + 1, min(BLOCK_ROWS, total - start), scale)
+            block.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+        print(f"Wrote {total:,} rows to {path}")
+        table_files[table_name] = path
+
+    return table_files
+
+
+def ensure_data(scale, base_dir=DATA_DIR, seed=SEED):
+    """table_files for a scale, generating only the CSVs that are missing."""
+    out_dir = data_dir(scale, base_dir)
+    table_files = {t: os.path.join(out_dir, f'{t}.csv') for t in BLOCK_GENERATORS}
+    missing = [t for t, path in table_files.items() if not os.path.exists(path)]
+    if missing:
+        generate(scale, out_dir, seed, tables=missing)
+    return table_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic retail CSVs')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1], help='multiples of the sample size, e.g. 1 10 100')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--out', default=DATA_DIR, help='base folder (one <scale>x subfolder per scale)')
+    args = parser.parse_args()
+    for scale in args.scale:
+        generate(scale, data_dir(scale, args.out), args.seed)
+
+
+if __name__ == '__main__':
+    main()
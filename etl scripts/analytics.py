@@ -0,0 +1,297 @@
+from typing import Callable, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from cohorts import active_cells, build_matrix, cohort_sizes
+from pgmath import numeric_cast, quantize, round_numeric, round_ratio
+from rfm import aggregate_orders, score_rfm
+from staging import STAGING_DIR, read_staged
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📈 In-process analytics (the sqlqueries.sql KPIs without a database)
+# ──────────────────────────────────────────────────────────────────────────────
+Every KPI in sql/sqlqueries.sql, computed with pandas from the cleaned frames
+(straight from the ETL, or read back from the Parquet staging area):
+
+    customer_lifetime_value   CLV distribution
+    repeat_purchase_rate      % of customers with more than 3 orders
+    time_between_purchases    average days between consecutive orders
+    churned_customers         no order in the last 3 months
+    revenue_trend             revenue per month
+    aov_by_category           average order value per product category
+    order_statistics          vw_statics
+    cod_probability           share of COD orders
+    customer_rfm              vw_customer_rfm
+    top_customers             vw_top_customers (Pareto ranking)
+    product_performance       vw_productcust
+    cohort_retention          vw_cohort_retention
+
+Each function returns a DataFrame with the query's columns, rows in its
+ORDER BY, and the same values as PostgreSQL on the tables the ETL loads:
+
+- joins are inner joins where NULL keys never match, GROUP BY keeps a NULL
+  group, ORDER BY puts NULLs last ascending and first descending (ties are
+  broken by the key, SQL leaves them in no particular order)
+- ROUND(x::numeric, 2) of a double casts it with 15 significant digits
+  first and rounds half away from zero; integer averages and percentages
+  are rounded with exact integer arithmetic (pgmath.py)
+- SUM / AVG of doubles add the values left to right in row order, like
+  PostgreSQL's float8 aggregates on a table scan (pandas compensates the
+  rounding errors, so unrounded sums could differ in the last digit); they
+  skip NULLs and give NULL when there is nothing to add
+- customer_rfm and cohort_retention share their code with the materialized
+  tables (rfm.py, cohorts.py) that the views read
+
+Queries that use CURRENT_DATE take `today` (default: today's date).
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+
+# =====================
+# SQL building blocks
+# =====================
+def _join(left, right, on):
+    """Inner join where NULL keys match nothing (pandas would match NaN with NaN)."""
+    return left.dropna(subset=[on]).merge(right.dropna(subset=[on]), on=on, how='inner')
+
+
+def _group(df, keys):
+    """GROUP BY: NULL is a group of its own, categoricals only give the values present."""
+    return df.groupby(keys, dropna=False, observed=True, sort=False)
+
+
+def _sum_and_count(grouped, column):
+    """Per group: float8 SUM (sequential, in row order) and number of non-NULL values."""
+    codes = grouped.ngroup().to_numpy()
+    values = grouped.obj[column].astype('float64').to_numpy()
+    present = ~np.isnan(values)
+    total = np.zeros(grouped.ngroups)
+    np.add.at(total, codes[present], values[present])
+    count = np.bincount(codes[present], minlength=grouped.ngroups)
+    index = grouped.size().index
+    return pd.Series(np.where(count > 0, total, np.nan), index=index), pd.Series(count, index=index)
+
+
+def _sum(grouped, column):
+    """SUM(column) of doubles per group (NULL when a group has no values)."""
+    return _sum_and_count(grouped, column)[0]
+
+
+def _avg(grouped, column):
+    """AVG(column) of doubles per group: SUM / COUNT."""
+    total, count = _sum_and_count(grouped, column)
+    return total / count.where(count > 0)
+
+
+def _order_by(df, column, descending=False, tiebreak=None):
+    """ORDER BY column [DESC] with PostgreSQL's NULL placement; ties sorted by tiebreak."""
+    columns = [column] + ([tiebreak] if tiebreak else [])
+    ascending = [not descending] + ([True] if tiebreak else [])
+    return df.sort_values(columns, ascending=ascending, na_position='first' if descending else 'last',
+                          ignore_index=True, kind='stable')
+
+
+def _line_amount(order_items):
+    """unit_price * quantity as doubles (NULL when either is NULL)."""
+    return order_items['unit_price'].astype('float64') * order_items['quantity'].astype('float64')
+
+
+def _items_with_orders(orders, order_items, order_columns):
+    items = order_items[['order_id', 'product_id']].assign(amount=_line_amount(order_items),
+                                                           quantity=order_items['quantity'])
+    return _join(orders[['order_id'] + order_columns], items, 'order_id')
+
+
+def _today(today=None):
+    return pd.Timestamp(today if today is not None else pd.Timestamp.today()).normalize()
+
+
+# =====================
+# KPIs
+# =====================
+def customer_lifetime_value(customers, orders, order_items):
+    """Total revenue per customer (customers ⋈ orders ⋈ order_items), highest first."""
+    rows = _join(customers[['customer_id']], _items_with_orders(orders, order_items, ['customer_id']), 'customer_id')
+    clv = _sum(_group(rows, 'customer_id'), 'amount').rename('lifetime_value').reset_index()
+    clv['lifetime_value'] = round_numeric(clv['lifetime_value'])
+    return _order_by(clv, 'lifetime_value', descending=True, tiebreak='customer_id')
+
+
+def repeat_purchase_rate(orders):
+    """% of customers (NULL customer_id counts as one) with more than 3 distinct orders."""
+    total_orders = _group(orders, 'customer_id')['order_id'].nunique()
+    pct = round_ratio(100 * int((total_orders > 3).sum()), len(total_orders))
+    return pd.DataFrame({'pct_repeat_buyers': [float(pct)]})
+
+
+def time_between_purchases(orders):
+    """
+    Average days between consecutive orders per customer. LAG over the
+    orders sorted by date telescopes to (last - first) / (dated orders - 1);
+    a customer with one dated order and more rows still appears, with NULL.
+    """
+    dates = _group(orders, 'customer_id')['order_date'].agg(['size', 'count', 'min', 'max'])
+    dates = dates[(dates['size'] >= 2) & (dates['count'] >= 1)]
+    gaps = (dates['max'] - dates['min']).dt.days.fillna(0).astype('int64')
+    result = pd.DataFrame({
+        'customer_id': dates.index,
+        'avg_days_between_orders': round_ratio(gaps.to_numpy(), (dates['count'] - 1).to_numpy()),
+    })
+    return _order_by(result, 'avg_days_between_orders', tiebreak='customer_id')
+
+
+def churned_customers(orders, today=None, months=3):
+    """Customers whose last order is before CURRENT_DATE - INTERVAL '3 months'."""
+    last_order = _group(orders, 'customer_id')['order_date'].max()
+    cutoff = _today(today) - pd.DateOffset(months=months)
+    return pd.DataFrame({'churned_customers': [int((last_order < cutoff).sum())]})
+
+
+def revenue_trend(orders, order_items):
+    """Revenue per order month (DATE_TRUNC('month', order_date)), oldest first."""
+    rows = _items_with_orders(orders, order_items, ['order_date'])
+    rows['month'] = rows['order_date'].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]').astype('datetime64[ns]')
+    trend = _sum(_group(rows, 'month'), 'amount').rename('total_revenue').reset_index()
+    trend['total_revenue'] = round_numeric(trend['total_revenue'])
+    return _order_by(trend, 'month')
+
+
+def aov_by_category(orders, order_items, products):
+    """Revenue / distinct orders per product category, highest first."""
+    rows = _join(_items_with_orders(orders, order_items, []), products[['product_id', 'category']], 'product_id')
+    grouped = _group(rows, 'category')
+    revenue = _sum(grouped, 'amount')
+    order_count = grouped['order_id'].nunique()
+    # SUM(...)::numeric / COUNT(DISTINCT ...) is a numeric division, rounded once
+    aov = [np.nan if pd.isna(r) else quantize(numeric_cast(r) / n, 2) for r, n in zip(revenue, order_count)]
+    result = pd.DataFrame({'category': revenue.index, 'avg_order_value': aov})
+    return _order_by(result, 'avg_order_value', descending=True, tiebreak='category')
+
+
+def _percentile_cont(values, fraction=0.5):
+    """PERCENTILE_CONT(fraction): linear interpolation between the two nearest sorted values."""
+    values = np.sort(values)
+    if len(values) == 0:
+        return np.nan
+    position = fraction * (len(values) - 1)
+    low, high = int(np.floor(position)), int(np.ceil(position))
+    return float(values[low] + (values[high] - values[low]) * (position - low))
+
+
+def order_statistics(orders):
+    """
+    vw_statics in one row. mode_order is the most frequent order_amount (a
+    NULL amount can win, like the GROUP BY subquery); on a tie the smallest.
+    """
+    amounts = orders['order_amount'].astype('float64')
+    present = amounts.dropna().to_numpy()
+    n = len(present)
+    total = float(np.add.accumulate(present)[-1]) if n else np.nan  # left to right, like SUM
+    avg = total / n if n else np.nan
+    std = float(np.std(present, ddof=1)) if n > 1 else np.nan
+
+    counts = amounts.value_counts(dropna=False)
+    top = counts[counts == counts.max()].index if len(counts) else []
+    mode = np.nan if len(top) == 0 or pd.isna(top).any() else float(min(top))
+
+    row = {
+        'max_order': round_numeric(np.array([present.max() if n else np.nan]))[0],
+        'min_order': round_numeric(np.array([present.min() if n else np.nan]))[0],
+        'avg_order': round_numeric(np.array([avg]))[0],
+        'median_order': _percentile_cont(present),
+        'std_order': round_numeric(np.array([std]))[0],
+        'total_order_value': round_numeric(np.array([total]))[0],
+        'total_orders': int(orders['order_id'].count()),
+        'unique_customers': int(orders['customer_id'].nunique()),
+        'cv_percent': round_numeric(np.array([std / avg * 100 if n > 1 and avg != 0 else np.nan]))[0],
+        'mode_order': mode,
+    }
+    return pd.DataFrame([row])
+
+
+def cod_probability(orders):
+    """Fraction of orders paid COD (a double, not rounded)."""
+    cod = int(orders['payment_method'].eq('COD').fillna(False).sum())
+    return pd.DataFrame({'prob_cod': [cod / len(orders) if len(orders) else np.nan]})
+
+
+def customer_rfm(customers, orders, today=None):
+    """vw_customer_rfm: customer_rfm (rfm.py) joined with the customer names, recency in days."""
+    rows = _join(orders[['customer_id', 'order_date', 'order_amount']], customers[['customer_id']], 'customer_id')
+    scored = score_rfm(aggregate_orders(rows))
+    result = _join(scored, customers[['customer_id', 'name']], 'customer_id')
+    result['recency'] = (_today(today) - result['last_order_date']).dt.days.astype('Int64')
+    columns = ['customer_id', 'name', 'recency', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score']
+    return result[columns].sort_values('customer_id', ignore_index=True)
+
+
+def top_customers(orders):
+    """vw_top_customers: total spend per customer and its RANK() (NULL spend ranks first, like DESC)."""
+    spend = _sum(_group(orders, 'customer_id'), 'order_amount').rename('total_spend').reset_index()
+    spend['rank'] = spend['total_spend'].rank(method='min', ascending=False, na_option='top').astype('int64')
+    return spend.sort_values(['rank', 'customer_id'], ignore_index=True)
+
+
+def product_performance(orders, order_items, products, limit=10):
+    """vw_productcust: unique buyers, quantity and revenue per product, top `limit` by revenue."""
+    rows = _join(_items_with_orders(orders, order_items, ['customer_id']),
+                 products[['product_id', 'product_name', 'category']], 'product_id')
+    grouped = _group(rows, ['product_id', 'product_name', 'category'])
+    result = pd.DataFrame({
+        'unique_customers': grouped['customer_id'].nunique(),
+        'total_quantity': grouped['quantity'].sum(min_count=1).astype('Int64'),
+        'total_revenue': round_numeric(_sum(grouped, 'amount')),
+        'avg_revenue': round_numeric(_avg(grouped, 'amount')),
+    }).reset_index()
+    return _order_by(result, 'total_revenue', descending=True, tiebreak='product_id').head(limit)
+
+
+def cohort_retention(customers, orders):
+    """vw_cohort_retention: the cohort × month_number matrix (cohorts.py)."""
+    rows = _join(orders[['customer_id', 'order_date']], customers[['customer_id', 'signup_date']], 'customer_id')
+    return build_matrix(active_cells(rows), cohort_sizes(customers))
+
+
+# =====================
+# All KPIs at once
+# =====================
+class Kpi(NamedTuple):
+    function: Callable[..., pd.DataFrame]
+    tables: List[str]              # cleaned tables it reads, in argument order
+    uses_today: bool = False       # takes today= (CURRENT_DATE)
+
+
+KPIS = {
+    'customer_lifetime_value': Kpi(customer_lifetime_value, ['customers', 'orders', 'order_items']),
+    'repeat_purchase_rate': Kpi(repeat_purchase_rate, ['orders']),
+    'time_between_purchases': Kpi(time_between_purchases, ['orders']),
+    'churned_customers': Kpi(churned_customers, ['orders'], uses_today=True),
+    'revenue_trend': Kpi(revenue_trend, ['orders', 'order_items']),
+    'aov_by_category': Kpi(aov_by_category, ['orders', 'order_items', 'products']),
+    'order_statistics': Kpi(order_statistics, ['orders']),
+    'cod_probability': Kpi(cod_probability, ['orders']),
+    'customer_rfm': Kpi(customer_rfm, ['customers', 'orders'], uses_today=True),
+    'top_customers': Kpi(top_customers, ['orders']),
+    'product_performance': Kpi(product_performance, ['orders', 'order_items', 'products']),
+    'cohort_retention': Kpi(cohort_retention, ['customers', 'orders']),
+}
+
+
+def compute_kpis(tables=None, kpis=None, today=None, staging_dir=STAGING_DIR):
+    """
+    Run the KPIs (all by default) and return {kpi name: DataFrame}. tables is
+    {table name: cleaned DataFrame}; tables it does not have are read from
+    the Parquet staging area (once each).
+    """
+    tables = dict(tables or {})
+    results = {}
+    for name in kpis or KPIS:
+        kpi = KPIS[name]
+        for table_name in kpi.tables:
+            if table_name not in tables:
+                tables[table_name] = read_staged(table_name, staging_dir=staging_dir)
+        args = [tables[table_name] for table_name in kpi.tables]
+        results[name] = kpi.function(*args, today=today) if kpi.uses_today else kpi.function(*args)
+    return results
@@ -0,0 +1,253 @@
+import logging
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
+
+from dates import parse_dates
+from metrics import MetricsRecorder
+from rules import TABLE_RULES, Rule, apply_rules, register
+from schemas import DATE_FORMATS, NA_STRINGS, STRING_DTYPE, column_kind
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🧹 Cleaning
+# ──────────────────────────────────────────────────────────────────────────────
+Generic cleaning (clean_dataframe) plus the table-specific rules, declared
+here and run by the rule engine in rules.py.
+
+The old clean_dataframe walked every column, did astype(str) + strip + replace,
+then did astype(str) + strip again on date and ID columns, and the ETL loop
+called it twice per table. Now the schema in schemas.py decides the operation
+for each column once (the "cleaning plan") and each column is touched once.
+
+Strings are kept as pandas string columns (Arrow-backed when pyarrow is
+installed), so strip / isin run as Arrow string kernels instead of a Python
+loop over objects, and missing values are always <NA>. Categorical columns
+are cleaned on their categories only (a handful of values), not row by row.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+
+# =====================
+# Generic Cleaning Function
+# =====================
+
+"""
+    Generic cleaning:
+    -----------------
+    1. Strip strings
+    2. Replace empty/blank/nan/null strings with NA
+    3. Convert date columns
+    4. Fill numeric nulls with 0
+    5. Normalize ID columns (always strings)
+
+    pd.read_csv(), it’s always interpreted as a string/object.Excel’s formatting doesn’t carry over in CSV.
+    CSV has no type information — every cell is just text/numbers.
+    pd.read_csv() guesses types. If a column has mixed formats or some blanks, it often defaults to object.
+    Excel formatting (Short Date, Long Date) only affects display in Excel, not the raw CSV data.
+
+    Notes on ID columns:
+    - Forces all IDs to strings (pandas string dtype)
+    - Strips spaces, handles any numeric-looking IDs (e.g., 1 → '1')
+    - Cleans inconsistencies in raw CSV before loading
+    - Even if dtype_mapping says String for PostgreSQL, pandas might infer int64 → SQLAlchemy maps it to BIGINT
+    - Leading/trailing spaces or blank cells can cause foreign key mismatches or errors
+
+    Notes on date columns:
+    - CSVs often store dates as strings, even if Excel shows them as Short/Long Date
+    - Every date column declares its format in schemas.DATE_FORMATS (DD-MM-YYYY vs YYYY-MM-DD)
+    - dates.parse_dates() does one fixed-format parse, retries odd values with a cached fallback
+      parser, and counts whatever is still unreadable instead of silently making it NaT
+
+
+    Dates stay datetime64 at midnight (fast, no Python date objects); dtype_mapping maps the
+    columns to DATE in PostgreSQL, so there is no time component, only YYYY-MM-DD
+    """
+
+
+def _clean_text(s):
+    # Strip spaces and replace blank / "nan" / "null" strings with pd.NA
+    s = s.astype(STRING_DTYPE).str.strip()
+    return s.mask(s.isin(NA_STRINGS))
+
+
+def _clean_id(s):
+    # Numeric-looking IDs → strings without a trailing '.0' (1 → '1')
+    if pd.api.types.is_float_dtype(s):
+        s = s.astype('Int64')
+    return _clean_text(s)
+
+
+def _clean_category(s):
+    # Strip / blank-check the categories (not every row), then remap the codes
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype('category')
+    stripped = s.cat.categories.astype(str).str.strip()
+    keep = ~stripped.isin(NA_STRINGS)
+    new_categories = pd.Index(stripped[keep].unique())
+    old_to_new = np.where(keep, new_categories.get_indexer(stripped), -1)
+    codes = s.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, old_to_new[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, new_categories), index=s.index, name=s.name)
+
+
+def _coerced(s, failures):
+    """
+    Tag a cleaned column with the rows whose values had to be coerced, as
+    [(rule, row positions)]; clean_dataframe() collects them for the reject sink.
+    """
+    failures = [(rule, np.flatnonzero(np.asarray(bad, dtype=bool))) for rule, bad in failures]
+    failures = [(rule, positions) for rule, positions in failures if len(positions)]
+    if failures:
+        s.attrs['coerced'] = failures
+    return s
+
+
+def _to_number(s):
+    """Text → numbers; returns (numbers, mask of present values that were not numbers)."""
+    text = _clean_text(s)
+    numbers = pd.to_numeric(text, errors='coerce')
+    return numbers, (text.notna() & numbers.isna()).to_numpy(dtype=bool)
+
+
+def _clean_date(s, date_format=None):
+    # Declared format first, cached fallback parser for the odd values
+    dates, bad = parse_dates(_clean_text(s), date_format)
+    return _coerced(dates, [('unparseable_date', bad)])
+
+
+def _clean_number(s):
+    # Fill numeric nulls with 0 (dirty text values become NaN first)
+    not_a_number = None
+    if not pd.api.types.is_numeric_dtype(s):
+        s, not_a_number = _to_number(s)
+    s = s.fillna(0) if s.hasnans else s
+    return _coerced(s, [('not_a_number', not_a_number)] if not_a_number is not None else [])
+
+
+def _clean_int(s):
+    # Whole numbers only (Int64); anything else counts as missing → 0
+    failures = []
+    if not pd.api.types.is_integer_dtype(s):
+        if not pd.api.types.is_numeric_dtype(s):
+            s, not_a_number = _to_number(s)
+            failures.append(('not_a_number', not_a_number))
+        whole = s == s.round()
+        failures.append(('not_an_integer', (s.notna() & ~whole).to_numpy(dtype=bool)))
+        s = s.where(whole).astype('Int64')
+    s = s.fillna(0) if s.hasnans else s
+    return _coerced(s, failures)
+
+
+def _clean_rating(s):
+    # Numeric, but missing ratings stay NA so they are ignored in averages
+    if not pd.api.types.is_numeric_dtype(s):
+        s, not_a_number = _to_number(s)
+        return _coerced(s, [('not_a_number', not_a_number)])
+    return s
+
+
+COLUMN_CLEANERS = {
+    'id': _clean_id,
+    'text': _clean_text,
+    'category': _clean_category,
+    'date': _clean_date,
+    'number': _clean_number,
+    'int': _clean_int,
+    'rating': _clean_rating,
+}
+
+
+@lru_cache(maxsize=None)
+def cleaning_plan(table_name, columns_and_dtypes):
+    """
+    Work out the cleaning step for each column once.
+    columns_and_dtypes is a tuple of (column, dtype) pairs so the plan can be
+    cached and reused for every chunk / run with the same layout.
+    Returns a tuple of (column, cleaner) pairs; untouched columns are left out.
+    """
+    date_formats = DATE_FORMATS.get(table_name, {})
+    plan = []
+    for col, dtype in columns_and_dtypes:
+        kind = column_kind(table_name, col, dtype)
+        if kind == 'date':
+            plan.append((col, partial(_clean_date, date_format=date_formats.get(col))))
+        elif kind is not None:
+            plan.append((col, COLUMN_CLEANERS[kind]))
+    return tuple(plan)
+
+
+def clean_dataframe(df, table_name=None):
+    plan = cleaning_plan(table_name, tuple(zip(df.columns, df.dtypes)))
+    coerced = {}
+    for col, cleaner in plan:
+        raw = df[col]
+        cleaned = cleaner(raw)
+        for rule, positions in cleaned.attrs.pop('coerced', []):
+            coerced.setdefault(col, []).append((rule, positions, raw.iloc[positions].to_numpy(dtype=object)))
+        df[col] = cleaned
+
+    # Count of date values that could not be parsed, per column (reported, not hidden)
+    df.attrs['unparseable_dates'] = {col: len(positions) for col, failures in coerced.items()
+                                     for rule, positions, _ in failures if rule == 'unparseable_date'}
+    # Coerced values per column: [(rule, row positions, raw values)], for the reject sink
+    df.attrs['coerced'] = coerced
+
+    logging.debug(f"Cleaned dtypes for {table_name}: {dict(df.dtypes.astype(str))}")
+    return df
+
+
+# =====================
+# Table-specific Cleaning Rules
+# =====================
+def _is_missing(column):
+    return lambda df: df[column].isna()
+
+
+# Rules run in order per column; the first rule matching a row sets its value
+register('orders',
+         # Only mark as 'Shipped' if payment_method is 'COD' AND order_status is NaN
+         Rule('cod_missing_status_shipped', 'order_status', 'Shipped',
+              when=lambda df: df['payment_method'].eq('COD') & df['order_status'].isna()),
+         Rule('missing_status_pending', 'order_status', 'Pending', when=_is_missing('order_status')),
+         # Shipped orders are paid cash on delivery, other missing methods are 'Unknown'
+         Rule('shipped_is_cod', 'payment_method', 'COD', when=lambda df: df['order_status'].eq('Shipped')),
+         Rule('missing_payment_unknown', 'payment_method', 'Unknown', when=_is_missing('payment_method')))
+
+register('reviews',
+         # Ratings are made numeric by the generic clean (kind 'rating'); missing ones remain NA
+         Rule('missing_review_text_empty', 'review_text', '', when=_is_missing('review_text')))
+
+register('customers',
+         Rule('unknown_gender_na', 'gender', pd.NA, when=lambda df: df['gender'].isin(['', 'Unknown'])),
+         Rule('email_lowercase', 'email', lambda df: df['email'].str.lower()))
+
+
+def clean_table(df, table_name, metrics=None, rejects=None):
+    """
+    Generic clean (one pass, driven by schemas.py) + the table's own rules
+    (rules.apply_rules, all rules of the table fused into one pass).
+    With a metrics.MetricsRecorder the two steps are timed as the 'clean' and
+    'table_clean' stages. With a rejects.RejectSink every row with a coerced
+    value (unparseable date, text in a numeric column) is recorded there, as
+    it will be loaded.
+    """
+    if metrics is None:
+        metrics = MetricsRecorder()
+
+    with metrics.stage(table_name, 'clean', rows_in=len(df)) as m:
+        df = clean_dataframe(df, table_name)
+        coerced = df.attrs.pop('coerced', {})
+        m['rows_out'] = len(df)
+
+    if TABLE_RULES.get(table_name):
+        with metrics.stage(table_name, 'table_clean', rows_in=len(df)) as m:
+            df = apply_rules(df, table_name)
+            m['rows_out'] = len(df)
+
+    if rejects is not None:
+        for col, failures in coerced.items():
+            for rule, positions, raw_values in failures:
+                rejects.add(table_name, df.iloc[positions], rule, col, raw_values)
+    return df
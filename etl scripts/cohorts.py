@@ -0,0 +1,180 @@
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import Date, Float, Integer, inspect, text
+
+from loaders import delete_rows, read_by_keys, upsert_dataframe
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📆 Cohort retention matrix (materialized)
+# ──────────────────────────────────────────────────────────────────────────────
+vw_cohort_retention joined every customer to every order and ran
+COUNT(DISTINCT customer_id) per cohort / order month on each query, and only
+showed month_number = 1. The ETL now stores the whole matrix in
+cohort_retention, one row per cell:
+
+    cohort_month | month_number | active_customers | total_customers | retention_rate
+
+- cohort_month: month of signup_date, month_number: months from the cohort
+  month to the order month + 1 (same month = 1), every offset is kept
+  (orders placed before signup give offsets <= 0, like the view)
+- active_customers: distinct customers of the cohort with an order that month
+- retention_rate: ROUND(100.0 * active / total, 2), rounded half away from
+  zero like PostgreSQL's numeric ROUND (exact integer arithmetic, no floats)
+
+Refresh modes:
+  full         the matrix is rebuilt from customers ⋈ orders (replace loads)
+  incremental  for the customers touched by an upsert, only the cells
+               (cohort, order month) they have orders in are recounted, from
+               the orders of those months, together with the cells their
+               changed rows were in before the upsert (previous_rows: the
+               old cohort of a moved signup_date, the old month or customer
+               of a moved order); cohort sizes are recounted from customers
+               (one small column). Only cells whose values changed are
+               written.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+COHORT_TABLE = 'cohort_retention'
+CELL_KEY = ['cohort_month', 'month_number']
+
+COHORT_DTYPES = {
+    'cohort_month': Date(),
+    'month_number': Integer(),
+    'active_customers': Integer(),
+    'total_customers': Integer(),
+    'retention_rate': Float(),
+}
+
+ROWS_SQL = """
+SELECT c.customer_id, c.signup_date, o.order_date
+FROM orders o
+JOIN customers c ON c.customer_id = o.customer_id
+"""
+
+
+def month_index(dates):
+    """Months since year 0 (so month differences are plain subtraction)."""
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def month_start(indexes):
+    years, months = divmod(indexes, 12)
+    return pd.to_datetime(pd.DataFrame({'year': years, 'month': months + 1, 'day': 1}))
+
+
+def active_cells(rows):
+    """(cohort_month, month_number) → distinct active customers, from customer/signup/order rows."""
+    rows = rows.dropna(subset=['signup_date', 'order_date'])
+    cohort = month_index(rows['signup_date'])
+    cells = pd.DataFrame({
+        'cohort': cohort.to_numpy(),
+        'month_number': (month_index(rows['order_date']) - cohort + 1).to_numpy(),
+        'customer_id': rows['customer_id'].to_numpy(),
+    })
+    counts = cells.drop_duplicates().groupby(['cohort', 'month_number']).size()
+    counts = counts.rename('active_customers').reset_index()
+    counts['cohort_month'] = month_start(counts.pop('cohort'))
+    return counts[CELL_KEY + ['active_customers']]
+
+
+def cohort_sizes(customers):
+    """cohort_month → number of customers who signed up that month."""
+    signup = customers['signup_date'].dropna()
+    sizes = month_index(signup).value_counts().rename('total_customers').rename_axis('cohort').reset_index()
+    sizes['cohort_month'] = month_start(sizes.pop('cohort'))
+    return sizes
+
+
+def retention_rate(active, total):
+    """ROUND(100.0 * active / total, 2), half away from zero, without float rounding errors."""
+    active = active.astype('int64')
+    total = total.astype('int64')
+    return ((20_000 * active + total) // (2 * total)) / 100
+
+
+def build_matrix(cells, sizes):
+    """Join active counts with cohort sizes (inner join, like the view) and add the rate."""
+    matrix = cells.merge(sizes, on='cohort_month', how='inner')
+    matrix['retention_rate'] = retention_rate(matrix['active_customers'], matrix['total_customers'])
+    return matrix.sort_values(CELL_KEY, ignore_index=True)
+
+
+def _read_sizes(conn):
+    return cohort_sizes(pd.read_sql(text("SELECT signup_date FROM customers"), conn, parse_dates=['signup_date']))
+
+
+def read_months(conn, month_indexes, sql=ROWS_SQL, parse_dates=('signup_date', 'order_date')):
+    """Rows of sql (default: customer/signup/order) for the orders placed in the given months (one scan)."""
+    conditions, params = [], {}
+    for i, index in enumerate(month_indexes):
+        bounds = month_start(pd.Series([index, index + 1])).dt.strftime('%Y-%m-%d')
+        conditions.append(f"(o.order_date >= :start_{i} AND o.order_date < :end_{i})")
+        params[f'start_{i}'], params[f'end_{i}'] = bounds[0], bounds[1]
+    statement = text(sql + " WHERE " + " OR ".join(conditions))
+    return pd.read_sql(statement, conn, params=params, parse_dates=list(parse_dates))
+
+
+def _recount_cells(conn, changed_customers, previous_rows=None):
+    """
+    Active counts of every cell the changed customers have orders in, now or
+    before the upserts (previous_rows); returns (cells, affected keys).
+    """
+    touched = read_by_keys(conn, ROWS_SQL, 'c.customer_id', changed_customers,
+                           parse_dates=['signup_date', 'order_date'])
+    if previous_rows is not None:
+        touched = pd.concat([touched, previous_rows[touched.columns]], ignore_index=True)
+    affected = active_cells(touched)[CELL_KEY]
+    if affected.empty:
+        return affected.assign(active_customers=0), affected
+
+    months = (month_index(affected['cohort_month']) + affected['month_number'] - 1).unique()
+    recounted = active_cells(read_months(conn, sorted(months)))
+    return recounted.merge(affected, on=CELL_KEY, how='inner'), affected
+
+
+def refresh_cohorts(engine, changed_customers=None, previous_rows=None, report=True):
+    """
+    Recompute cohort_retention. changed_customers=None → full rebuild, else only
+    the cells of those customers, and of previous_rows (the changed rows as
+    they were before the upserts), are recounted (full when the table does not
+    exist yet). Returns upsert_dataframe()'s stats plus 'deleted'.
+    """
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        exists = inspect(conn).has_table(COHORT_TABLE)
+        existing = (pd.read_sql(text(f"SELECT cohort_month, month_number, active_customers FROM {COHORT_TABLE}"),
+                                conn, parse_dates=['cohort_month']) if exists else None)
+        sizes = _read_sizes(conn)
+
+        if changed_customers is None or not exists:
+            mode = 'full'
+            cells = active_cells(pd.read_sql(text(ROWS_SQL), conn, parse_dates=['signup_date', 'order_date']))
+        else:
+            mode = f'{len(changed_customers)} changed customers'
+            recounted, affected = _recount_cells(conn, set(changed_customers), previous_rows)
+            untouched = existing.merge(affected, on=CELL_KEY, how='left', indicator=True)
+            untouched = untouched[untouched['_merge'] == 'left_only'].drop(columns='_merge')
+            cells = pd.concat([untouched, recounted], ignore_index=True)
+
+    matrix = build_matrix(cells, sizes)
+    stale = pd.DataFrame(columns=CELL_KEY)
+    if existing is not None:
+        stale = existing[CELL_KEY].merge(matrix[CELL_KEY], on=CELL_KEY, how='left', indicator=True)
+        stale = stale[stale['_merge'] == 'left_only'][CELL_KEY]
+        stale = stale.assign(cohort_month=stale['cohort_month'].dt.date)
+
+    # Upsert and delete commit together: the dashboard never sees a half-refreshed matrix
+    with engine.begin() as conn:
+        stats = upsert_dataframe(matrix, COHORT_TABLE, conn, key_columns=CELL_KEY, dtype=COHORT_DTYPES, report=False)
+        stats['deleted'] = delete_rows(conn, COHORT_TABLE, CELL_KEY, stale)
+    seconds = time.perf_counter() - start
+
+    message = (f"Refreshed {COHORT_TABLE} ({mode}): {len(matrix)} cells, "
+               f"{stats['changed']} rows written, {stats['deleted']} removed in {seconds:.2f}s")
+    logging.info(message)
+    if report:
+        print(message)
+    return stats
@@ -0,0 +1,199 @@
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import Date, Integer, LargeBinary, String, inspect, text
+
+from cohorts import month_index, month_start, read_months
+from loaders import delete_rows, read_by_keys, upsert_dataframe
+from sketches import grouped_hll, merge_sketches
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🔢 Unique-customer sketches (materialized)
+# ──────────────────────────────────────────────────────────────────────────────
+COUNT(DISTINCT customer_id) (vw_productcust, vw_cohort_retention) is the most
+expensive aggregate of the dashboards, and distinct counts cannot be added up
+across months. The ETL keeps one HyperLogLog sketch of the customers per
+dimension value and order month in customer_sketches:
+
+    dimension | dimension_key | order_month | customers | sketch
+
+    dimension   dimension_key            rows
+    month       'all'                    orders
+    product     product_id               order_items ⋈ orders ⋈ products
+    category    category                 order_items ⋈ orders ⋈ products
+    cohort      signup month (ISO date)  orders ⋈ customers
+
+- customers: the sketch's estimate for that one month (~0.8% error, exact
+  in practice for small counts)
+- sketch: the HyperLogLog in binary form (sketches.py); a product bought by
+  a handful of customers in a month takes a few bytes
+- sketches merge: unique_customers() unions the months of any range per
+  dimension_key, so "distinct buyers of each product in Q3" reads a few
+  sketches instead of re-scanning orders, without double counting customers
+  who bought in several months
+- with surrogate keys product_id / customer_id are the stored surrogates
+
+Refresh modes:
+  full         every sketch is rebuilt (replace loads, and upserts of
+               order_items / products, which are not tracked per customer)
+  incremental  for the customers touched by an upsert of orders / customers,
+               every sketch of the order months they have orders in, now or
+               before the upsert (previous_rows: the old month of an order
+               moved to another month or customer), is rebuilt from the
+               orders of those months.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+SKETCH_TABLE = 'customer_sketches'
+SKETCH_KEY = ['dimension', 'dimension_key', 'order_month']
+SKETCH_COLUMNS = SKETCH_KEY + ['customers', 'sketch']
+
+SKETCH_DTYPES = {
+    'dimension': String(20),
+    'dimension_key': String(50),
+    'order_month': Date(),
+    'customers': Integer(),
+    'sketch': LargeBinary(),
+}
+
+ORDERS_SQL = """
+SELECT o.customer_id, o.order_date, c.signup_date
+FROM orders o
+LEFT JOIN customers c ON c.customer_id = o.customer_id
+"""
+
+ITEMS_SQL = """
+SELECT o.customer_id, o.order_date, oi.product_id, p.category
+FROM order_items oi
+JOIN orders o ON o.order_id = oi.order_id
+JOIN products p ON p.product_id = oi.product_id
+"""
+
+
+def _month(dates):
+    """First day of each date's month (NaT stays NaT)."""
+    return dates.dt.to_period('M').dt.start_time
+
+
+def _dimension(dimension, rows, keys):
+    rows = pd.DataFrame({'dimension_key': keys, 'order_month': _month(rows['order_date']),
+                         'customer_id': rows['customer_id']})
+    sketches = grouped_hll(rows, ['dimension_key', 'order_month'], 'customer_id')
+    return sketches.rename(columns={'estimate': 'customers'}).assign(dimension=dimension)[SKETCH_COLUMNS]
+
+
+def build_sketches(orders, items):
+    """
+    Every sketch row from orders (customer_id, order_date, signup_date) and
+    items (customer_id, order_date, product_id, category) rows.
+    """
+    frames = [
+        _dimension('month', orders, pd.Series('all', index=orders.index)),
+        _dimension('cohort', orders, _month(orders['signup_date']).dt.strftime('%Y-%m-%d')),
+        _dimension('product', items, items['product_id'].astype('string')),
+        _dimension('category', items, items['category'].astype('string')),
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _read(conn, sql, parse_dates, months=None):
+    """Rows of sql: all of them, or those of the orders placed in the given month indexes."""
+    if months is None:
+        return pd.read_sql(text(sql), conn, parse_dates=parse_dates)
+    if not months:
+        return pd.read_sql(text(sql + " WHERE 1 = 0"), conn, parse_dates=parse_dates)
+    return read_months(conn, months, sql, parse_dates)
+
+
+def _read_rows(conn, months=None):
+    """orders and items rows (see build_sketches)."""
+    return (_read(conn, ORDERS_SQL, ['order_date', 'signup_date'], months),
+            _read(conn, ITEMS_SQL, ['order_date'], months))
+
+
+def _read_stored(conn, months=None):
+    """Stored sketch rows (key + sketch bytes), all of them or those of the given month indexes."""
+    sql = f"SELECT {', '.join(SKETCH_KEY)}, sketch FROM {SKETCH_TABLE}"
+    if months is None:
+        stored = pd.read_sql(text(sql), conn, parse_dates=['order_month'])
+    elif not months:
+        stored = pd.DataFrame({col: pd.Series(dtype='datetime64[ns]' if col == 'order_month' else object)
+                               for col in SKETCH_KEY + ['sketch']})
+    else:
+        month_dates = month_start(pd.Series(months, dtype='int64')).dt.strftime('%Y-%m-%d')
+        stored = read_by_keys(conn, sql, 'order_month', month_dates, parse_dates=['order_month'])
+    return stored.assign(sketch=stored['sketch'].map(bytes))
+
+
+def refresh_sketches(engine, changed_customers=None, previous_rows=None, report=True):
+    """
+    Rebuild customer_sketches. changed_customers=None → every sketch, else only
+    the order months those customers have orders in, and the months of
+    previous_rows (the changed rows as they were before the upserts); full
+    when the table does not exist yet. Returns upsert_dataframe()'s stats
+    plus 'deleted'.
+    """
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        exists = inspect(conn).has_table(SKETCH_TABLE)
+        if changed_customers is None or not exists:
+            mode, months = 'full', None
+        else:
+            touched = read_by_keys(conn, "SELECT o.order_date FROM orders o", 'o.customer_id',
+                                   set(changed_customers), parse_dates=['order_date'])['order_date']
+            if previous_rows is not None:
+                touched = pd.concat([touched, previous_rows['order_date']], ignore_index=True)
+            months = sorted(month_index(touched.dropna()).unique().tolist())
+            mode = f'{len(changed_customers)} changed customers, {len(months)} months'
+        orders, items = _read_rows(conn, months)
+        existing = _read_stored(conn, months if exists else [])
+
+    sketches = build_sketches(orders, items)
+    # Only new or changed sketches are written (most months keep their bytes)
+    compared = sketches.merge(existing, on=SKETCH_KEY, how='outer', suffixes=('', '_stored'), indicator=True)
+    changed = compared[(compared['_merge'] == 'left_only')
+                       | ((compared['_merge'] == 'both') & (compared['sketch'] != compared['sketch_stored']))]
+    stale = compared.loc[compared['_merge'] == 'right_only', SKETCH_KEY]
+    stale = stale.assign(order_month=stale['order_month'].dt.date)
+
+    # Upsert and delete commit together: readers never merge half-refreshed months
+    with engine.begin() as conn:
+        stats = upsert_dataframe(changed[SKETCH_COLUMNS], SKETCH_TABLE, conn, key_columns=SKETCH_KEY,
+                                 dtype=SKETCH_DTYPES, report=False)
+        stats['deleted'] = delete_rows(conn, SKETCH_TABLE, SKETCH_KEY, stale)
+    seconds = time.perf_counter() - start
+
+    message = (f"Refreshed {SKETCH_TABLE} ({mode}): {len(sketches)} sketches "
+               f"({sketches['sketch'].map(len).sum() / 1024:,.0f} KiB), "
+               f"{stats['changed']} rows written, {stats['deleted']} removed in {seconds:.2f}s")
+    logging.info(message)
+    if report:
+        print(message)
+    return stats
+
+
+def unique_customers(engine, dimension, start=None, end=None, keys=None):
+    """
+    Distinct customers per dimension_key over the order months from start to
+    end (dates or 'YYYY-MM-DD', both months included, None = open ended), by
+    merging the stored sketches. keys limits the dimension_keys.
+    Returns dimension_key, customers (largest first).
+    """
+    sql = f"SELECT dimension_key, sketch FROM {SKETCH_TABLE} WHERE dimension = :dimension"
+    params = {'dimension': dimension}
+    if start is not None:
+        sql += " AND order_month >= :start"
+        params['start'] = pd.Timestamp(start).to_period('M').start_time.date()
+    if end is not None:
+        sql += " AND order_month <= :end"
+        params['end'] = pd.Timestamp(end).to_period('M').start_time.date()
+    with engine.connect() as conn:
+        rows = pd.read_sql(text(sql), conn, params=params)
+    if keys is not None:
+        rows = rows[rows['dimension_key'].isin([str(key) for key in keys])]
+
+    merged = merge_sketches(rows, ['dimension_key']).rename(columns={'estimate': 'customers'})
+    return merged[['dimension_key', 'customers']].sort_values(['customers', 'dimension_key'],
+                                                              ascending=[False, True], ignore_index=True)
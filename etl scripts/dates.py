@@ -0,0 +1,80 @@
+import logging
+from functools import lru_cache
+
+import pandas as pd
+from dateutil import parser as date_parser
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📅 Date Parsing
+# ──────────────────────────────────────────────────────────────────────────────
+pd.to_datetime(..., dayfirst=True) has to guess the format of every column and
+guesses wrong on ISO data (2015-12-03 → 3 Dec? 12 Mar?). Every date column now
+declares its format in schemas.DATE_FORMATS and is parsed in three steps:
+
+1. Fast path: one vectorized fixed-format parse of the whole column
+   (Arrow strptime when pyarrow is installed, else pd.to_datetime(format=...))
+2. Fallback: values the fast path could not read (e.g. '3/12/2015' in an ISO
+   column) go through dateutil one distinct value at a time; results are
+   cached, so repeated bad values are parsed once per run
+3. Whatever is still unreadable stays NaT, but is counted and reported
+   instead of disappearing silently
+
+Results are datetime64[ns] at midnight; dtype_mapping maps the column to DATE.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+# Distinct bad values remembered by the fallback parser
+FALLBACK_CACHE_SIZE = 100_000
+
+
+def _fast_parse(s, date_format):
+    """Fixed-format parse of a whole string column; failures become NaT."""
+    if pa is not None:
+        parsed = pc.strptime(pa.array(s), format=date_format, unit='s', error_is_null=True)
+        return pd.Series(parsed.to_pandas(), index=s.index, name=s.name).astype('datetime64[ns]')
+    return pd.to_datetime(s, format=date_format, errors='coerce')
+
+
+@lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def _fallback_parse(value, dayfirst):
+    """Parse one odd-looking value; NaT if even dateutil cannot read it."""
+    try:
+        return pd.Timestamp(date_parser.parse(value, dayfirst=dayfirst)).normalize()
+    except (ValueError, OverflowError):
+        return pd.NaT
+
+
+def parse_dates(s, date_format=None):
+    """
+    Parse a cleaned string column (missing values already <NA>) to dates.
+
+    Returns (dates, bad) where dates is a datetime64[ns] Series and bad is a
+    boolean mask of values that were present but could not be parsed.
+    date_format=None falls back to the old dayfirst guess for the whole column.
+    """
+    present = s.notna()
+    if date_format is None:
+        dates = pd.to_datetime(s, errors='coerce', dayfirst=True).dt.normalize()
+        return dates, present & dates.isna()
+
+    dates = _fast_parse(s, date_format)
+    failed = present & dates.isna()
+    if failed.any():
+        dayfirst = date_format.find('%d') < date_format.find('%m')
+        retry = s[failed].astype(object)
+        parsed = {value: _fallback_parse(value, dayfirst) for value in retry.unique()}
+        dates[failed] = pd.to_datetime(retry.map(parsed))
+        logging.info(f"{s.name}: {int(failed.sum())} values did not match {date_format}, used fallback parser")
+
+    bad = present & dates.isna()
+    if bad.any():
+        examples = s[bad].unique()[:5].tolist()
+        logging.warning(f"{s.name}: {int(bad.sum())} unparseable dates set to NaT (e.g. {examples})")
+    return dates, bad
@@ -1,7 +1,15 @@
-import pandas as pd
-from sqlalchemy import Date, create_engine, String, Numeric
-import os
+import argparse
+import importlib
 import logging
+import os
+from contextlib import contextmanager
+from functools import lru_cache, partial
+
+from metrics import MetricsRecorder
+
+# pandas, SQLAlchemy and the modules built on them are imported inside the
+# functions that use them, so `import etl_pipeline` and `--help` stay instant
+# and nothing connects to a database until a load actually starts.
 
 """
 # ──────────────────────────────────────────────────────────────────────────────
@@ -25,247 +33,583 @@ import logging
 # =====================
 # PostgreSQL Connection
 # =====================
-DB_USER = 'postgres'
-DB_PASSWORD = 'your_password'
-DB_HOST = 'your_host'
-DB_PORT = 'port'
-DB_NAME = 'retail_analytics'
+# Credentials come from the environment (the usual libpq variables), or give a
+# complete SQLAlchemy URL with --engine-url / ETL_DATABASE_URL
+DB_USER = os.environ.get('PGUSER', 'postgres')
+DB_PASSWORD = os.environ.get('PGPASSWORD', '')
+DB_HOST = os.environ.get('PGHOST', 'localhost')
+DB_PORT = os.environ.get('PGPORT', '5432')
+DB_NAME = os.environ.get('PGDATABASE', 'retail_analytics')
+
+DATABASE_URL = os.environ.get('ETL_DATABASE_URL') or \
+    f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
-engine = create_engine(
-    f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+_engine = None
+
+
+def get_engine():
+    """The engine for DATABASE_URL, created on first use with a pool sized for the loads."""
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+
+        from loaders import engine_options, transactional_sqlite
+        _engine = transactional_sqlite(create_engine(DATABASE_URL, **engine_options(DATABASE_URL, load_workers())))
+    return _engine
 
 
 # =====================
 # File Paths
 # =====================
-table_files = {
-    'customers': 'I:\\DATA ANALYTICS PROJECTS\\retail_analytics\\raw data\\customers.csv',
-    'orders': 'I:\\DATA ANALYTICS PROJECTS\\retail_analytics\\raw data\\orders.csv',
-    'products': 'I:\\DATA ANALYTICS PROJECTS\\retail_analytics\\raw data\\products.csv',
-    'order_items': 'I:\\DATA ANALYTICS PROJECTS\\retail_analytics\\raw data\\order_items.csv',
-    'reviews': 'I:\\DATA ANALYTICS PROJECTS\\retail_analytics\\raw data\\reviews.csv'
+TABLES = ['customers', 'orders', 'products', 'order_items', 'reviews']
+
+# Folder with one <table>.csv per table: the repo's raw data/ folder, unless
+# --source-dir / ETL_SOURCE_DIR point elsewhere
+SOURCE_DIR = os.environ.get('ETL_SOURCE_DIR') or \
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'raw data')
+
+
+def source_files(source_dir=None, tables=None):
+    """{table: path of its CSV} for the given tables (all by default)."""
+    source_dir = source_dir or SOURCE_DIR
+    return {table_name: os.path.join(source_dir, f'{table_name}.csv') for table_name in tables or TABLES}
+
+# Rows per chunk for streaming mode. None = read, clean and load each file in one go.
+# Set it (e.g. 100_000) when the extracts are bigger than the worker's memory.
+CHUNK_SIZE = None
+
+# Worker processes for extract + clean (one table per worker). None = one per table,
+# capped at the CPU count. 1 = old sequential loop. Streaming mode (CHUNK_SIZE set)
+# always runs table by table so only one chunk is in memory at a time.
+MAX_WORKERS = None
+
+# Tables loaded at the same time (threads, one pooled connection and transaction
+# each) when extract + clean run in parallel. None = 2, the widest foreign-key
+# level. Always 1 on SQLite (one writer at a time) and with SURROGATE_KEYS (the
+# key maps are shared between tables).
+LOAD_WORKERS = None
+
+# 'replace' = drop and rebuild every table (full load)
+# 'upsert'  = incremental: insert new rows / update changed rows by primary key,
+#             e.g. for a daily delta file with a few thousand orders
+LOAD_MODE = 'replace'
+
+# Tables whose source file and cleaning rules did not change since the last
+# successful load are skipped (see manifest.py). `python etl_pipeline.py --force`
+# reloads everything.
+FORCE_RELOAD = False
+
+# Extract, clean and validate only: nothing is written (no loads, staging,
+# reject tables or manifest), every selected table runs
+DRY_RUN = False
+
+# Write every cleaned table to the Parquet staging area (staging.py, needs pyarrow)
+STAGE_TABLES = True
+
+# Folder of the Parquet staging area. None = staging.STAGING_DIR (staging/ in the repo)
+STAGING_DIR = None
+
+# Re-load the database from the staged Parquet files instead of parsing and
+# cleaning the CSVs again (backfills / re-loads). Skips the manifest check.
+LOAD_FROM_STAGING = False
+
+# Compact-key mode (keys.py): ID columns are loaded as 32-bit integer surrogates
+# instead of VARCHAR(50); the natural IDs stay available in key_map_<domain>.
+# Switching it on or off reloads every table (the manifest tracks it).
+SURROGATE_KEYS = False
+
+# Check every foreign key (schemas.FOREIGN_KEYS) on the cleaned rows before
+# they are loaded; orphans go to <table>_rejects instead (integrity.py)
+CHECK_FOREIGN_KEYS = True
+
+# Stream the vw_statics numbers (order_amount moments, median, distinct customers,
+# mode) while orders load and store them in the one-row order_stats table (order_stats.py)
+STREAM_ORDER_STATS = True
+
+# Per-stage timings of this run (wall, CPU, peak RSS, rows, bytes), appended to
+# etl_metrics.jsonl and printed as a summary at the end (see metrics.py)
+METRICS = MetricsRecorder()
+
+# Derived tables rebuilt after one of their source tables was loaded: fully
+# after a replace load, only for the changed customers after an upsert of
+# orders / customers (upserts of other sources rebuild them fully). Remove an
+# entry to stop maintaining that table. table → (module, refresh function, sources)
+MATERIALIZED_TABLES = {
+    'customer_rfm': ('rfm', 'refresh_rfm', ('orders', 'customers')),
+    'cohort_retention': ('cohorts', 'refresh_cohorts', ('orders', 'customers')),
+    'customer_sketches': ('customer_sketches', 'refresh_sketches', ('orders', 'customers', 'order_items', 'products')),
+    'revenue_cube': ('revenue_cube', 'refresh_cube', ('orders', 'customers', 'order_items', 'products')),
 }
 
+# Per-run state, set up by start_run():
+#   KEYS         natural ↔ surrogate key maps (keys.SurrogateKeys, SURROGATE_KEYS only)
+#   REJECTS      rows whose values cleaning had to coerce (unparseable dates, text in
+#                numeric columns) and FK orphans, written in batches to <table>_rejects
+#                (rejects.RejectSink)
+#   PARENT_KEYS  key values of the parent tables for the FK check (integrity.ParentKeys)
+#   ORDER_STATS  streaming accumulator of the loaded orders (order_stats.OrderStats)
+KEYS = None
+REJECTS = None
+PARENT_KEYS = None
+ORDER_STATS = None
+
+# customer_ids touched by upserts in this run (drives the incremental refresh),
+# and the customer / signup / order rows the upserts changed as they were
+# before (rfm.changed_rows), so the refresh also corrects the old customers,
+# cohorts, months and days of orders that moved
+CHANGED_CUSTOMERS = set()
+PREVIOUS_ROWS = []
+
 
 # =====================
-# Generic Cleaning Function
-# =====================
-    
+
+# Define dtype mappings for each table keep the schema consistent so when we join in sql we do not
+# have to cast
+# Data Type Mappings for SQLAlchemy
+"""
+What dtype_mapping does?
+Tells SQLAlchemy/to_sql() what PostgreSQL type to use when creating the table
+Doesn’t automatically convert pandas data — if pandas has int/float/NaN in that column, 
+it will try to cast and may cause type mismatches
 """
-    Generic cleaning:
-    -----------------
-    1. Strip strings
-    2. Replace empty/blank/nan strings with NA
-    3. Convert date columns
-    4. Fill numeric nulls with 0
-    5. Normalize ID columns (always strings)
-
-    pd.read_csv(), it’s always interpreted as a string/object.Excel’s formatting doesn’t carry over in CSV.
-    CSV has no type information — every cell is just text/numbers.
-    pd.read_csv() guesses types. If a column has mixed formats or some blanks, it often defaults to object.
-    Excel formatting (Short Date, Long Date) only affects display in Excel, not the raw CSV data.
-
-    Notes on ID columns:
-    - Forces all IDs to Python strings (object dtype in pandas)
-    - Strips spaces, handles any numeric-looking IDs (e.g., 1 → '1')
-    - Cleans inconsistencies in raw CSV before loading
-    - Even if dtype_mapping says String for PostgreSQL, pandas might infer int64 → SQLAlchemy maps it to BIGINT
-    - Leading/trailing spaces or blank cells can cause foreign key mismatches or errors
-
-    Notes on date columns:
-    - CSVs often store dates as strings, even if Excel shows them as Short/Long Date
-    - `pd.to_datetime` converts string/object columns to pandas datetime
-    - `errors='coerce'` ensures invalid formats become NaT instead of crashing
-    - `dayfirst=True/False` depends on your date format (DD/MM/YYYY vs MM/DD/YYYY)
-
-
-    dt.date converts pandas datetime to Python date objects → SQLAlchemy maps this to 
-    DATE in PostgreSQL. No time component, only YYYY-MM-DD
-    
-      Important:
-            - Forces all IDs to Python strings (object dtype in pandas)
-            - Strips spaces, handles numeric-looking IDs (1 → '1')
-            - Prevents foreign key mismatches in PostgreSQL
-    """
 
-def clean_dataframe(df, table_name=None):
-    # -----------------
-    # Step 1: Basic column-wise cleaning
-    # -----------------
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            # Strip spaces and replace blank strings with pd.NA
-            df[col] = df[col].astype(str).str.strip()
-            df[col] = df[col].replace({'': pd.NA, ' ': pd.NA, 'nan': pd.NA, 'NaN': pd.NA})
-        elif pd.api.types.is_numeric_dtype(df[col]):
-            # Fill numeric nulls with 0
-            df[col] = df[col].fillna(0)
-
-    # -----------------
-    # Step 2: Table-specific date conversion
-    # -----------------
-    table_date_cols = {
-        'customers': ['signup_date', 'dob'],
-        'orders': ['order_date'],
-        'reviews': ['review_date'],
-        # 'products': []  # no date columns
+# Example: all IDs as VARCHAR(50), date columns as DATE
+@lru_cache(maxsize=None)
+def dtype_mapping():
+    from sqlalchemy import Date, String
+
+    return {
+        'customers': {'customer_id': String(50), 'signup_date': Date(), 'dob': Date()},
+        'orders': {'order_id': String(50), 'customer_id': String(50), 'order_date': Date()},
+        'products': {'product_id': String(50)},
+        'order_items': {
+            'order_item_id': String(50),
+            'order_id': String(50),
+            'product_id': String(50)
+        },
+        'reviews': {
+            'review_id': String(50),
+            'order_id': String(50),
+            'customer_id': String(50),
+            'product_id': String(50),
+            'review_date': Date()
+        }
     }
-    
-    date_cols = table_date_cols.get(table_name, [])
-    for col in date_cols:
-        if col in df.columns:
-            # Strip again and replace empty strings
-            df[col] = df[col].astype(str).str.strip().replace({'': pd.NA})
-            # Convert to datetime and then take only date
-            df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True).dt.date
-            """ 
-            dt.date converts pandas datetime to Python date objects → SQLAlchemy maps this to 
-            DATE in PostgreSQL. No time component, only YYYY-MM-DD
-            """
-
-    # -----------------
-    # Step 3: Normalize all ID columns (force to string)
-    # -----------------
-    id_columns = ['order_id', 'customer_id', 'order_item_id', 'product_id']
-    for col in id_columns:
-        if col in df.columns:
-            # Convert numeric-looking IDs to string, strip spaces
-            df[col] = df[col].astype(str).str.strip()
-            """
-            Important:
-            - Forces all IDs to Python strings (object dtype in pandas)
-            - Strips spaces, handles numeric-looking IDs (1 → '1')
-            - Prevents foreign key mismatches in PostgreSQL
-            """
-
-    print(df.dtypes)  # ✅ Debug: shows final pandas dtypes
-    return df
 
 
+# =====================
+# ETL for one table
+# =====================
+def etl_table(table_name, file_path, chunk_size=None):
+    """
+    Extract → clean → load one table, chunk by chunk, in one transaction (table_transaction).
+    - replace mode: the first chunk replaces <table>__load, the next chunks are
+      appended, and it is swapped in for the table at the end
+    - upsert mode: every chunk is merged into the table by primary key
+    - Numeric columns of later chunks are cast to the first chunk's dtypes, so a
+      column read as text after a dirty value still fits the table (categoricals
+      are left alone: each chunk has its own categories)
+    With chunk_size=None there is just one chunk (the whole file).
+    LOAD_FROM_STAGING reads the already cleaned chunks from Parquet instead.
+    """
+    import pandas as pd
+
+    from cleaning import clean_table
+    from extract import iter_table
+    from staging import iter_staged, stage_table, staged_bytes
+
+    total_rows = 0
+    first_dtypes = None
+    load_seconds = 0.0
+    staging_dir = staging_folder()
+
+    if LOAD_FROM_STAGING:
+        chunks = METRICS.timed_chunks(iter_staged(table_name, chunk_size, staging_dir), table_name,
+                                      bytes_read=staged_bytes(table_name, staging_dir))
+    else:
+        chunks = METRICS.timed_chunks(iter_table(table_name, file_path, chunk_size), table_name,
+                                      bytes_read=os.path.getsize(file_path))
+
+    with table_transaction(table_name) as conn:
+        for chunk_index, chunk in enumerate(chunks):
+            if not LOAD_FROM_STAGING:
+                # Generic clean (one pass, driven by schemas.py) + table-specific cleaning
+                chunk = clean_table(chunk, table_name, METRICS, REJECTS)
+                if STAGE_TABLES:
+                    with METRICS.stage(table_name, 'stage', rows_in=len(chunk)) as m:
+                        stage_table(chunk, table_name, chunk_index=chunk_index, mode=LOAD_MODE,
+                                    staging_dir=staging_dir)
+                        m['rows_out'] = len(chunk)
+
+            if first_dtypes is None:
+                first_dtypes = {col: dtype for col, dtype in chunk.dtypes.items()
+                                if pd.api.types.is_numeric_dtype(dtype)}
+            else:
+                chunk = chunk.astype(first_dtypes)
+
+            stats = load_table(table_name, chunk, conn, first_chunk=chunk_index == 0, report=chunk_size is None)
+            total_rows += stats['rows']
+            load_seconds += stats['seconds']
+            # Keep the buffered rejects bounded on big files
+            REJECTS.flush(table_name, conn, min_rows=REJECTS.batch_rows)
+
+        # Swap + indexes once the whole table is in (not per chunk: appends stay index-free)
+        finish_table(table_name, conn)
+
+    if chunk_size is not None:
+        rows_per_sec = total_rows / load_seconds if load_seconds > 0 else float('inf')
+        logging.info(f"Loaded {total_rows} rows into {table_name} ({LOAD_MODE}) in chunks of {chunk_size} ({rows_per_sec:,.0f} rows/sec)")
+        print(f"Loaded {total_rows} rows into {table_name} ({LOAD_MODE}) in chunks of {chunk_size} ({rows_per_sec:,.0f} rows/sec)")
+
+    return total_rows
+
+
+def staging_folder():
+    """STAGING_DIR, or the staging area's default folder."""
+    from staging import STAGING_DIR as DEFAULT_STAGING_DIR
+
+    return STAGING_DIR or DEFAULT_STAGING_DIR
 
 
 # =====================
-# Table-specific Cleaning Rules
+# Referential integrity
 # =====================
-def clean_orders(df):
-   
- # Only mark as 'Shipped' if payment_method is 'COD' AND order_status is NaN
-    mask_shipped = (df['payment_method'] == 'COD') & df['order_status'].isna()
+def stored_keys(table_name, column):
+    """Key values already in the database, as natural keys (decoded in surrogate-key mode)."""
+    from integrity import read_key_column
+    from keys import KEY_DOMAINS
+
+    keys = read_key_column(get_engine(), table_name, column)
+    if SURROGATE_KEYS and column in KEY_DOMAINS:
+        keys = KEYS.decode(KEY_DOMAINS[column], keys).to_numpy(dtype=object)
+    return keys
+
+
+def validate_table(table_name, df, first_chunk=True):
+    """Pre-load FK check: orphans are quarantined, the rest is returned for loading."""
+    from integrity import check_foreign_keys
+
+    with METRICS.stage(table_name, 'validate', rows_in=len(df)) as m:
+        df, rejects = check_foreign_keys(table_name, df, PARENT_KEYS)
+        REJECTS.add_frame(table_name, rejects)
+        if first_chunk:
+            PARENT_KEYS.start(table_name, keep_stored=LOAD_MODE == 'upsert')
+        PARENT_KEYS.add(table_name, df)
+        m['rows_out'] = len(df)
+    return df
 
-# Only mark as 'Pending' if order_status is NaN but not shipped
-    mask_pending = df['order_status'].isna() & ~mask_shipped
 
-    df.loc[mask_shipped, 'order_status'] = 'Shipped'
-    df.loc[mask_pending, 'order_status'] = 'Pending'
+# =====================
+# Load with dtype enforcement
+# =====================
+def table_dtypes(table_name, df):
+    """dtype_mapping for the table, with ID columns as INTEGER when they hold surrogates."""
+    from keys import KEY_DOMAINS, key_sql_type
 
-# Fix payment_method if missing
-    df['payment_method'] = df['payment_method'].fillna('Unknown')
-    df.loc[df['order_status'] == 'Shipped', 'payment_method'] = 'COD'
+    dtypes = dict(dtype_mapping().get(table_name, {}))
+    for col in df.columns:
+        if col in KEY_DOMAINS:
+            dtypes[col] = key_sql_type(df[col])
+    return dtypes or None
 
-    return df
+
+@contextmanager
+def table_transaction(table_name):
+    """
+    One transaction on one pooled connection for everything a load writes to
+    a table: all its chunks, the swap, its indexes, its rejects. Readers see
+    the table as it was before the load until the commit. Yields None in a
+    dry run.
+    """
+    if DRY_RUN:
+        yield None
+        return
+    try:
+        with get_engine().begin() as conn:
+            yield conn
+    except Exception:
+        if KEYS is not None:
+            # Surrogates handed out in the rolled back transaction were never stored
+            KEYS.forget()
+        raise
 
 
-def clean_reviews(df):
+def load_table(table_name, df, conn, first_chunk=True, report=True):
+    """
+    Load one cleaned DataFrame (a whole table or one chunk) using LOAD_MODE,
+    in conn's transaction (table_transaction). Replace loads write into
+    <table>__load, which finish_table() swaps in.
+    COPY FROM STDIN on PostgreSQL, df.to_sql() on other engines (see loaders.py).
+    With CHECK_FOREIGN_KEYS rows without a parent are quarantined first, with
+    SURROGATE_KEYS the ID columns are then swapped for their surrogates.
+    DRY_RUN stops after the check and writes nothing.
     """
-    Review-specific cleaning:
-    - Convert rating to numeric
-    - Missing ratings remain NaN (ignored in mean calculations)
-    - Fill empty review_text with ''
+    from loaders import load_dataframe, load_table_name, upsert_dataframe
+    from rfm import affected_customers, changed_rows, previous_rows
+    from schemas import PRIMARY_KEYS
+
+    if CHECK_FOREIGN_KEYS:
+        df = validate_table(table_name, df, first_chunk)
+    if DRY_RUN:
+        message = f"Dry run: {len(df)} rows of {table_name} ready to load"
+        logging.info(message)
+        if report:
+            print(message)
+        return {'table': table_name, 'rows': len(df), 'seconds': 0.0, 'rows_per_sec': float('inf')}
+    if table_name == 'orders' and STREAM_ORDER_STATS and LOAD_MODE == 'replace':
+        with METRICS.stage(table_name, 'stats', rows_in=len(df)):
+            ORDER_STATS.update(df)
+    if SURROGATE_KEYS:
+        df = KEYS.encode(df, conn)
+
+    with METRICS.stage(table_name, 'load', rows_in=len(df)) as m:
+        if LOAD_MODE == 'upsert':
+            previous = previous_rows(conn, table_name, df)
+            stats = upsert_dataframe(
+                df,
+                table_name,
+                conn,
+                key_columns=PRIMARY_KEYS[table_name],
+                dtype=table_dtypes(table_name, df),
+                report=report
+            )
+            CHANGED_CUSTOMERS.update(affected_customers(table_name, df, stats, previous))
+            if previous is not None:
+                PREVIOUS_ROWS.append(changed_rows(table_name, previous, stats))
+        else:
+            stats = load_dataframe(
+                df,
+                load_table_name(table_name),
+                conn,
+                dtype=table_dtypes(table_name, df),  # safely returns None if no mapping
+                if_exists='replace' if first_chunk else 'append',
+                report=report
+            )
+            stats['table'] = table_name
+        m['rows_out'] = stats['rows']
+    return stats
+
+
+def index_table(table_name, conn):
+    """Build the table's declared indexes (primary key, foreign keys, order_date) after a load."""
+    from loaders import ensure_indexes
+    from schemas import declared_indexes
+
+    with METRICS.stage(table_name, 'index'):
+        ensure_indexes(conn, table_name, declared_indexes(table_name))
+
+
+def finish_table(table_name, conn):
     """
-    if 'rating' in df.columns:
-        # Replace empty, space, or literal "nan" with NA first
-        df['rating'] = df['rating'].replace(['', ' ', 'nan', 'NaN', 'N/A', 'null'], pd.NA)
-        df['rating'] = pd.to_numeric(df['rating'], errors='coerce')  # Convert to numeric safely
+    Last steps of a table's load, still in its transaction: swap in the
+    freshly loaded table (replace mode), build its indexes, write its rejects.
+    """
+    from loaders import swap_table
 
-    if 'review_text' in df.columns:
-        df['review_text'] = df['review_text'].fillna('')
+    if DRY_RUN:
+        return
+    if LOAD_MODE == 'replace':
+        with METRICS.stage(table_name, 'swap'):
+            swap_table(conn, table_name)
+    index_table(table_name, conn)
+    REJECTS.flush(table_name, conn)
+    if table_name == 'orders' and STREAM_ORDER_STATS:
+        write_order_stats(conn)
 
-    return df
 
+def write_order_stats(conn):
+    """Store the streamed order statistics in order_stats, in the orders load's transaction."""
+    global ORDER_STATS
+    from order_stats import scan_orders, write_order_stats as write
 
-def clean_customers(df):
-    """
-    Customer-specific cleaning:
-    - Normalize gender and email
-    """
-    if 'gender' in df.columns:
-        df['gender'] = df['gender'].replace({'': pd.NA, 'Unknown': pd.NA})
-    if 'email' in df.columns:
-        df['email'] = df['email'].str.lower()
-    return df
+    with METRICS.stage('orders', 'stats') as m:
+        if LOAD_MODE == 'upsert':
+            # The chunks were only the changed rows: stream the merged table once instead
+            ORDER_STATS = scan_orders(conn)
+        write(ORDER_STATS, conn, METRICS.run_id)
+        m['rows_out'] = 1
 
 
+def load_and_index(table_name, df):
+    """Whole-table load for the parallel path: load_table() and finish_table() in one transaction."""
+    with table_transaction(table_name) as conn:
+        stats = load_table(table_name, df, conn)
+        finish_table(table_name, conn)
+    return stats
 
-# =====================
 
-# Define dtype mappings for each table keep the schema consistent so when we join in sql we do not
-# have to cast
-# Data Type Mappings for SQLAlchemy
-"""
-What dtype_mapping does?
-Tells SQLAlchemy/to_sql() what PostgreSQL type to use when creating the table
-Doesn’t automatically convert pandas data — if pandas has int/float/NaN in that column, 
-it will try to cast and may cause type mismatches
-"""
+def load_workers():
+    """Tables loaded at the same time (LOAD_WORKERS where the database and key mode allow it)."""
+    if SURROGATE_KEYS or DATABASE_URL.startswith('sqlite'):
+        return 1
+    return LOAD_WORKERS or 2
 
-# Example: all IDs as VARCHAR(50)
-dtype_mapping = {
-    'customers': {'customer_id': String(50) },
-    'orders': {'order_id': String(50), 'customer_id': String(50)},
-    'products': {'product_id': String(50)},
-    'order_items': {
-        'order_item_id': String(50),
-        'order_id': String(50),
-        'product_id': String(50)
-    },
-    'reviews': {
-        'review_id': String(50),
-        'order_id': String(50),
-        'customer_id': String(50),
-        'product_id': String(50)
-    }
-}
 
 # =====================
-# ETL Loop
+# Materialized tables
 # =====================
-for table_name, file_path in table_files.items():
-    try:
-        logging.info(f"Starting ETL for table: {table_name}")
-        print(f"Starting ETL for table: {table_name}")
-
-        # Extract
-        df = pd.read_csv(file_path)
-        logging.info(f"Loaded {len(df)} rows from {file_path}")
-        print(f"Loaded {len(df)} rows from {file_path}")
-        # Generic clean
-        df = clean_dataframe(df, table_name)
-        df = clean_dataframe(df)
-
-        # Table-specific cleaning
-        if table_name == 'orders':
-            df = clean_orders(df)
-        elif table_name == 'reviews':
-            df = clean_reviews(df)
-            # df = compute_sentiment(df)
-        elif table_name == 'customers':
-            df = clean_customers(df)
-
-        # =====================
-        # Load with dtype enforcement
-        # =====================
-        df.to_sql(
-            table_name,
-            engine,
-            if_exists='replace',  # or 'append' if you want to keep manual schema
-            index=False,
-            dtype=dtype_mapping.get(table_name)  # safely returns None if no mapping 
-        )
-
-        logging.info(f"Inserted {len(df)} rows into {table_name} table in PostgreSQL")
-        print(f"Inserted {len(df)} rows into {table_name} table in PostgreSQL")
-
-    except Exception as e:
-        logging.error(f"Error in ETL for {table_name}: {e}")
-
-        print(f"Error in ETL for {table_name}: {e}")
+def refresh_materialized(loaded_tables):
+    """Refresh the tables derived from the loaded ones (RFM scores, cohort matrix, sketches, revenue cube)."""
+    import pandas as pd
+
+    if DRY_RUN:
+        return
+    previous = pd.concat(PREVIOUS_ROWS, ignore_index=True) if PREVIOUS_ROWS else None
+    for table_name, (module_name, function_name, sources) in MATERIALIZED_TABLES.items():
+        loaded = set(sources) & set(loaded_tables)
+        if not loaded:
+            continue
+        changed, changed_previous = None, None
+        if LOAD_MODE == 'upsert' and loaded <= {'orders', 'customers'}:
+            # Upserts of orders / customers are tracked per customer (CHANGED_CUSTOMERS)
+            if not CHANGED_CUSTOMERS:
+                logging.info(f"No customer changed, {table_name} is up to date")
+                continue
+            changed, changed_previous = CHANGED_CUSTOMERS, previous
+        try:
+            refresh = getattr(importlib.import_module(module_name), function_name)
+            with METRICS.stage(table_name, 'materialize') as m:
+                m['rows_out'] = refresh(get_engine(), changed, previous_rows=changed_previous)['changed']
+        except Exception as e:
+            logging.error(f"Error refreshing {table_name}: {e}")
+            print(f"Error refreshing {table_name}: {e}")
+
+
+# =====================
+# ETL Run
+# =====================
+def start_run():
+    """Set up the per-run state (KEYS, REJECTS, PARENT_KEYS, ORDER_STATS) for the current settings."""
+    global KEYS, REJECTS, PARENT_KEYS, ORDER_STATS
+    from integrity import ParentKeys
+    from keys import SurrogateKeys
+    from order_stats import OrderStats
+    from rejects import RejectSink
+
+    KEYS = SurrogateKeys(get_engine()) if SURROGATE_KEYS else None
+    # A dry run only collects and counts the rejects
+    REJECTS = RejectSink(METRICS.run_id, None if DRY_RUN else get_engine(), dtype_for=table_dtypes)
+    PARENT_KEYS = ParentKeys(stored_keys)
+    ORDER_STATS = OrderStats()
+
+
+def run(table_files):
+    """
+    Run the ETL for {table: csv path} with the current settings: skip unchanged
+    tables (manifest), extract + clean + validate + load, refresh the
+    materialized tables and print the stage summary. Returns the loaded tables.
+    """
+    global STAGE_TABLES
+    from manifest import changed_tables, load_manifest, record_tables
+    from scheduler import extract_and_clean, read_from_staging, run_parallel, tables_in_load_order
+    from staging import staging_available
+
+    if DRY_RUN:
+        STAGE_TABLES = False
+    if STAGE_TABLES and not staging_available():
+        logging.warning("pyarrow is not installed, Parquet staging is switched off")
+        print("pyarrow is not installed, Parquet staging is switched off")
+        STAGE_TABLES = False
+    start_run()
+
+    if DRY_RUN:
+        manifest, target = None, None
+        tables_to_run, table_states = dict(table_files), {}
+    else:
+        manifest = load_manifest()
+        # Surrogate and natural keys are different table layouts: track them as separate targets
+        target = get_engine().url.render_as_string(hide_password=True) + (' [surrogate keys]' if SURROGATE_KEYS else '')
+        tables_to_run, table_states = changed_tables(table_files, manifest, target,
+                                                     force=FORCE_RELOAD or LOAD_FROM_STAGING)
+
+    if CHUNK_SIZE is None and MAX_WORKERS != 1:
+        # Extract + clean in parallel (or read from staging), load in foreign-key order
+        if LOAD_FROM_STAGING:
+            job = partial(read_from_staging, staging_dir=staging_folder())
+        else:
+            job = partial(extract_and_clean, stage_mode=LOAD_MODE if STAGE_TABLES else None,
+                          staging_dir=staging_folder())
+        loaded_tables = list(run_parallel(tables_to_run, load_and_index, max_workers=MAX_WORKERS, job=job,
+                                          metrics=METRICS, rejects=REJECTS, load_workers=load_workers()))
+    else:
+        loaded_tables = []
+        for table_name in tables_in_load_order(list(tables_to_run)):
+            file_path = tables_to_run[table_name]
+            try:
+                logging.info(f"Starting ETL for table: {table_name}")
+                print(f"Starting ETL for table: {table_name}")
+
+                etl_table(table_name, file_path, CHUNK_SIZE)
+                loaded_tables.append(table_name)
+
+            except Exception as e:
+                logging.error(f"Error in ETL for {table_name}: {e}")
+
+                print(f"Error in ETL for {table_name}: {e}")
+
+    refresh_materialized(loaded_tables)
+
+    # Coerced / rejected rows still buffered go to the <table>_rejects tables
+    REJECTS.close()
+
+    # Only successfully loaded (or unchanged, skipped) tables are recorded,
+    # failed ones run again next time. Re-loads from staging and dry runs leave it alone.
+    if not LOAD_FROM_STAGING and not DRY_RUN:
+        # Unchanged tables have a state but no run; unreadable files have neither
+        skipped_tables = [t for t in table_states if t not in tables_to_run]
+        record_tables(manifest, target, table_states, loaded_tables + skipped_tables)
+
+    if METRICS.totals:
+        print(f"\nRun {METRICS.run_id} (peak MiB is the stage's own peak in its process: workers report their own)")
+        print(METRICS.summary())
+        METRICS.write_jsonl()
+    return loaded_tables
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Extract, clean and load the retail CSVs into the database.')
+    parser.add_argument('--tables', nargs='+', choices=TABLES, metavar='TABLE',
+                        help=f"tables to run (default: all of {', '.join(TABLES)})")
+    parser.add_argument('--source-dir', default=SOURCE_DIR,
+                        help='folder with <table>.csv files (default: $ETL_SOURCE_DIR or %(default)s)')
+    parser.add_argument('--engine-url', default=DATABASE_URL,
+                        help='SQLAlchemy URL of the target database (default: $ETL_DATABASE_URL, '
+                             'else PostgreSQL from $PGUSER/$PGPASSWORD/$PGHOST/$PGPORT/$PGDATABASE)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='stream the files in chunks of this many rows (default: whole files)')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                        help='worker processes for extract + clean (default: one per table, 1 = sequential)')
+    parser.add_argument('--load-workers', type=int, default=LOAD_WORKERS,
+                        help='tables loaded at the same time, each in its own transaction '
+                             '(default: 2; always 1 on SQLite or with --surrogate-keys)')
+    parser.add_argument('--load-mode', choices=['replace', 'upsert'], default=LOAD_MODE,
+                        help='replace the tables or upsert by primary key (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='extract, clean and check foreign keys only; write nothing')
+    parser.add_argument('--force', action='store_true', help='reload tables the manifest says are unchanged')
+    parser.add_argument('--from-staging', action='store_true', help='load from the Parquet staging area')
+    parser.add_argument('--surrogate-keys', action='store_true', help='load ID columns as integer surrogates')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global DATABASE_URL, CHUNK_SIZE, MAX_WORKERS, LOAD_WORKERS, LOAD_MODE, DRY_RUN, FORCE_RELOAD, \
+        LOAD_FROM_STAGING, SURROGATE_KEYS
+    args = parse_args(argv)
+
+    DATABASE_URL = args.engine_url
+    CHUNK_SIZE = args.chunk_size
+    MAX_WORKERS = args.workers
+    LOAD_WORKERS = args.load_workers
+    LOAD_MODE = args.load_mode
+    DRY_RUN = args.dry_run
+    FORCE_RELOAD = FORCE_RELOAD or args.force
+    LOAD_FROM_STAGING = LOAD_FROM_STAGING or args.from_staging
+    SURROGATE_KEYS = SURROGATE_KEYS or args.surrogate_keys
+
+    run(source_files(args.source_dir, args.tables))
+
+
+# Guarded so worker processes (spawned on Windows) can import this module safely
+if __name__ == '__main__':
+    main()
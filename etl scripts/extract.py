@@ -0,0 +1,53 @@
+import logging
+
+import pandas as pd
+
+from schemas import read_dtypes
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📥 Extract
+# ──────────────────────────────────────────────────────────────────────────────
+pd.read_csv(file_path) loads the whole file. The production orders /
+order_items extracts are 50–100x the sample files and do not fit in memory,
+so the ETL can read a file in chunks instead:
+
+    chunk_size = None    → one DataFrame with the whole file (old behaviour)
+    chunk_size = 50_000  → DataFrames of at most 50k rows each
+
+Only one chunk is cleaned and loaded at a time, so peak memory depends on
+chunk_size, not on the size of the file. Chunked reads take numeric columns
+as text: a dirty value deep in the file cannot be retried once earlier chunks
+are loaded, so cleaning coerces every chunk and tags the bad rows as rejects.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+
+def _iter_csv(file_path, chunk_size, dtype):
+    if chunk_size is None:
+        yield pd.read_csv(file_path, dtype=dtype)
+        return
+
+    with pd.read_csv(file_path, chunksize=chunk_size, dtype=dtype) as reader:
+        for chunk in reader:
+            logging.debug(f"Read chunk of {len(chunk)} rows from {file_path}")
+            yield chunk
+
+
+def iter_table(table_name, file_path, chunk_size=None):
+    """
+    Yield the CSV as DataFrames (one for the whole file, or chunk_size rows each).
+
+    Columns are read with the dtypes declared in schemas.py (no type guessing).
+    Whole files: if a numeric column holds a value that is not a number, the
+    file is read again with numeric columns as text and cleaning coerces them
+    instead. Chunks always read numeric columns as text (see above).
+    """
+    if chunk_size is not None:
+        yield from _iter_csv(file_path, chunk_size, read_dtypes(table_name, numbers_as_text=True))
+        return
+    try:
+        yield from _iter_csv(file_path, chunk_size, read_dtypes(table_name))
+    except (ValueError, TypeError) as e:
+        logging.warning(f"Typed read of {file_path} failed ({e}); reading numeric columns as text")
+        yield from _iter_csv(file_path, chunk_size, read_dtypes(table_name, numbers_as_text=True))
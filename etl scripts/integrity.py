@@ -0,0 +1,161 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from rejects import reject_rows
+from schemas import FOREIGN_KEYS
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🔗 Referential integrity (pre-load foreign-key check)
+# ──────────────────────────────────────────────────────────────────────────────
+The tables are loaded with to_sql()/COPY and no FOREIGN KEY constraints, so
+an order_items.order_id without an order used to be loaded anyway and only
+showed up later as a missing row in a join. Every foreign key in
+sql/sqlqueries.sql (schemas.FOREIGN_KEYS) is now checked on the cleaned
+frame, just before it is loaded:
+
+    orders.customer_id       → customers.customer_id
+    order_items.order_id     → orders.order_id
+    order_items.product_id   → products.product_id
+    reviews.order_id         → orders.order_id
+    reviews.customer_id      → customers.customer_id
+
+Tables are loaded parents first (scheduler.LOAD_ORDER), so ParentKeys
+collects each parent's key values from its cleaned frames as they go by and
+the children are checked with one hash-set membership test per foreign key,
+no database round trip: Arrow's is_in kernel for Arrow string columns (the
+value set is built once per parent key), the hash table of a unique pd.Index
+otherwise. 300k order_items take well under a second. A parent
+that was not loaded in this run (unchanged and skipped, or an upsert that
+only adds to it) is read from the database once: its key column only.
+
+Missing foreign keys (NULL) are allowed, like in SQL. Rows with a value that
+has no parent are not loaded: they go to the reject sink (rejects.py) and end
+up in <table>_rejects with the failing column, so they can be inspected and
+fixed at the source.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+ORPHAN_RULE = 'orphan_fk'
+
+
+def parent_columns(table_name):
+    """Columns of table_name that other tables reference (usually its primary key)."""
+    return list(dict.fromkeys(parent_column for fks in FOREIGN_KEYS.values()
+                              for _, parent, parent_column in fks if parent == table_name))
+
+
+def read_key_column(engine, table_name, column):
+    """Distinct values of one key column already in the database (empty if the table does not exist)."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(table_name):
+            return np.array([], dtype=object)
+        result = conn.execute(text(f"SELECT DISTINCT {column} FROM {table_name} WHERE {column} IS NOT NULL"))
+        return np.array([row[0] for row in result], dtype=object)
+
+
+class ParentKeys:
+    """Key values of the parent tables, as unique pd.Index hash sets (safe to share between load threads)."""
+
+    def __init__(self, read_keys):
+        self._lock = threading.RLock()
+        self.read_keys = read_keys  # (table_name, column) → keys stored in the database
+        self._parts = {}            # (table_name, column) → [arrays of keys]
+        self._index = {}            # (table_name, column) → pd.Index cache
+        self._value_sets = {}       # (table_name, column, arrow type) → pa.Array cache
+        self._unread = set()        # keys whose stored values are still to be read (upsert)
+
+    def start(self, table_name, keep_stored=False):
+        """
+        A load of table_name begins: forget its keys (replace load) or start
+        from the keys already stored (upsert, the new rows are added to them).
+        """
+        with self._lock:
+            for column in parent_columns(table_name):
+                key = (table_name, column)
+                self._parts[key] = []
+                # Read lazily: only if a child table is checked against it later on
+                if keep_stored:
+                    self._unread.add(key)
+                else:
+                    self._unread.discard(key)
+                self._forget(key)
+
+    def add(self, table_name, df):
+        """Remember the key values of rows that are about to be loaded into table_name."""
+        with self._lock:
+            for column in parent_columns(table_name):
+                key = (table_name, column)
+                if column in df.columns and key in self._parts:
+                    self._parts[key].append(df[column].dropna().to_numpy(dtype=object))
+                    self._forget(key)
+
+    def _forget(self, key):
+        self._index.pop(key, None)
+        self._value_sets = {k: v for k, v in self._value_sets.items() if k[:2] != key}
+
+    def keys(self, table_name, column):
+        key = (table_name, column)
+        with self._lock:
+            if key not in self._index:
+                if key not in self._parts or key in self._unread:  # parent not (fully) loaded in this run
+                    self._parts[key] = [self.read_keys(table_name, column)] + self._parts.get(key, [])
+                    self._unread.discard(key)
+                parts = self._parts[key]
+                values = np.concatenate(parts) if parts else np.array([], dtype=object)
+                self._index[key] = pd.Index(pd.unique(values))
+            return self._index[key]
+
+    def contains(self, table_name, column, values):
+        """Boolean array: which of values (a Series) are keys of table_name.column."""
+        keys = self.keys(table_name, column)
+        if pa is not None and isinstance(values.dtype, (pd.ArrowDtype, pd.StringDtype)) \
+                and getattr(values.dtype, 'storage', 'pyarrow') == 'pyarrow':
+            arrow_values = pa.chunked_array(pa.array(values.array))
+            cache_key = (table_name, column, str(arrow_values.type))
+            with self._lock:
+                if cache_key not in self._value_sets:
+                    self._value_sets[cache_key] = pa.array(keys.to_numpy(dtype=object), type=arrow_values.type)
+                value_set = self._value_sets[cache_key]
+            member = pc.is_in(arrow_values, value_set=value_set)
+            return member.to_numpy(zero_copy_only=False).astype(bool)
+        return keys.get_indexer(values.to_numpy(dtype=object)) >= 0
+
+
+def check_foreign_keys(table_name, df, parent_keys):
+    """
+    Split df into the rows whose foreign keys all have a parent and the
+    orphans. Returns (rows to load, rejects); rejects carry ORPHAN_RULE in
+    reject_rule, the first failing column and its value (see rejects.py).
+    """
+    failed_column = np.full(len(df), None, dtype=object)
+    for column, parent, parent_column in FOREIGN_KEYS.get(table_name, []):
+        if column not in df.columns:
+            continue
+        values = df[column]
+        orphan = values.notna().to_numpy(dtype=bool) & ~parent_keys.contains(parent, parent_column, values)
+        orphan &= failed_column == None  # noqa: E711 (element-wise: keep the first failing column)
+        if orphan.any():
+            failed_column[orphan] = column
+            logging.warning(f"{table_name}.{column}: {int(orphan.sum())} rows without a parent in "
+                            f"{parent}.{parent_column}")
+
+    rejected = failed_column != None  # noqa: E711
+    if not rejected.any():
+        return df, df.iloc[:0]
+    rejects = df[rejected]
+    failed = failed_column[rejected]
+    values = np.empty(len(rejects), dtype=object)
+    for column in pd.unique(failed):
+        values[failed == column] = rejects[column].to_numpy(dtype=object)[failed == column]
+    return df[~rejected], reject_rows(rejects, ORPHAN_RULE, failed, values)
@@ -0,0 +1,134 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, String, inspect, text
+
+from loaders import ensure_indexes, load_dataframe
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🔑 Surrogate keys (compact-key mode)
+# ──────────────────────────────────────────────────────────────────────────────
+IDs are loaded as VARCHAR(50) and held as strings in pandas, so every join
+compares variable-length text. With SURROGATE_KEYS = True in etl_pipeline.py
+each ID column is replaced by a 32-bit integer just before it is loaded:
+
+    order_items.order_item_id   'oiid1' → 1, 'oiid2' → 2, ...
+    reviews.review_id           'r1'    → 1, ...
+    orders.customer_id          '22728' → surrogate of customer '22728'
+
+Every ID column belongs to a key domain (customer, order, product, ...), so
+orders.customer_id and reviews.customer_id get the same surrogate as
+customers.customer_id. Each domain's natural key → surrogate map lives in
+the database (key_map_<domain>, indexed both ways) for lookups and joins
+back to the original IDs, and is never touched by replace loads, so
+surrogates stay stable across runs. New natural keys get the next free
+numbers in order of first appearance.
+
+Encoding runs in the parent process, which loads tables one at a time in
+foreign-key order, so parallel workers never hand out the same number twice.
+Parquet staging keeps the natural keys.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+# ID column → key domain
+KEY_DOMAINS = {
+    'customer_id': 'customer',
+    'order_id': 'order',
+    'product_id': 'product',
+    'order_item_id': 'order_item',
+    'review_id': 'review',
+}
+
+SURROGATE_DTYPE = 'Int32'
+SURROGATE_MAX = np.iinfo('int32').max
+
+
+def key_map_table(domain):
+    return f"key_map_{domain}"
+
+
+def key_sql_type(s):
+    """SQL type for a key column: INTEGER for surrogates, VARCHAR(50) for natural keys."""
+    return Integer() if pd.api.types.is_integer_dtype(s.dtype) else String(50)
+
+
+class SurrogateKeys:
+    """Natural key ↔ surrogate maps of all domains, cached for the run."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._maps = {}  # domain → pd.Series(surrogate, index=natural key)
+
+    def _load(self, domain):
+        if domain not in self._maps:
+            table_name = key_map_table(domain)
+            with self.engine.connect() as conn:
+                if inspect(conn).has_table(table_name):
+                    stored = pd.read_sql(text(f"SELECT natural_key, surrogate FROM {table_name}"), conn)
+                    mapping = pd.Series(stored['surrogate'].to_numpy('int64'), index=stored['natural_key'].astype(str))
+                else:
+                    mapping = pd.Series(dtype='int64', index=pd.Index([], dtype=object))
+            self._maps[domain] = mapping
+        return self._maps[domain]
+
+    def forget(self):
+        """Drop the cached maps (after a rolled back load they may hold keys that were never stored)."""
+        self._maps.clear()
+
+    def _extend(self, domain, natural_keys, bind=None):
+        """
+        Give new natural keys the next surrogates and store them (in bind's
+        transaction when it is a Connection); returns the domain's map.
+        """
+        bind = bind if bind is not None else self.engine
+        mapping = self._load(domain)
+        start = int(mapping.max()) + 1 if len(mapping) else 1
+        if start + len(natural_keys) - 1 > SURROGATE_MAX:
+            raise OverflowError(f"key domain {domain} ran out of 32-bit surrogates")
+
+        new = pd.DataFrame({'natural_key': natural_keys,
+                            'surrogate': np.arange(start, start + len(natural_keys), dtype='int64')})
+        table_name = key_map_table(domain)
+        load_dataframe(new, table_name, bind,
+                       dtype={'natural_key': String(50), 'surrogate': Integer()}, if_exists='append', report=False)
+        ensure_indexes(bind, table_name, [('primary', ['natural_key']), ('unique', ['surrogate'])],
+                       report=False)
+        logging.info(f"{table_name}: {len(new)} new keys ({start}..{start + len(new) - 1})")
+
+        mapping = pd.concat([mapping, pd.Series(new['surrogate'].to_numpy(), index=new['natural_key'])])
+        self._maps[domain] = mapping
+        return mapping
+
+    def encode_column(self, domain, s, bind=None):
+        """Surrogates for a column of natural keys (missing stays <NA>)."""
+        natural = s.astype(object).where(s.notna(), None)
+        present = natural.notna().to_numpy()
+        mapping = self._load(domain)
+
+        positions = np.full(len(s), -1, dtype='int64')
+        positions[present] = mapping.index.get_indexer(natural[present].astype(str))
+        unknown = present & (positions == -1)
+        if unknown.any():
+            # pd.unique keeps first-appearance order, so 'oiid1' → 1, 'oiid2' → 2, ...
+            new_keys = pd.unique(natural[unknown].astype(str))
+            mapping = self._extend(domain, new_keys, bind)
+            positions[unknown] = mapping.index.get_indexer(natural[unknown].astype(str))
+
+        surrogates = np.zeros(len(s), dtype='int64')
+        surrogates[present] = mapping.to_numpy()[positions[present]]
+        surrogates = pd.array(surrogates, dtype=SURROGATE_DTYPE)
+        surrogates[~present] = pd.NA
+        return pd.Series(surrogates, index=s.index, name=s.name)
+
+    def encode(self, df, bind=None):
+        """Copy of df with every ID column (KEY_DOMAINS) replaced by its surrogates."""
+        id_columns = [col for col in df.columns if col in KEY_DOMAINS]
+        return df.assign(**{col: self.encode_column(KEY_DOMAINS[col], df[col], bind) for col in id_columns})
+
+    def decode(self, domain, surrogates):
+        """Natural keys for a column of surrogates (e.g. to label a dashboard extract)."""
+        mapping = self._load(domain)
+        natural = pd.Series(mapping.index.to_numpy(), index=mapping.to_numpy())
+        return pd.Series(surrogates).map(natural)
@@ -0,0 +1,479 @@
+import csv
+import io
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+from sqlalchemy import LargeBinary, bindparam, event, inspect, make_url, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🚚 Loaders
+# ──────────────────────────────────────────────────────────────────────────────
+df.to_sql() sends rows to PostgreSQL as INSERT statements (row by row through
+executemany). For big tables like order_items (~300k rows) that is the slowest
+step of the run.
+
+PostgreSQL has COPY FROM STDIN which takes a whole CSV stream in one command.
+load_dataframe() picks the path from the engine:
+
+    PostgreSQL   → create the table from dtype_mapping, then COPY the rows in
+    anything else (SQLite, ...) → plain df.to_sql() in batches
+
+Both paths report rows/sec so the slow tables are easy to spot.
+
+upsert_dataframe() is the incremental mode: instead of dropping and
+rebuilding the table, the rows are bulk-loaded into a staging table and merged
+with INSERT ... ON CONFLICT (primary key) DO UPDATE. Rows that did not change
+are skipped, so a daily delta only writes the new / changed rows.
+
+Every function that writes takes an Engine (one transaction per call) or a
+Connection: then it runs inside the caller's transaction, so the pipeline
+can load all chunks of a table, its indexes and its rejects as one unit on
+one pooled connection. A replace load goes into <table>__load and
+swap_table() puts it in place of the old table just before the commit:
+readers see the old table, then the complete new one, never a half-loaded
+one, and PostgreSQL holds the exclusive lock only from the swap to the
+commit instead of for the whole load.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+
+# =====================
+# Settings
+# =====================
+# NULL marker used in the COPY stream. With FORMAT csv an unquoted empty field
+# would also be NULL, but then empty strings (review_text = '') would be lost.
+COPY_NULL = '\\N'
+
+# Rows written to the COPY stream per batch (keeps the CSV text buffer small)
+COPY_BATCH_ROWS = 50_000
+
+# Rows per executemany batch for the to_sql fallback
+TO_SQL_CHUNKSIZE = 10_000
+
+# Keys per DELETE / SELECT ... WHERE key IN (...) statement (SQLite caps bound parameters)
+KEY_BATCH_SIZE = 5_000
+
+# Suffix of the table a replace load writes into before swap_table()
+LOAD_SUFFIX = '__load'
+
+
+# =====================
+# Connection pool
+# =====================
+# Pooled connections: one per table loaded at the same time plus the parent's
+# own reads (stored keys, key maps); overflow covers short-lived extra ones
+POOL_SIZE = 4
+POOL_MAX_OVERFLOW = 2
+
+# Server connections older than this are replaced (idle timeouts of servers / firewalls)
+POOL_RECYCLE_SECONDS = 1800
+
+
+def engine_options(url, load_workers=1):
+    """
+    create_engine() keyword arguments tuned for the bulk loads: a pool big
+    enough for load_workers concurrent table loads, pre-ping and recycling on
+    server databases, and multi-row INSERT pages of TO_SQL_CHUNKSIZE rows
+    for executemany (insertmanyvalues); psycopg2 also batches the
+    executemany UPDATE / DELETE statements instead of one round trip per row.
+    """
+    url = make_url(url)
+    options = {
+        'pool_size': max(POOL_SIZE, load_workers + 1),
+        'max_overflow': POOL_MAX_OVERFLOW,
+        'insertmanyvalues_page_size': TO_SQL_CHUNKSIZE,
+    }
+    if url.get_backend_name() != 'sqlite':
+        options.update(pool_pre_ping=True, pool_recycle=POOL_RECYCLE_SECONDS)
+    if url.get_driver_name() == 'psycopg2':
+        options.update(executemany_mode='values_plus_batch', executemany_batch_page_size=TO_SQL_CHUNKSIZE)
+    return options
+
+
+def transactional_sqlite(engine):
+    """
+    The sqlite3 driver only opens a transaction before INSERT / UPDATE /
+    DELETE, so a CREATE TABLE ahead of them commits on its own and survives
+    a rollback. Let SQLAlchemy emit BEGIN itself instead (the recipe from the
+    SQLAlchemy SQLite docs), so DDL is part of the load's transaction too.
+    """
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    @event.listens_for(engine, 'connect')
+    def _no_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+    return engine
+
+
+@contextmanager
+def _transaction(bind):
+    """A Connection as is (the caller owns the transaction), else engine.begin()."""
+    if isinstance(bind, Connection):
+        yield bind
+    else:
+        with bind.begin() as conn:
+            yield conn
+
+
+def savepoint(bind):
+    """
+    SAVEPOINT on a Connection, so a failing statement (e.g. a duplicate key
+    in an index) only rolls back itself and not the caller's transaction.
+    """
+    return bind.begin_nested() if isinstance(bind, Connection) else nullcontext()
+
+
+class _CsvStream(io.RawIOBase):
+    """
+    File-like object that renders a DataFrame to CSV lazily, one batch of
+    rows at a time, so the full CSV text is never held in memory.
+    cursor.copy_expert() just keeps calling read() until it gets b''.
+    """
+
+    def __init__(self, df, batch_rows=COPY_BATCH_ROWS, binary_columns=()):
+        self._df = df
+        self._batch_rows = batch_rows
+        self._binary_columns = list(binary_columns)
+        self._start = 0
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def _next_batch(self):
+        batch = self._df.iloc[self._start:self._start + self._batch_rows]
+        self._start += self._batch_rows
+        if self._binary_columns:
+            # bytea input in hex format: \x0a1b...
+            batch = batch.assign(**{col: batch[col].map(_bytea_text) for col in self._binary_columns})
+        text = batch.to_csv(index=False, header=False, na_rep=COPY_NULL,
+                            quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+        return text.encode('utf-8')
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and self._start < len(self._df):
+            self._buffer += self._next_batch()
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def _bytea_text(value):
+    return None if value is None else '\\x' + bytes(value).hex()
+
+
+def _copy_rows(conn, df, table_name, dtype, if_exists):
+    """
+    PostgreSQL path:
+    1. df.head(0).to_sql() creates (or replaces) the table using dtype_mapping,
+       so the column types are exactly what the old to_sql() load produced
+    2. COPY ... FROM STDIN streams all rows in one command
+
+    Runs on the caller's connection, so both steps share one transaction and
+    a failed COPY leaves the old table.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ', '.join(quote(col) for col in df.columns)
+    copy_sql = (
+        f"COPY {quote(table_name)} ({columns}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    )
+
+    df.head(0).to_sql(table_name, conn, if_exists=if_exists, index=False, dtype=dtype)
+    cursor = conn.connection.cursor()
+    try:
+        binary_columns = [col for col, sql_type in (dtype or {}).items() if isinstance(sql_type, LargeBinary)]
+        cursor.copy_expert(copy_sql, _CsvStream(df, binary_columns=binary_columns))
+    finally:
+        cursor.close()
+
+
+def _to_sql_rows(conn, df, table_name, dtype, if_exists):
+    """Fallback for engines without COPY (SQLite for local runs and tests)."""
+    df.to_sql(table_name, conn, if_exists=if_exists, index=False,
+              dtype=dtype, chunksize=TO_SQL_CHUNKSIZE)
+
+
+def _bulk_insert(conn, df, table_name, dtype, if_exists):
+    """COPY on PostgreSQL, to_sql() elsewhere, inside the caller's transaction."""
+    if conn.dialect.name == 'postgresql':
+        _copy_rows(conn, df, table_name, dtype, if_exists)
+    else:
+        _to_sql_rows(conn, df, table_name, dtype, if_exists)
+
+
+def load_dataframe(df, table_name, engine, dtype=None, if_exists='replace', report=True):
+    """
+    Load a cleaned DataFrame into table_name.
+
+    - PostgreSQL engines use COPY FROM STDIN (fast bulk path)
+    - Other engines fall back to df.to_sql()
+    - dtype is the dtype_mapping entry for the table (can be None)
+    - if_exists='append' adds the rows to an existing table (streaming mode)
+    - report=False skips the per-call print (e.g. one line per chunk is too much)
+    - engine can be a Connection: the rows are then part of its transaction
+
+    Returns a dict with rows, seconds and rows_per_sec for the table.
+    """
+    start = time.perf_counter()
+
+    with _transaction(engine) as conn:
+        _bulk_insert(conn, df, table_name, dtype, if_exists)
+
+    seconds = time.perf_counter() - start
+    rows = len(df)
+    rows_per_sec = rows / seconds if seconds > 0 else float('inf')
+
+    if report:
+        logging.info(f"Inserted {rows} rows into {table_name} in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+        print(f"Inserted {rows} rows into {table_name} in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+    else:
+        logging.debug(f"Inserted {rows} rows into {table_name} in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+
+    return {'table': table_name, 'rows': rows, 'seconds': seconds, 'rows_per_sec': rows_per_sec}
+
+
+def load_table_name(table_name):
+    return f"{table_name}{LOAD_SUFFIX}"
+
+
+def swap_table(conn, table_name):
+    """
+    Put <table>__load (filled by a replace load) in place of table_name, in
+    the caller's transaction: DROP the old table, RENAME the new one. Other
+    sessions keep reading the old table until the commit.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text(f"DROP TABLE IF EXISTS {quote(table_name)}"))
+    conn.execute(text(f"ALTER TABLE {quote(load_table_name(table_name))} RENAME TO {quote(table_name)}"))
+
+
+# =====================
+# Indexes
+# =====================
+# A 'brin' index is only worth it when the table is stored (nearly) in the
+# column's order; below this |correlation| (pg_stats) a btree is built instead
+BRIN_MIN_CORRELATION = 0.9
+
+
+def index_name(table_name, kind, columns):
+    # 'ux_' for unique / primary key indexes (the name upserts rely on), 'ix_' otherwise
+    prefix = 'ux' if kind in ('primary', 'unique') else 'ix'
+    return f"{prefix}_{table_name}_{'_'.join(columns)}"
+
+
+def _correlation(conn, table_name, column):
+    row = conn.execute(
+        text("SELECT correlation FROM pg_stats WHERE tablename = :table AND attname = :column"),
+        {'table': table_name, 'column': column},
+    ).first()
+    return abs(row[0]) if row and row[0] is not None else 0.0
+
+
+def _index_sql(conn, table_name, kind, columns):
+    quote = conn.dialect.identifier_preparer.quote
+    name = quote(index_name(table_name, kind, columns))
+    cols = ', '.join(quote(col) for col in columns)
+    target = quote(table_name)
+    postgres = conn.dialect.name == 'postgresql'
+
+    if kind in ('primary', 'unique'):
+        statements = [f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {target} ({cols})"]
+        if kind == 'primary' and postgres:
+            # Promote the unique index to the table's primary key (SQLite cannot ALTER one in)
+            statements.append(f"ALTER TABLE {target} ADD CONSTRAINT {name} PRIMARY KEY USING INDEX {name}")
+        return statements
+    if kind == 'brin' and postgres and _correlation(conn, table_name, columns[0]) >= BRIN_MIN_CORRELATION:
+        return [f"CREATE INDEX IF NOT EXISTS {name} ON {target} USING brin ({cols})"]
+    return [f"CREATE INDEX IF NOT EXISTS {name} ON {target} ({cols})"]
+
+
+def ensure_indexes(engine, table_name, indexes, report=True):
+    """
+    Build the declared indexes of a table that are missing, after a load.
+    indexes is [(kind, columns)] with kind 'primary', 'unique', 'btree' or
+    'brin' (schemas.declared_indexes). The table is ANALYZEd first, so the
+    planner has fresh statistics and BRIN can check the physical order.
+    Each index gets its own transaction (a savepoint when engine is a
+    Connection): one failing (e.g. duplicate keys) is logged and does not
+    stop the others. Returns the created index names.
+    """
+    with _transaction(engine) as conn:
+        if not inspect(conn).has_table(table_name):
+            return []
+        conn.execute(text(f"ANALYZE {conn.dialect.identifier_preparer.quote(table_name)}"))
+        inspector = inspect(conn)
+        existing = {index['name'] for index in inspector.get_indexes(table_name)}
+        has_primary_key = inspector.get_pk_constraint(table_name).get('constrained_columns')
+        postgres = conn.dialect.name == 'postgresql'
+
+    created = []
+    for kind, columns in indexes:
+        name = index_name(table_name, kind, columns)
+        if kind == 'primary' and postgres:
+            # The ux_ index may exist already (made by an upsert) without being the primary key yet
+            done = bool(has_primary_key)
+        else:
+            done = name in existing
+        if done:
+            continue
+        try:
+            with _transaction(engine) as conn, savepoint(conn):
+                for statement in _index_sql(conn, table_name, kind, columns):
+                    conn.execute(text(statement))
+            created.append(name)
+        except SQLAlchemyError as e:
+            logging.warning(f"Could not create index {name} on {table_name}: {e}")
+            print(f"Could not create index {name} on {table_name}: {e}")
+
+    if created and report:
+        logging.info(f"Created indexes on {table_name}: {', '.join(created)}")
+        print(f"Created indexes on {table_name}: {', '.join(created)}")
+    return created
+
+
+# =====================
+# Incremental (upsert) load
+# =====================
+def _distinct_sql(dialect_name, left, right):
+    # PostgreSQL: IS DISTINCT FROM, SQLite: IS NOT (both treat NULL = NULL as equal)
+    if dialect_name == 'postgresql':
+        return f"{left} IS DISTINCT FROM {right}"
+    return f"{left} IS NOT {right}"
+
+
+def _ensure_unique_key(conn, table_name, key_columns):
+    """ON CONFLICT needs a unique index on the key (to_sql() never creates one)."""
+    quote = conn.dialect.identifier_preparer.quote
+    keys = ', '.join(quote(col) for col in key_columns)
+    name = quote(index_name(table_name, 'unique', key_columns))
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {quote(table_name)} ({keys})"))
+
+
+def _merge_staging(conn, table_name, staging_name, columns, key_columns):
+    """
+    INSERT the staged rows; on a key conflict UPDATE only when some column
+    differs. RETURNING gives back the keys of rows that were inserted or
+    actually changed.
+    """
+    dialect_name = conn.dialect.name
+    quote = conn.dialect.identifier_preparer.quote
+    target = quote(table_name)
+    cols = ', '.join(quote(col) for col in columns)
+    keys = ', '.join(quote(col) for col in key_columns)
+    value_cols = [col for col in columns if col not in key_columns]
+
+    if value_cols:
+        updates = ', '.join(f"{quote(col)} = excluded.{quote(col)}" for col in value_cols)
+        changed = ' OR '.join(
+            _distinct_sql(dialect_name, f"{target}.{quote(col)}", f"excluded.{quote(col)}")
+            for col in value_cols
+        )
+        on_conflict = f"DO UPDATE SET {updates} WHERE {changed}"
+    else:
+        on_conflict = "DO NOTHING"
+
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as part of the SELECT
+    merge_sql = (
+        f"INSERT INTO {target} ({cols}) "
+        f"SELECT {cols} FROM {quote(staging_name)} WHERE true "
+        f"ON CONFLICT ({keys}) {on_conflict} "
+        f"RETURNING {keys}"
+    )
+    result = conn.execute(text(merge_sql))
+    return pd.DataFrame(result.fetchall(), columns=key_columns)
+
+
+def upsert_dataframe(df, table_name, engine, key_columns, dtype=None, report=True):
+    """
+    Incremental load keyed on the primary key:
+
+    1. Drop duplicate keys in the batch (last one wins)
+    2. New table → plain bulk load + unique key index, every row counts as new
+    3. Existing table → bulk-load into <table>_staging (COPY on PostgreSQL),
+       merge with INSERT ... ON CONFLICT DO UPDATE, drop the staging table
+
+    Everything runs in one transaction (the caller's when engine is a
+    Connection). Returns the same dict as
+    load_dataframe() plus 'changed' (row count) and 'changed_keys' (DataFrame
+    of the inserted / updated keys, for refreshing downstream tables).
+    """
+    start = time.perf_counter()
+    df = df.drop_duplicates(subset=key_columns, keep='last')
+    staging_name = f"{table_name}_staging"
+
+    with _transaction(engine) as conn:
+        if not inspect(conn).has_table(table_name):
+            _bulk_insert(conn, df, table_name, dtype, 'replace')
+            _ensure_unique_key(conn, table_name, key_columns)
+            changed_keys = df[key_columns].reset_index(drop=True)
+        else:
+            _ensure_unique_key(conn, table_name, key_columns)
+            _bulk_insert(conn, df, staging_name, dtype, 'replace')
+            changed_keys = _merge_staging(conn, table_name, staging_name, list(df.columns), key_columns)
+            conn.execute(text(f"DROP TABLE {conn.dialect.identifier_preparer.quote(staging_name)}"))
+
+    seconds = time.perf_counter() - start
+    rows = len(df)
+    changed = len(changed_keys)
+    rows_per_sec = rows / seconds if seconds > 0 else float('inf')
+
+    if report:
+        logging.info(f"Upserted {rows} rows into {table_name} ({changed} new/changed) in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+        print(f"Upserted {rows} rows into {table_name} ({changed} new/changed) in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+    else:
+        logging.debug(f"Upserted {rows} rows into {table_name} ({changed} new/changed) in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+
+    return {'table': table_name, 'rows': rows, 'seconds': seconds, 'rows_per_sec': rows_per_sec,
+            'changed': changed, 'changed_keys': changed_keys}
+
+
+def delete_rows(engine, table_name, key_columns, keys):
+    """
+    DELETE rows by key; returns the number of rows deleted.
+    keys is a DataFrame with the key_columns. A single key column is deleted
+    with batched "key IN (...)", composite keys with one statement per row.
+    """
+    if keys.empty:
+        return 0
+    with _transaction(engine) as conn:
+        quote = conn.dialect.identifier_preparer.quote
+        if len(key_columns) == 1:
+            values = keys[key_columns[0]].tolist()
+            statement = text(f"DELETE FROM {quote(table_name)} WHERE {quote(key_columns[0])} IN :keys")
+            statement = statement.bindparams(bindparam('keys', expanding=True))
+            return sum(conn.execute(statement, {'keys': values[start:start + KEY_BATCH_SIZE]}).rowcount
+                       for start in range(0, len(values), KEY_BATCH_SIZE))
+
+        where = ' AND '.join(f"{quote(col)} = :{col}" for col in key_columns)
+        params = keys[key_columns].astype(object).to_dict('records')
+        return conn.execute(text(f"DELETE FROM {quote(table_name)} WHERE {where}"), params).rowcount
+
+
+def read_by_keys(conn, sql, key_expr, values, **read_sql_kwargs):
+    """
+    pd.read_sql(sql + " WHERE <key_expr> IN (...)") for a list of keys, in
+    batches of KEY_BATCH_SIZE. sql must not have a WHERE clause of its own.
+    """
+    statement = text(f"{sql} WHERE {key_expr} IN :keys").bindparams(bindparam('keys', expanding=True))
+    values = list(values)
+    batches = [
+        pd.read_sql(statement, conn, params={'keys': values[start:start + KEY_BATCH_SIZE]}, **read_sql_kwargs)
+        for start in range(0, len(values), KEY_BATCH_SIZE)
+    ]
+    if not batches:
+        # No keys: same columns, no rows
+        return pd.read_sql(text(f"{sql} WHERE 1 = 0"), conn, **read_sql_kwargs)
+    return pd.concat(batches, ignore_index=True)
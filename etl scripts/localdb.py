@@ -0,0 +1,255 @@
+import argparse
+import logging
+import os
+import re
+
+import pandas as pd
+
+from cohorts import ROWS_SQL, active_cells, build_matrix, cohort_sizes
+from revenue_cube import FACT_SQL, build_cube
+from rfm import ORDERS_SQL, aggregate_orders, score_rfm
+from schemas import TABLE_SCHEMAS
+from staging import PARTITIONS, STAGING_DIR, has_staged, staged_dataset
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🦆 Local query engine (DuckDB over the staged data)
+# ──────────────────────────────────────────────────────────────────────────────
+The EDA queries and views in sql/sqlqueries.sql need the PostgreSQL server.
+With DuckDB installed (pip install duckdb, optional) they also run
+in-process on a laptop, straight from the Parquet staging area:
+
+    con = connect()                                  # staging → DuckDB views
+    run_script(con)                                  # the whole sqlqueries.sql
+    create_views(con)                                # or only its views
+    query("SELECT * FROM vw_statics", con)           # one query → DataFrame
+
+connect() registers every staged table as a view over its Arrow dataset
+(nothing is copied; DuckDB reads only the columns and row groups a query
+needs), with the date columns as DATE like in PostgreSQL. Cleaned
+DataFrames can be passed instead of the staging area. customer_rfm and
+cohort_retention and revenue_cube, which the ETL materializes on the server,
+are computed with the same code (rfm.py, cohorts.py, revenue_cube.py) so
+their views and queries work too.
+
+Compatibility with the PostgreSQL dialect:
+- DATE_TRUNC, COUNT(*) FILTER (WHERE ...), PERCENTILE_CONT(...) WITHIN
+  GROUP, INTERVAL arithmetic, SPLIT_PART and date - date run as they are
+- PG_REWRITES fix what DuckDB reads differently: ::numeric without a
+  precision (DECIMAL(18,3) in DuckDB, so ROUND(x::numeric, 2) would round
+  twice) and ::float (a 4-byte REAL in DuckDB, double in PostgreSQL)
+- DUCKDB_SETTINGS: NULLs sort last ascending and first descending, and
+  integer / integer truncates, like in PostgreSQL
+- statements that change the server (CREATE TABLE / INDEX / DATABASE,
+  ALTER, UPDATE, ...) are skipped by run_script(): the local tables are
+  read-only views
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+SQL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'sqlqueries.sql')
+
+# Session settings that make DuckDB answer like PostgreSQL
+DUCKDB_SETTINGS = {
+    'default_null_order': 'nulls_last_on_asc_first_on_desc',
+    'integer_division': True,
+}
+
+# PostgreSQL syntax → DuckDB (pattern, replacement), applied to every statement
+PG_REWRITES = [
+    (re.compile(r'::\s*numeric\b(?!\s*\()', re.IGNORECASE), '::DECIMAL(38, 10)'),
+    (re.compile(r'::\s*float\b(?!\s*\()', re.IGNORECASE), '::DOUBLE'),
+]
+
+# Statements that (re)define the views of the SQL script
+VIEW_DDL = re.compile(r'^\s*(create\s+(or\s+replace\s+)?view|drop\s+view)\b', re.IGNORECASE)
+
+# Statements that return rows
+READS = re.compile(r'^\s*\(*\s*(select|with|values|table|show|describe|summarize|explain)\b', re.IGNORECASE)
+
+# Statements that change the server's tables or schema (skipped by run_script)
+SERVER_ONLY = re.compile(
+    r'^\s*(create\s+database|create\s+table|create\s+(unique\s+)?index|alter\s+table|drop\s+table'
+    r'|update|insert|delete|truncate)\b',
+    re.IGNORECASE,
+)
+
+
+def duckdb_available():
+    return duckdb is not None
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise ImportError("The local query engine needs DuckDB: pip install duckdb")
+
+
+# =====================
+# Tables
+# =====================
+def _register(con, table_name, source, date_columns=(), drop_columns=()):
+    """View table_name over source (DataFrame / Arrow dataset), date columns cast to DATE."""
+    source_name = f"{table_name}__source"
+    con.register(source_name, source)
+    columns = {row[0] for row in con.execute(f"DESCRIBE {source_name}").fetchall()}
+    exclude = [col for col in drop_columns if col in columns]
+    dates = [col for col in date_columns if col in columns]
+    select = '*'
+    if exclude:
+        select += f" EXCLUDE ({', '.join(exclude)})"
+    if dates:
+        select += f" REPLACE ({', '.join(f'CAST({col} AS DATE) AS {col}' for col in dates)})"
+    con.execute(f"CREATE OR REPLACE VIEW {table_name} AS SELECT {select} FROM {source_name}")
+
+
+def _date_columns(table_name):
+    return [col for col, kind in TABLE_SCHEMAS.get(table_name, {}).items() if kind == 'date']
+
+
+def _register_materialized(con):
+    """customer_rfm, cohort_retention and revenue_cube, computed like the ETL does after a load."""
+    scored = score_rfm(aggregate_orders(con.execute(ORDERS_SQL).df()))
+    _register(con, 'customer_rfm', scored, date_columns=['last_order_date'])
+    matrix = build_matrix(active_cells(con.execute(ROWS_SQL).df()),
+                          cohort_sizes(con.execute("SELECT signup_date FROM customers").df()))
+    _register(con, 'cohort_retention', matrix, date_columns=['cohort_month'])
+    if {'order_items', 'products'} <= {row[0] for row in con.execute("SHOW TABLES").fetchall()}:
+        _register(con, 'revenue_cube', build_cube(con.execute(FACT_SQL).df()), date_columns=['order_date'])
+
+
+def connect(tables=None, staging_dir=STAGING_DIR, materialized=True):
+    """
+    In-memory DuckDB with the retail tables as views: tables is {table name:
+    cleaned DataFrame}, the others come from the staging area when staged.
+    materialized=False skips customer_rfm / cohort_retention / revenue_cube.
+    """
+    _require_duckdb()
+    con = duckdb.connect()
+    for name, value in DUCKDB_SETTINGS.items():
+        con.execute(f"SET {name} = {value!r}" if isinstance(value, str) else f"SET {name} = {str(value).lower()}")
+
+    tables = dict(tables or {})
+    registered = []
+    for table_name in TABLE_SCHEMAS:
+        if table_name in tables:
+            source = tables[table_name]
+        elif has_staged(table_name, staging_dir):
+            source = staged_dataset(table_name, staging_dir)
+        else:
+            continue
+        partition_column = PARTITIONS.get(table_name, (None, None))[1]
+        _register(con, table_name, source, _date_columns(table_name),
+                  drop_columns=[partition_column] if partition_column else [])
+        registered.append(table_name)
+
+    if materialized and {'customers', 'orders'} <= set(registered):
+        _register_materialized(con)
+    logging.info(f"DuckDB tables: {', '.join(registered)}")
+    return con
+
+
+# =====================
+# Queries
+# =====================
+def translate(sql):
+    """A PostgreSQL statement rewritten for DuckDB (see PG_REWRITES)."""
+    for pattern, replacement in PG_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def split_statements(script):
+    """Statements of a SQL script, without comments (-- and /* */), split at ';' outside quotes."""
+    statements, current = [], []
+    i, n = 0, len(script)
+    while i < n:
+        ch = script[i]
+        if script.startswith('--', i):
+            end = script.find('\n', i)
+            i = n if end == -1 else end
+        elif script.startswith('/*', i):
+            end = script.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            current.append(' ')
+        elif ch in ("'", '"'):
+            end = i + 1
+            while end < n and not (script[end] == ch and not script.startswith(ch * 2, end)):
+                end += 2 if script.startswith(ch * 2, end) else 1
+            current.append(script[i:end + 1])
+            i = end + 1
+        elif ch == ';':
+            statements.append(''.join(current).strip())
+            current = []
+            i += 1
+        else:
+            current.append(ch)
+            i += 1
+    statements.append(''.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def query(sql, con):
+    """Run one PostgreSQL-dialect statement; returns its rows as a DataFrame (None if it has none)."""
+    result = con.execute(translate(sql))
+    return result.df() if READS.match(sql) else None
+
+
+def run_script(con, path=SQL_PATH):
+    """
+    Run every statement of a SQL file (sqlqueries.sql by default). Returns
+    [{'sql', 'result', 'error', 'skipped'}] in file order; a failing
+    statement is logged and the next one runs.
+    """
+    with open(path, encoding='utf-8') as f:
+        statements = split_statements(f.read())
+
+    results = []
+    for sql in statements:
+        entry = {'sql': sql, 'result': None, 'error': None, 'skipped': bool(SERVER_ONLY.match(sql))}
+        if not entry['skipped']:
+            try:
+                entry['result'] = query(sql, con)
+            except duckdb.Error as e:
+                entry['error'] = str(e).splitlines()[0]
+                logging.warning(f"Local query failed: {' '.join(sql.split())[:80]}: {entry['error']}")
+        results.append(entry)
+    return results
+
+
+def create_views(con, path=SQL_PATH):
+    """Define the views of a SQL file (vw_statics, vw_customer_rfm, ...) without running its queries."""
+    with open(path, encoding='utf-8') as f:
+        for sql in split_statements(f.read()):
+            if VIEW_DDL.match(sql):
+                query(sql, con)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run PostgreSQL-dialect queries on the staged tables with DuckDB.')
+    parser.add_argument('sql', nargs='?', help='query to run (default: every statement of --file)')
+    parser.add_argument('--file', default=SQL_PATH, help='SQL script to run (default: %(default)s)')
+    parser.add_argument('--staging-dir', default=STAGING_DIR, help='Parquet staging area (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    con = connect(staging_dir=args.staging_dir)
+    if args.sql:
+        create_views(con, args.file)
+        print(query(args.sql, con))
+        return
+    with pd.option_context('display.width', 160, 'display.max_columns', 20):
+        for entry in run_script(con, args.file):
+            title = ' '.join(entry['sql'].split())[:100]
+            if entry['skipped']:
+                print(f"-- skipped (server only): {title}\n")
+            elif entry['error']:
+                print(f"-- failed: {title}\n   {entry['error']}\n")
+            elif entry['result'] is not None:
+                print(f"-- {title}\n{entry['result'].head(10)}\n")
+
+
+if __name__ == '__main__':
+    main()
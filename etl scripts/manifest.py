@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import types
+from functools import partial
+
+from cleaning import COLUMN_CLEANERS
+from rules import TABLE_RULES
+from schemas import DATE_FORMATS, PRIMARY_KEYS, SCHEMA_VERSION, TABLE_SCHEMAS
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🧾 Manifest (skip unchanged source files)
+# ──────────────────────────────────────────────────────────────────────────────
+Every run used to re-read and reload all five files, even when products.csv
+had not changed for weeks. The manifest is a small JSON file that remembers,
+per target database and table, what was last loaded successfully:
+
+    file  → size, mtime and SHA-256 of the CSV
+    rules → fingerprint of the cleaning rules: SCHEMA_VERSION, the table's
+            schema, its registered rules (rules.TABLE_RULES) and the column
+            cleaners (cleaning.COLUMN_CLEANERS), functions by their bytecode
+
+A table is skipped when both are unchanged. Size + mtime are checked first,
+so unchanged files are not even hashed; a file that was only touched (new
+mtime, same bytes) is hashed, found unchanged and skipped. Editing a rule or
+a cleaner (or a helper of the ETL scripts they call) reloads the tables;
+bump schemas.SCHEMA_VERSION for anything else, or run with --force.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(SCRIPTS_DIR, 'etl_manifest.json')
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # Write to a temp file and swap it in, so a crash never leaves half a manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_state(file_path, previous=None):
+    """size / mtime / sha256 of a file; reuses the previous hash if size and mtime match."""
+    stat = os.stat(file_path)
+    state = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous and previous.get('size') == state['size'] and previous.get('mtime') == state['mtime']:
+        state['sha256'] = previous['sha256']
+    else:
+        state['sha256'] = file_hash(file_path)
+    return state
+
+
+def _code_parts(code):
+    """Bytecode, names and constants of a code object (nested lambdas included)."""
+    consts = [_code_parts(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts]
+    return [code.co_code.hex(), list(code.co_names), consts]
+
+
+def _global_names(code):
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.extend(_global_names(const))
+    return list(dict.fromkeys(names))
+
+
+def _is_etl_function(value):
+    return (isinstance(value, types.FunctionType)
+            and os.path.dirname(os.path.abspath(value.__code__.co_filename)) == SCRIPTS_DIR)
+
+
+def code_fingerprint(value, _seen=None):
+    """
+    Stable description of a rule value / predicate or a cleaner: a function's
+    bytecode, its closure values and, recursively, the ETL-script functions it
+    calls (repr() of a lambda changes every run). Other values: repr().
+    """
+    seen = set() if _seen is None else _seen
+    if isinstance(value, partial):
+        return ['partial', code_fingerprint(value.func, seen), repr(value.args), repr(sorted(value.keywords.items()))]
+    if not isinstance(value, types.FunctionType):
+        return repr(value)
+    if value in seen:
+        return value.__qualname__
+    seen.add(value)
+    code = value.__code__
+    closure = [code_fingerprint(cell.cell_contents, seen) for cell in value.__closure__ or ()]
+    called = {name: code_fingerprint(value.__globals__[name], seen)
+              for name in _global_names(code) if _is_etl_function(value.__globals__.get(name))}
+    return [value.__qualname__, _code_parts(code), closure, called]
+
+
+def rules_fingerprint(table_name):
+    """Changes whenever the cleaning rules for the table change (schema, registered rules, cleaners)."""
+    rules = {
+        'version': SCHEMA_VERSION,
+        'schema': TABLE_SCHEMAS.get(table_name),
+        'date_formats': DATE_FORMATS.get(table_name),
+        'primary_key': PRIMARY_KEYS.get(table_name),
+        'rules': [[rule.name, rule.column, code_fingerprint(rule.value), code_fingerprint(rule.when)]
+                  for rule in TABLE_RULES.get(table_name, [])],
+        'cleaners': {kind: code_fingerprint(cleaner) for kind, cleaner in COLUMN_CLEANERS.items()},
+    }
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def changed_tables(table_files, manifest, target, force=False):
+    """
+    Split table_files into the tables that need a run.
+
+    target identifies the database (engine URL without password), so loading
+    into a different database never skips anything.
+    Returns (to_run, states): to_run is the {table: path} subset to process,
+    states the new manifest entries to record once a table has loaded.
+    A table whose file cannot be read (missing, no permission) is reported
+    and left out of both, the other tables still run.
+    """
+    loaded = manifest.get(target, {})
+    to_run, states = {}, {}
+
+    for table_name, file_path in table_files.items():
+        previous = loaded.get(table_name, {})
+        try:
+            state = {
+                'file': file_state(file_path, previous.get('file')),
+                'rules': rules_fingerprint(table_name),
+            }
+        except OSError as e:
+            logging.error(f"Error in ETL for {table_name}: {e}")
+            print(f"Error in ETL for {table_name}: {e}")
+            continue
+        states[table_name] = state
+
+        unchanged = (previous.get('file', {}).get('sha256') == state['file']['sha256']
+                     and previous.get('rules') == state['rules'])
+        if unchanged and not force:
+            logging.info(f"Skipping {table_name}: {file_path} and cleaning rules unchanged")
+            print(f"Skipping {table_name}: source file and cleaning rules unchanged")
+        else:
+            to_run[table_name] = file_path
+
+    return to_run, states
+
+
+def record_tables(manifest, target, states, table_names, path=MANIFEST_PATH):
+    """Store the states of successfully loaded tables and save the manifest."""
+    loaded = manifest.setdefault(target, {})
+    for table_name in table_names:
+        loaded[table_name] = states[table_name]
+    save_manifest(manifest, path)
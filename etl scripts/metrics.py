@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📊 Metrics
+# ──────────────────────────────────────────────────────────────────────────────
+Per table and per stage (extract, clean, table_clean, stage, validate, load,
+swap, index, stats for the streamed order statistics, and materialize for
+derived tables like customer_rfm) the ETL records:
+
+    wall_s       wall-clock seconds
+    cpu_s        CPU seconds of the process that ran the stage (tables loading
+                 side by side in threads both count the process's CPU time)
+    peak_rss_mb  highest resident memory of that process while the stage ran
+                 (not the process's lifetime peak, see StagePeaks)
+    rows_in / rows_out / bytes_read
+    calls        how many times the stage ran (one per chunk in streaming mode)
+
+At the end of a run the totals are appended to etl_metrics.jsonl (one JSON
+object per table + stage, all with the same run_id) and printed as a small
+summary table, so nightly runs can be compared for regressions.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'etl_metrics.jsonl')
+
+STAGE_ORDER = ['extract', 'clean', 'table_clean', 'stage', 'validate', 'load', 'swap', 'index', 'stats', 'materialize']
+
+# Seconds between RSS samples where the kernel's peak cannot be reset (not Linux)
+RSS_SAMPLE_SECONDS = 0.05
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_mb():
+    """Current resident set size of this process in MiB (None if it cannot be measured)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _hwm_mb():
+    """Linux: peak RSS since the last reset (VmHWM) in MiB, None elsewhere."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_hwm():
+    """Linux: restart VmHWM from the current RSS; False where that is not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StagePeaks:
+    """
+    Peak RSS of every stage open in this process. ru_maxrss / peak_wset only
+    know the whole process's high-water mark, which after the first big table
+    is the same for every later stage. On Linux the kernel's mark (VmHWM) is
+    read and reset whenever a stage starts or ends, and the value read goes to
+    every stage still open, so nested stages and stages running side by side
+    in threads each keep their own peak. Elsewhere a sampler thread polls the
+    RSS every RSS_SAMPLE_SECONDS while stages are open (peaks shorter than
+    that can be missed).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = {}
+        self.resettable = _hwm_mb() is not None and _reset_hwm()
+        self.sampler = None
+
+    def _fold(self, value):
+        if value is None:
+            return
+        for key, peak in self.open.items():
+            self.open[key] = value if peak is None else max(peak, value)
+
+    def _sample(self):
+        if self.resettable:
+            self._fold(_hwm_mb())
+            _reset_hwm()
+        else:
+            self._fold(rss_mb())
+
+    def _poll(self):
+        while True:
+            time.sleep(RSS_SAMPLE_SECONDS)
+            with self.lock:
+                if self.open:
+                    self._fold(rss_mb())
+
+    def start(self):
+        """Open a stage; returns the key to pass to stop()."""
+        key = object()
+        with self.lock:
+            # The peak so far belongs to the stages already open
+            self._sample()
+            self.open[key] = rss_mb()
+            if not self.resettable and self.sampler is None:
+                self.sampler = threading.Thread(target=self._poll, name='rss-sampler', daemon=True)
+                self.sampler.start()
+        return key
+
+    def stop(self, key):
+        """Close a stage; returns its peak RSS in MiB (None if it cannot be measured)."""
+        with self.lock:
+            self._sample()
+            return self.open.pop(key)
+
+
+STAGE_PEAKS = StagePeaks()
+
+
+class MetricsRecorder:
+    """Collects stage timings; totals are kept per (table, stage)."""
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self.totals = {}
+
+    @contextmanager
+    def stage(self, table_name, stage_name, rows_in=None, bytes_read=None):
+        """
+        Time one stage. The yielded dict can be filled in by the caller:
+            with metrics.stage('orders', 'clean', rows_in=len(df)) as m:
+                df = clean(df)
+                m['rows_out'] = len(df)
+        """
+        record = {'rows_in': rows_in, 'rows_out': None, 'bytes_read': bytes_read}
+        peak_key = STAGE_PEAKS.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            record['peak_rss_mb'] = STAGE_PEAKS.stop(peak_key)
+            self.add(table_name, stage_name, record)
+
+    def timed_chunks(self, chunks, table_name, stage_name='extract', bytes_read=None):
+        """
+        Wrap a chunk iterator (iter_table / iter_staged) so the time spent
+        producing each chunk is recorded as one call of stage_name.
+        bytes_read (e.g. the file size) is counted once, with the first chunk.
+        """
+        chunks = iter(chunks)
+        while True:
+            with self.stage(table_name, stage_name, bytes_read=bytes_read) as m:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    m['calls'] = 0
+                else:
+                    m['rows_out'] = len(chunk)
+            if chunk is None:
+                return
+            bytes_read = None
+            yield chunk
+
+    def add(self, table_name, stage_name, record):
+        total = self.totals.setdefault((table_name, stage_name), {
+            'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': None,
+            'rows_in': 0, 'rows_out': 0, 'bytes_read': 0, 'calls': 0,
+        })
+        for key in ('wall_s', 'cpu_s', 'rows_in', 'rows_out', 'bytes_read'):
+            total[key] += record.get(key) or 0
+        total['calls'] += record.get('calls', 1)
+        if record.get('peak_rss_mb') is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, record['peak_rss_mb'])
+
+    def records(self):
+        """Totals as a list of flat dicts (picklable, so workers can send them back)."""
+        return [
+            {'table': table_name, 'stage': stage_name, **total}
+            for (table_name, stage_name), total in self.totals.items()
+        ]
+
+    def merge(self, records):
+        """Add totals recorded in another process (e.g. a pool worker)."""
+        for record in records:
+            self.add(record['table'], record['stage'], record)
+
+    def write_jsonl(self, path=METRICS_PATH):
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in self.records():
+                f.write(json.dumps({'run_id': self.run_id, **record}) + '\n')
+        logging.info(f"Wrote {len(self.totals)} metric records to {path}")
+
+    def summary(self):
+        """Printable table of the totals, tables in run order, stages in pipeline order."""
+        lines = [f"{'table':<12} {'stage':<12} {'wall s':>8} {'cpu s':>8} {'peak MiB':>9} "
+                 f"{'rows in':>9} {'rows out':>9} {'MiB read':>9}"]
+        tables = list(dict.fromkeys(table_name for table_name, _ in self.totals))
+        for table_name in tables:
+            stages = sorted((s for t, s in self.totals if t == table_name),
+                            key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else len(STAGE_ORDER))
+            for stage_name in stages:
+                t = self.totals[(table_name, stage_name)]
+                peak = f"{t['peak_rss_mb']:.0f}" if t['peak_rss_mb'] is not None else '-'
+                lines.append(f"{table_name:<12} {stage_name:<12} {t['wall_s']:>8.2f} {t['cpu_s']:>8.2f} {peak:>9} "
+                             f"{t['rows_in']:>9} {t['rows_out']:>9} {t['bytes_read'] / 1024 ** 2:>9.1f}")
+        return '\n'.join(lines)
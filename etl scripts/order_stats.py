@@ -0,0 +1,145 @@
+import logging
+import math
+from datetime import datetime, timezone
+
+import pandas as pd
+from sqlalchemy import BigInteger, DateTime, Float, String, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from loaders import load_dataframe, savepoint
+from pgmath import round_numeric
+from sketches import HeavyHitters, HyperLogLog, QuantileSketch, RunningMoments
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📈 Order statistics (streamed)
+# ──────────────────────────────────────────────────────────────────────────────
+vw_statics scans orders several times (aggregates, PERCENTILE_CONT's sort,
+COUNT(DISTINCT customer_id)) plus a GROUP BY order_amount ORDER BY COUNT(*)
+subquery for the mode, on every read. The ETL now computes the same row
+while the orders chunks go by, one pass and fixed memory, and stores it in
+the one-row order_stats table (same columns as vw_statics, plus run_id and
+computed_at):
+
+    max / min / avg / std / total / cv   RunningMoments: exact (up to float
+                                         rounding, then ROUND(x::numeric, 2))
+    total_orders                         COUNT(order_id): exact
+    median_order                         QuantileSketch: exact up to ~4k
+                                         orders, then within ~0.1% in rank
+    unique_customers                     HyperLogLog: ~0.8% relative error
+    mode_order                           HeavyHitters: exact whenever the mode
+                                         is more frequent than 1 order in 1025
+                                         (ties: any of the most frequent values)
+
+Replace loads feed the accumulator with every chunk that is loaded (after
+the FK check), upsert loads only see the changed rows, so they re-stream
+the merged table from the database in chunks instead. Either way the row is
+written in the orders load's transaction, so it always matches the table.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+ORDER_STATS_TABLE = 'order_stats'
+
+ORDER_STATS_DTYPES = {
+    'max_order': Float(),
+    'min_order': Float(),
+    'avg_order': Float(),
+    'median_order': Float(),
+    'std_order': Float(),
+    'total_order_value': Float(),
+    'total_orders': BigInteger(),
+    'unique_customers': BigInteger(),
+    'cv_percent': Float(),
+    'mode_order': Float(),
+    'run_id': String(50),
+    'computed_at': DateTime(timezone=True),
+}
+
+# Rows per chunk when the orders table is re-streamed (upserts)
+SCAN_CHUNK_ROWS = 100_000
+
+SCAN_SQL = "SELECT order_id, customer_id, order_amount FROM orders"
+
+
+class OrderStats:
+    """vw_statics over every orders chunk passed to update(); mergeable across chunks and processes."""
+
+    def __init__(self):
+        self.orders = 0
+        self.amounts = RunningMoments()
+        self.median = QuantileSketch()
+        self.customers = HyperLogLog()
+        self.modes = HeavyHitters()
+
+    def update(self, orders):
+        amounts = orders['order_amount']
+        self.orders += int(orders['order_id'].notna().sum())
+        self.amounts.update(amounts)
+        self.median.update(amounts)
+        self.modes.update(amounts)
+        self.customers.update(orders['customer_id'])
+        return self
+
+    def merge(self, other):
+        self.orders += other.orders
+        self.amounts.merge(other.amounts)
+        self.median.merge(other.median)
+        self.modes.merge(other.modes)
+        self.customers.merge(other.customers)
+        return self
+
+    def summary(self, run_id=None):
+        """The vw_statics row as a one-row DataFrame (NULLs where SQL has them, e.g. no orders)."""
+        moments = self.amounts
+        empty = moments.n == 0
+        avg = math.nan if empty else moments.total / moments.n
+        std = moments.stddev if moments.n > 1 else math.nan
+        top = self.modes.top(1)
+        rounded = round_numeric([
+            math.nan if empty else moments.max,
+            math.nan if empty else moments.min,
+            avg,
+            std,
+            math.nan if empty else moments.total,
+            std / avg * 100 if avg else math.nan,
+        ])
+        return pd.DataFrame([{
+            'max_order': rounded[0],
+            'min_order': rounded[1],
+            'avg_order': rounded[2],
+            'median_order': self.median.quantile(0.5),
+            'std_order': rounded[3],
+            'total_order_value': rounded[4],
+            'total_orders': self.orders,
+            'unique_customers': self.customers.estimate(),
+            'cv_percent': rounded[5],
+            'mode_order': float(top.index[0]) if len(top) else math.nan,
+            'run_id': run_id,
+            'computed_at': datetime.now(timezone.utc),
+        }])
+
+
+def scan_orders(bind, chunk_size=SCAN_CHUNK_ROWS):
+    """OrderStats of the orders table as stored, streamed from the database in chunks."""
+    stats = OrderStats()
+    query = text(SCAN_SQL).execution_options(stream_results=True)
+    for chunk in pd.read_sql_query(query, bind, chunksize=chunk_size):
+        stats.update(chunk)
+    return stats
+
+
+def write_order_stats(stats, bind, run_id=None):
+    """Replace the order_stats row (in bind's transaction when it is a Connection); returns the row."""
+    summary = stats.summary(run_id)
+    try:
+        with savepoint(bind):
+            load_dataframe(summary, ORDER_STATS_TABLE, bind, dtype=ORDER_STATS_DTYPES,
+                           if_exists='replace', report=False)
+    except SQLAlchemyError as e:
+        # The orders load itself is not affected
+        logging.error(f"Could not write {ORDER_STATS_TABLE}: {e}")
+        print(f"Could not write {ORDER_STATS_TABLE}: {e}")
+        return summary
+    logging.info(f"{ORDER_STATS_TABLE}: {stats.orders} orders, median {summary['median_order'].iat[0]}, "
+                 f"~{summary['unique_customers'].iat[0]} customers")
+    return summary
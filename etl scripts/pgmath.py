@@ -0,0 +1,58 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🔢 PostgreSQL arithmetic
+# ──────────────────────────────────────────────────────────────────────────────
+ROUND(x::numeric, n) and numeric division as PostgreSQL does them, for the
+pandas KPIs (analytics.py) and the order statistics kept during the load
+(order_stats.py). Kept apart from analytics so the load path does not import
+the KPI code.
+
+- a double cast to numeric keeps 15 significant digits, then rounds half
+  away from zero (round_numeric)
+- integer averages and percentages are rounded with exact integer
+  arithmetic (round_ratio)
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+# A double cast to numeric keeps this many significant digits (DBL_DIG)
+NUMERIC_DIGITS = 15
+
+
+def numeric_cast(value):
+    """float8 → numeric cast as PostgreSQL does it."""
+    return Decimal(f"{value:.{NUMERIC_DIGITS}g}")
+
+
+def quantize(value, decimals):
+    """ROUND(numeric, decimals) of a Decimal, as a float."""
+    return float(value.quantize(Decimal(1).scaleb(-decimals), rounding=ROUND_HALF_UP))
+
+
+def round_numeric(values, decimals=2):
+    """
+    ROUND(x::numeric, decimals) for a Series (or array) of doubles. np.round
+    agrees except on ties (x.xx5 after the 15-digit cast), which go through
+    Decimal; NaN stays NaN.
+    """
+    x = np.asarray(values, dtype='float64')
+    scaled = x * 10.0 ** decimals
+    result = np.round(scaled) / 10.0 ** decimals
+    frac = np.abs(scaled - np.trunc(scaled))
+    ties = np.isfinite(x) & (np.abs(frac - 0.5) <= np.maximum(1e-6, np.abs(scaled) * 1e-12))
+    result[ties] = [quantize(numeric_cast(v), decimals) for v in x[ties]]
+    return pd.Series(result, index=values.index, name=values.name) if isinstance(values, pd.Series) else result
+
+
+def round_ratio(numerator, denominator, decimals=2):
+    """ROUND(numerator / denominator, decimals) of integers (numeric division), exactly; NaN where denominator is 0."""
+    n = np.asarray(numerator, dtype='int64')
+    d = np.asarray(denominator, dtype='int64')
+    scale = 10 ** decimals
+    safe = np.where(d > 0, d, 1)
+    rounded = np.sign(n) * ((2 * np.abs(n) * scale + safe) // (2 * safe)) / scale
+    return np.where(d > 0, rounded, np.nan)
@@ -0,0 +1,136 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.exc import SQLAlchemyError
+
+from loaders import load_dataframe, savepoint
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🗑️ Reject sink
+# ──────────────────────────────────────────────────────────────────────────────
+Cleaning used to turn bad values into NaT / NaN / 0 without a trace, so a
+'31-31-2031' order date or a 'ten' quantity was simply gone. Every row that
+cleaning coerced or the FK check rejected now lands in <table>_rejects:
+
+    ...the row's columns (as loaded)... | reject_rule | reject_column | reject_value | run_id
+
+    reject_rule         what happened to the row
+      unparseable_date    date could not be read        → loaded with NULL date
+      not_a_number        text in a numeric column      → loaded with 0 (rating: NULL)
+      not_an_integer      e.g. 2.5 in an integer column → loaded with 0
+      orphan_fk           foreign key without a parent  → NOT loaded (integrity.py)
+    reject_value        the raw text from the CSV (or the orphan key)
+
+Rows are buffered per table and written in bulk (COPY on PostgreSQL through
+loaders.load_dataframe) once REJECT_BATCH_ROWS are waiting and when the table
+is done, so a clean file costs nothing and a dirty one costs one append per
+batch, not one per bad value. The pipeline flushes inside the table's load
+transaction: the rejects of a load are committed (or rolled back) with it. Worker processes collect into their own sink
+and hand the batches to the parent's sink (like metrics.py), so only the
+parent writes to the database.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+REJECT_SUFFIX = '_rejects'
+
+# Buffered reject rows per table before they are written
+REJECT_BATCH_ROWS = 50_000
+
+
+def reject_table(table_name):
+    return f"{table_name}{REJECT_SUFFIX}"
+
+
+def reject_rows(rows, rule, column, values):
+    """rows (a slice of the cleaned table) tagged with the failing rule, column and raw values."""
+    raw = pd.Series(np.asarray(values, dtype=object), index=rows.index)
+    return rows.assign(reject_rule=rule, reject_column=column,
+                       reject_value=raw.astype(str).where(raw.notna(), None))
+
+
+class RejectSink:
+    """Buffers rejected / coerced rows per table and appends them to <table>_rejects in batches."""
+
+    def __init__(self, run_id, engine=None, dtype_for=None, batch_rows=REJECT_BATCH_ROWS):
+        self.run_id = run_id
+        self.engine = engine          # None = collect only (worker processes)
+        self.dtype_for = dtype_for    # (table_name, df) → dtype mapping for to_sql / COPY
+        self.batch_rows = batch_rows
+        self._pending = {}            # table_name → [DataFrame]
+        self.counts = {}              # (table_name, rule, column) → rows
+
+    def add(self, table_name, rows, rule, column, values):
+        """Record rows that failed rule on column; values are their raw values."""
+        if len(rows) == 0:
+            return
+        self._append(table_name, reject_rows(rows, rule, column, values))
+
+    def add_frame(self, table_name, rejects):
+        """Record rows already tagged with reject_rule / reject_column / reject_value."""
+        if len(rejects):
+            self._append(table_name, rejects)
+
+    def _append(self, table_name, rejects):
+        for (rule, column), n in rejects.groupby(['reject_rule', 'reject_column']).size().items():
+            key = (table_name, rule, column)
+            self.counts[key] = self.counts.get(key, 0) + int(n)
+        self._pending.setdefault(table_name, []).append(rejects)
+
+    def pending_rows(self, table_name):
+        return sum(len(frame) for frame in self._pending.get(table_name, []))
+
+    def batches(self):
+        """Buffered frames as [(table_name, DataFrame)] (picklable, so workers can send them back)."""
+        return [(table_name, frame) for table_name, frames in self._pending.items() for frame in frames]
+
+    def merge(self, batches):
+        """Add batches collected in another process (e.g. a pool worker)."""
+        for table_name, frame in batches:
+            self.add_frame(table_name, frame)
+
+    def flush(self, table_name=None, bind=None, min_rows=0):
+        """
+        Append the buffered rows of one table (or all) to the reject tables;
+        returns rows written. bind is a Connection to write in its transaction
+        (default: the sink's engine); tables with fewer than min_rows buffered
+        rows are left for later.
+        """
+        bind = bind if bind is not None else self.engine
+        if bind is None:
+            return 0
+        written = 0
+        for name in [table_name] if table_name is not None else list(self._pending):
+            if self.pending_rows(name) < max(min_rows, 1):
+                continue
+            frames = self._pending.pop(name)
+            start = time.perf_counter()
+            rejects = pd.concat(frames, ignore_index=True).assign(run_id=self.run_id)
+            dtype = self.dtype_for(name, rejects) if self.dtype_for is not None else None
+            try:
+                with savepoint(bind):
+                    stats = load_dataframe(rejects, reject_table(name), bind, dtype=dtype,
+                                           if_exists='append', report=False)
+            except SQLAlchemyError as e:
+                # e.g. the reject table has an older layout: the load itself is not affected
+                logging.error(f"Could not write {len(rejects)} rows to {reject_table(name)}: {e}")
+                print(f"Could not write {len(rejects)} rows to {reject_table(name)}: {e}")
+                continue
+            written += stats['rows']
+            logging.info(f"Wrote {stats['rows']} rows to {reject_table(name)} "
+                         f"in {time.perf_counter() - start:.2f}s")
+        return written
+
+    def close(self):
+        """Write everything still buffered and print what was rejected in this run."""
+        self.flush()
+        if self.counts:
+            print(self.summary())
+
+    def summary(self):
+        lines = [f"{'table':<12} {'rule':<18} {'column':<14} {'rows':>8}"]
+        for (table_name, rule, column), n in self.counts.items():
+            lines.append(f"{table_name:<12} {rule:<18} {column:<14} {n:>8}")
+        return '\n'.join(lines)
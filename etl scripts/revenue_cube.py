@@ -0,0 +1,168 @@
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import BigInteger, Date, Float, Integer, inspect, text
+
+from loaders import delete_rows, ensure_indexes, load_dataframe, read_by_keys
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🧊 Revenue cube (materialized)
+# ──────────────────────────────────────────────────────────────────────────────
+The revenue trend and AOV-by-category queries join orders, order_items and
+products and compute SUM(unit_price * quantity) over every order item on
+each run. The ETL now keeps those sums pre-aggregated in revenue_cube, one
+row per cell:
+
+    order_date | category | payment_method | order_status | state | country
+               | revenue | quantity | order_count | item_count
+
+- rows: order_items ⋈ orders ⋈ products (the KPI queries' joins), customers
+  LEFT JOINed for state / country (NULL when the customer is unknown)
+- revenue: SUM(unit_price * quantity), quantity: SUM(quantity), item_count:
+  order items, order_count: distinct orders of the cell
+- NULL dimension values are cells of their own (like GROUP BY)
+- every order sits on one day with one payment method, status and customer,
+  so the measures add up exactly over any of those dimensions; order_count
+  summed over several categories counts an order once per category it has
+  items in (AOV by category needs exactly that)
+
+Month / category / AOV reports sum the cube instead of the fact table
+(rollup(), or the cube queries in sqlqueries.sql). How much smaller it is
+depends on the data: a month × category rollup is hundreds of rows.
+
+Refresh modes:
+  full         the cube is rebuilt (replace loads, and upserts of
+               order_items / products, which are not tracked per customer)
+  incremental  for the customers touched by an upsert of orders / customers,
+               the days they have orders on, now or before the upsert
+               (previous_rows: the old day of an order that moved), are
+               deleted and recomputed from the orders of those days.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+CUBE_TABLE = 'revenue_cube'
+CUBE_DIMENSIONS = ['order_date', 'category', 'payment_method', 'order_status', 'state', 'country']
+CUBE_MEASURES = ['revenue', 'quantity', 'order_count', 'item_count']
+
+CUBE_DTYPES = {
+    'order_date': Date(),
+    'revenue': Float(),
+    'quantity': BigInteger(),
+    'order_count': Integer(),
+    'item_count': Integer(),
+}
+
+# Day slices are deleted / read by order_date; reports filter on it too
+CUBE_INDEXES = [('btree', ['order_date'])]
+
+FACT_SQL = """
+SELECT o.order_id, o.order_date, p.category, o.payment_method, o.order_status, c.state, c.country,
+       oi.quantity, oi.unit_price
+FROM order_items oi
+JOIN orders o ON o.order_id = oi.order_id
+JOIN products p ON p.product_id = oi.product_id
+LEFT JOIN customers c ON c.customer_id = o.customer_id
+"""
+
+
+def build_cube(rows):
+    """The cube cells of fact rows (FACT_SQL's columns)."""
+    rows = rows.assign(revenue=rows['unit_price'] * rows['quantity'])
+    grouped = rows.groupby(CUBE_DIMENSIONS, dropna=False, observed=True, sort=True)
+    # min_count=1: a cell without any value is NULL, like SQL's SUM
+    cube = grouped[['revenue', 'quantity']].sum(min_count=1)
+    cube['order_count'] = grouped['order_id'].nunique()
+    cube['item_count'] = grouped.size()
+    return cube.reset_index()
+
+
+def rollup(cube, by, period=None):
+    """
+    The cube summed over every dimension not in by, with avg_order_value
+    (revenue / order_count). period ('M', 'W', 'Q', ...) first truncates
+    order_date to the start of its period, e.g.
+        rollup(cube, ['order_date'], 'M')   revenue trend
+        rollup(cube, ['category'])          AOV by category
+    """
+    if period is not None:
+        cube = cube.assign(order_date=cube['order_date'].dt.to_period(period).dt.start_time)
+    totals = cube.groupby(list(by), dropna=False, sort=True)[CUBE_MEASURES].sum(min_count=1).reset_index()
+    totals['avg_order_value'] = totals['revenue'] / totals['order_count']
+    return totals
+
+
+def read_cube(engine, start=None, end=None):
+    """revenue_cube rows with order_date between start and end (inclusive; None = open ended)."""
+    conditions, params = [], {}
+    if start is not None:
+        conditions.append("order_date >= :start")
+        params['start'] = pd.Timestamp(start).date()
+    if end is not None:
+        conditions.append("order_date <= :end")
+        params['end'] = pd.Timestamp(end).date()
+    sql = f"SELECT * FROM {CUBE_TABLE}" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params, parse_dates=['order_date'])
+
+
+def _read_days(conn, days):
+    """Fact rows of the orders placed on the given days (NaT = orders without a date)."""
+    dates = [day.date() for day in days if not pd.isna(day)]
+    frames = [read_by_keys(conn, FACT_SQL, 'o.order_date', dates, parse_dates=['order_date'])]
+    if len(dates) < len(days):
+        frames.append(pd.read_sql(text(FACT_SQL + " WHERE o.order_date IS NULL"), conn, parse_dates=['order_date']))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _delete_days(conn, days):
+    """Remove the cells of the given days; returns rows deleted."""
+    dates = [day.date() for day in days if not pd.isna(day)]
+    deleted = delete_rows(conn, CUBE_TABLE, ['order_date'], pd.DataFrame({'order_date': dates}))
+    if len(dates) < len(days):
+        deleted += conn.execute(text(f"DELETE FROM {CUBE_TABLE} WHERE order_date IS NULL")).rowcount
+    return deleted
+
+
+def refresh_cube(engine, changed_customers=None, previous_rows=None, report=True):
+    """
+    Recompute revenue_cube. changed_customers=None → full rebuild, else only
+    the days those customers have orders on, and the days of previous_rows
+    (the changed rows as they were before the upserts); full when the table
+    does not exist yet. Returns {'changed': cells written, 'deleted': cells
+    removed}.
+    """
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        exists = inspect(conn).has_table(CUBE_TABLE)
+        if changed_customers is None or not exists:
+            mode, days = 'full', None
+            rows = pd.read_sql(text(FACT_SQL), conn, parse_dates=['order_date'])
+        else:
+            touched = read_by_keys(conn, "SELECT o.order_date FROM orders o", 'o.customer_id',
+                                   set(changed_customers), parse_dates=['order_date'])['order_date']
+            if previous_rows is not None:
+                touched = pd.concat([touched, previous_rows['order_date']], ignore_index=True)
+            days = list(touched.drop_duplicates())
+            mode = f'{len(changed_customers)} changed customers, {len(days)} days'
+            rows = _read_days(conn, days)
+
+    cube = build_cube(rows)
+    # Delete + insert of the days commit together: reports never see a day missing
+    with engine.begin() as conn:
+        if days is None:
+            deleted = 0
+            load_dataframe(cube, CUBE_TABLE, conn, dtype=CUBE_DTYPES, if_exists='replace', report=False)
+        else:
+            deleted = _delete_days(conn, days)
+            load_dataframe(cube, CUBE_TABLE, conn, dtype=CUBE_DTYPES, if_exists='append', report=False)
+        ensure_indexes(conn, CUBE_TABLE, CUBE_INDEXES, report=False)
+    seconds = time.perf_counter() - start
+
+    message = (f"Refreshed {CUBE_TABLE} ({mode}): {len(rows)} order items → {len(cube)} cells, "
+               f"{deleted} removed in {seconds:.2f}s")
+    logging.info(message)
+    if report:
+        print(message)
+    return {'changed': len(cube), 'deleted': deleted}
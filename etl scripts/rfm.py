@@ -0,0 +1,216 @@
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date, Float, Integer, SmallInteger, inspect, text
+
+from keys import key_sql_type
+from loaders import delete_rows, ensure_indexes, read_by_keys, upsert_dataframe
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🏅 Customer RFM (materialized)
+# ──────────────────────────────────────────────────────────────────────────────
+vw_customer_rfm used to compute MAX(order_date), COUNT(*), SUM(order_amount)
+and three NTILE(5) window sorts over all orders on every dashboard refresh.
+The ETL now computes the scores once per load and stores them in the
+customer_rfm table:
+
+    customer_id | last_order_date | frequency | monetary | r_score | f_score | m_score
+
+- aggregation is one pandas groupby, the scores are NTILE(5) done with NumPy
+  (same bucket sizes as SQL: the first n % 5 buckets get one extra row)
+- r_score ranks last_order_date (older = 1), which is the same order as
+  "recency DESC" in the old view, so scores do not go stale as days pass;
+  vw_customer_rfm computes recency from last_order_date at query time
+- ties are broken by customer_id (SQL leaves them in no particular order)
+- only customers that exist in customers are scored (the view's inner join)
+
+Refresh modes:
+  full         every customer is re-aggregated from orders (replace loads)
+  incremental  only the customers whose orders / customer row changed are
+               re-aggregated, including the previous customer of an order
+               that was moved to another one (previous_rows); all customers
+               are re-ranked in memory (cheap, one row per customer) and only
+               rows whose values moved are written, through
+               loaders.upsert_dataframe
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+RFM_TABLE = 'customer_rfm'
+RFM_BUCKETS = 5
+
+# customer_id is typed from the data: VARCHAR(50), or INTEGER with surrogate keys
+RFM_DTYPES = {
+    'last_order_date': Date(),
+    'frequency': Integer(),
+    'monetary': Float(),
+    'r_score': SmallInteger(),
+    'f_score': SmallInteger(),
+    'm_score': SmallInteger(),
+}
+
+# Secondary index for segment filters (e.g. r_score = 5 AND f_score >= 4)
+RFM_INDEXES = [('btree', ['r_score', 'f_score', 'm_score'])]
+
+ORDERS_SQL = """
+SELECT o.customer_id, o.order_date, o.order_amount
+FROM orders o
+JOIN customers c ON c.customer_id = o.customer_id
+"""
+
+# Stored customer / signup / order rows of the keys an upsert is about to
+# overwrite: table → (sql, key expression, key column). Orders keep their
+# date without a customer (LEFT JOIN), customers only come with their orders.
+PREVIOUS_SQL = {
+    'orders': ("""
+SELECT o.order_id, o.customer_id, c.signup_date, o.order_date
+FROM orders o
+LEFT JOIN customers c ON c.customer_id = o.customer_id
+""", 'o.order_id', 'order_id'),
+    'customers': ("""
+SELECT c.customer_id, c.signup_date, o.order_date
+FROM orders o
+JOIN customers c ON c.customer_id = o.customer_id
+""", 'c.customer_id', 'customer_id'),
+}
+PREVIOUS_COLUMNS = ['customer_id', 'signup_date', 'order_date']
+
+
+def ntile(n_rows, buckets=RFM_BUCKETS):
+    """SQL NTILE(buckets) for rows 0..n_rows-1 already in sort order (1-based)."""
+    position = np.arange(n_rows)
+    size, extra = divmod(n_rows, buckets)
+    big_rows = extra * (size + 1)  # rows that sit in the larger leading buckets
+    small = extra + (position - big_rows) // max(size, 1)
+    return np.where(position < big_rows, position // (size + 1), small).astype('int16') + 1
+
+
+def _ntile_by(values, buckets=RFM_BUCKETS):
+    """NTILE over ascending values (stable sort, so ties keep the frame's order)."""
+    order = np.argsort(values, kind='stable')
+    scores = np.empty(len(values), dtype='int16')
+    scores[order] = ntile(len(values), buckets)
+    return scores
+
+
+def aggregate_orders(orders):
+    """Per customer: last order date, number of orders and total spend."""
+    grouped = orders.groupby('customer_id', sort=False, observed=True)
+    agg = grouped.agg(
+        last_order_date=('order_date', 'max'),
+        frequency=('order_date', 'size'),
+        monetary=('order_amount', 'sum'),
+    )
+    return agg.reset_index()
+
+
+def score_rfm(agg):
+    """Add r/f/m scores (1–5) to the per-customer aggregates; returns a new frame."""
+    agg = agg.sort_values('customer_id', ignore_index=True)
+    # NaT sorts first (lowest r_score), like NULL recency under ORDER BY ... DESC
+    last_order = agg['last_order_date'].to_numpy(dtype='datetime64[ns]').view('int64')
+    return agg.assign(
+        r_score=_ntile_by(last_order),
+        f_score=_ntile_by(agg['frequency'].to_numpy()),
+        m_score=_ntile_by(agg['monetary'].to_numpy(dtype='float64')),
+    )
+
+
+def _read_orders(conn, customer_ids=None):
+    if customer_ids is None:
+        return pd.read_sql(text(ORDERS_SQL), conn, parse_dates=['order_date'])
+    return read_by_keys(conn, ORDERS_SQL, 'o.customer_id', customer_ids, parse_dates=['order_date'])
+
+
+def _read_aggregates(conn):
+    columns = 'customer_id, last_order_date, frequency, monetary'
+    return pd.read_sql(text(f"SELECT {columns} FROM {RFM_TABLE}"), conn, parse_dates=['last_order_date'])
+
+
+def previous_rows(conn, table_name, df):
+    """
+    customer / signup / order rows (plus the key) of df's keys as stored,
+    read before an upsert of orders / customers overwrites them. None for
+    other tables and for a table that does not exist yet.
+    """
+    if table_name not in PREVIOUS_SQL or not all(inspect(conn).has_table(t) for t in PREVIOUS_SQL):
+        return None
+    sql, key_expr, key_column = PREVIOUS_SQL[table_name]
+    # tolist() gives plain Python values (numpy ints would bind as BLOBs on SQLite)
+    keys = df[key_column].dropna().drop_duplicates().tolist()
+    return read_by_keys(conn, sql, key_expr, keys, parse_dates=['signup_date', 'order_date'])
+
+
+def changed_rows(table_name, previous, stats):
+    """The previous_rows() of the keys the upsert actually inserted / updated (PREVIOUS_COLUMNS)."""
+    changed_keys = stats.get('changed_keys')
+    if previous is None or changed_keys is None:
+        return pd.DataFrame(columns=PREVIOUS_COLUMNS)
+    key_column = PREVIOUS_SQL[table_name][2]
+    return previous.loc[previous[key_column].isin(changed_keys[key_column]), PREVIOUS_COLUMNS]
+
+
+def affected_customers(table_name, df, stats, previous=None):
+    """
+    customer_ids whose RFM rows a load of table_name may have changed, from an
+    upsert_dataframe() result: the customers of the new rows, plus those the
+    changed rows belonged to before (previous_rows(), e.g. the old customer
+    of an order moved to another one).
+    """
+    changed_keys = stats.get('changed_keys')
+    if changed_keys is None or changed_keys.empty:
+        return set()
+    customers = set(changed_rows(table_name, previous, stats)['customer_id'].dropna().tolist())
+    if table_name == 'customers':
+        return customers | set(changed_keys['customer_id'].dropna().tolist())
+    if table_name == 'orders':
+        changed_orders = df['order_id'].isin(changed_keys['order_id'])
+        return customers | set(df.loc[changed_orders, 'customer_id'].dropna().tolist())
+    return set()
+
+
+def refresh_rfm(engine, changed_customers=None, previous_rows=None, report=True):
+    """
+    Recompute customer_rfm. changed_customers=None → full refresh, else only
+    those customers (and the customers of previous_rows, the changed rows as
+    they were before the upserts) are re-aggregated (falls back to full when
+    the table does not exist yet). Returns upsert_dataframe()'s stats plus
+    'deleted'.
+    """
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        exists = inspect(conn).has_table(RFM_TABLE)
+        if changed_customers is None or not exists:
+            mode = 'full'
+            agg = aggregate_orders(_read_orders(conn))
+            stale = set(_read_aggregates(conn)['customer_id']) - set(agg['customer_id']) if exists else set()
+        else:
+            changed_customers = set(changed_customers)
+            if previous_rows is not None:
+                changed_customers |= set(previous_rows['customer_id'].dropna().tolist())
+            mode = f'{len(changed_customers)} changed customers'
+            fresh = aggregate_orders(_read_orders(conn, changed_customers))
+            existing = _read_aggregates(conn)
+            existing = existing[~existing['customer_id'].isin(changed_customers)]
+            agg = pd.concat([existing, fresh], ignore_index=True)
+            # Changed customers without any (joinable) orders left drop out
+            stale = changed_customers - set(fresh['customer_id'])
+
+    scored = score_rfm(agg)
+    dtype = {'customer_id': key_sql_type(scored['customer_id']), **RFM_DTYPES}
+    # Upsert, delete and indexes commit together: the dashboard never sees a half-refreshed table
+    with engine.begin() as conn:
+        stats = upsert_dataframe(scored, RFM_TABLE, conn, key_columns=['customer_id'], dtype=dtype, report=False)
+        stats['deleted'] = delete_rows(conn, RFM_TABLE, ['customer_id'],
+                                       pd.DataFrame({'customer_id': sorted(stale)}))
+        ensure_indexes(conn, RFM_TABLE, RFM_INDEXES, report=False)
+    seconds = time.perf_counter() - start
+
+    message = (f"Refreshed {RFM_TABLE} ({mode}): {len(scored)} customers scored, "
+               f"{stats['changed']} rows written, {stats['deleted']} removed in {seconds:.2f}s")
+    logging.info(message)
+    if report:
+        print(message)
+    return stats
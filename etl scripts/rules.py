@@ -0,0 +1,183 @@
+import logging
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📏 Data-quality rule engine
+# ──────────────────────────────────────────────────────────────────────────────
+Table rules used to be hand-written pandas: one mask and one .loc write over
+the whole frame per rule. Now each rule is declared once per table:
+
+    Rule('cod_missing_status_shipped', 'order_status', 'Shipped',
+         when=lambda df: df['payment_method'].eq('COD') & df['order_status'].isna())
+
+and apply_rules() runs all rules of a table fused per column, like one SQL
+CASE WHEN per column:
+
+1. the masks of every rule on a column go into one np.select, so each row
+   gets the first rule (in declared order) that matches it
+2. the column is copied once, each rule fills only its own rows, and the
+   frame is written once per column; categorical columns are rewritten on
+   their integer codes
+3. columns are finished in the order they first appear in the rule list, so a
+   rule can read a column that earlier rules already fixed (e.g. "Shipped →
+   payment COD" sees the statuses set by the missing-status rules)
+
+Rules without `when` are column transforms (lowercase emails, text → numbers);
+they run before the conditional rules of their column.
+
+Every rule reports how many rows it actually changed (NA → value counts,
+rewriting a value with itself does not). The counts are logged and kept in
+df.attrs['rule_changes'].
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+
+class Rule(NamedTuple):
+    name: str
+    column: str
+    value: object                                   # scalar / pd.NA, or callable(df) → Series
+    when: Optional[Callable[[pd.DataFrame], pd.Series]] = None  # None = transform every row
+
+
+# table → [Rule], filled by register() (cleaning.py declares the retail rules)
+TABLE_RULES = {}
+
+
+def register(table_name, *rules):
+    """Add rules for a table (they run in registration order)."""
+    TABLE_RULES.setdefault(table_name, []).extend(rules)
+
+
+def _mask(rule, df):
+    mask = rule.when(df)
+    if isinstance(mask, pd.Series):
+        return mask.fillna(False).to_numpy(dtype=bool)
+    return np.asarray(mask, dtype=bool)
+
+
+def _values(rule, df):
+    return rule.value(df) if callable(rule.value) else rule.value
+
+
+def _changed(old, new):
+    """Rows where new differs from old (missing on both sides counts as equal)."""
+    old_na, new_na = old.isna().to_numpy(), new.isna().to_numpy()
+    both = ~old_na & ~new_na
+    try:
+        differ = pd.array(old.array != new.array, dtype='boolean').to_numpy(dtype=bool, na_value=False)
+    except TypeError:  # e.g. categoricals with different categories
+        differ = np.zeros(len(old), dtype=bool)
+        differ[both] = old.to_numpy(dtype=object)[both] != new.to_numpy(dtype=object)[both]
+    return (old_na != new_na) | (both & differ)
+
+
+def _changed_to_scalar(before, value):
+    """How many of the rows in before a write of one scalar actually changes."""
+    if pd.isna(value):
+        return int(before.notna().sum())
+    return int((~before.eq(value).fillna(False).to_numpy(dtype=bool)).sum())
+
+
+def _apply_categorical(current, rules, choice, counts):
+    """Scalar writes into a categorical column, done on its integer codes."""
+    categories = current.cat.categories
+    new_values = [r.value for r in rules if not pd.isna(r.value) and r.value not in categories]
+    if new_values:
+        categories = categories.append(pd.Index(list(dict.fromkeys(new_values)), dtype=categories.dtype))
+
+    old_codes = current.cat.codes.to_numpy()
+    codes = old_codes.copy()
+    for i, rule in enumerate(rules):
+        rows = choice == i
+        code = -1 if pd.isna(rule.value) else categories.get_loc(rule.value)
+        counts[rule.name] = int((old_codes[rows] != code).sum())
+        codes[rows] = code
+
+    dtype = pd.CategoricalDtype(categories, ordered=current.cat.ordered)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=current.index, name=current.name)
+
+
+def _apply_values(current, rules, choice, view, counts):
+    """Writes into any other column: one copy, each rule fills only the rows it won."""
+    result = current.copy()
+    for i, rule in enumerate(rules):
+        rows = choice == i
+        if not rows.any():
+            counts[rule.name] = 0
+            continue
+        values = _values(rule, view)
+        if isinstance(values, pd.Series):
+            before = result[rows]
+            result[rows] = values[rows]
+            counts[rule.name] = int(_changed(before, result[rows]).sum())
+        else:
+            counts[rule.name] = _changed_to_scalar(result[rows], values)
+            result[rows] = values
+    return result
+
+
+def _used_categories(s):
+    codes = s.cat.codes.to_numpy()
+    return set(s.cat.categories[np.bincount(codes[codes >= 0], minlength=len(s.cat.categories)) > 0])
+
+
+def _drop_emptied_categories(old, new):
+    """Categories that had rows before the rules and have none after (e.g. 'Unknown' → NA) are removed."""
+    if not isinstance(old.dtype, pd.CategoricalDtype) or not isinstance(new.dtype, pd.CategoricalDtype):
+        return new
+    emptied = [c for c in _used_categories(old) - _used_categories(new) if c in new.cat.categories]
+    return new.cat.remove_categories(emptied) if emptied else new
+
+
+def _with_column(df, column, current, original):
+    """df as the rules should see it (a copy only once the column has been transformed)."""
+    return df if current is original else df.assign(**{column: current})
+
+
+def _apply_column(df, column, rules, counts):
+    original = df[column]
+    current = original
+
+    # Transforms first, each on the whole column
+    for rule in (r for r in rules if r.when is None):
+        transformed = _values(rule, _with_column(df, column, current, original))
+        counts[rule.name] = int(_changed(current, transformed).sum())
+        current = transformed
+
+    conditional = [r for r in rules if r.when is not None]
+    if conditional:
+        view = _with_column(df, column, current, original)
+        masks = [_mask(rule, view) for rule in conditional]
+        # One pass over the masks: index of the first matching rule per row (-1 = none)
+        choice = np.select(masks, np.arange(len(conditional)), default=-1)
+        scalars_only = not any(callable(r.value) for r in conditional)
+        if isinstance(current.dtype, pd.CategoricalDtype) and scalars_only:
+            current = _apply_categorical(current, conditional, choice, counts)
+        else:
+            current = _apply_values(current, conditional, choice, view, counts)
+
+    return _drop_emptied_categories(original, current)
+
+
+def apply_rules(df, table_name, rules=None):
+    """
+    Run the registered rules of table_name (or the given list) over df.
+    Rules on columns the frame does not have are skipped. Returns df with
+    df.attrs['rule_changes'] = {rule name: rows changed}.
+    """
+    rules = TABLE_RULES.get(table_name, []) if rules is None else rules
+    counts = {}
+    columns = list(dict.fromkeys(rule.column for rule in rules if rule.column in df.columns))
+
+    for column in columns:
+        df[column] = _apply_column(df, column, [r for r in rules if r.column == column], counts)
+
+    df.attrs['rule_changes'] = counts
+    if counts:
+        summary = ', '.join(f"{name}={n}" for name, n in counts.items())
+        logging.info(f"{table_name} rules changed rows: {summary}")
+    return df
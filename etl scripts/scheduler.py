@@ -0,0 +1,139 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from cleaning import clean_table
+from extract import iter_table
+from metrics import MetricsRecorder
+from rejects import RejectSink
+from staging import STAGING_DIR, read_staged, stage_table, staged_bytes
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🔀 Scheduler
+# ──────────────────────────────────────────────────────────────────────────────
+Extract + clean of the five tables do not depend on each other, so they run in
+a process pool (one table per worker, real CPU parallelism for pandas work).
+
+Loads still have to respect the foreign keys in sql/sqlqueries.sql:
+
+    customers, products  →  orders  →  order_items, reviews
+
+The parent process loads each table as soon as its cleaned DataFrame is back
+and every parent table is loaded, so loading the small tables overlaps with
+cleaning the big ones. Wall time ≈ the slowest table's extract + clean, plus
+the loads. With load_workers > 1 the tables of one level (customers and
+products, order_items and reviews) load at the same time in threads, each on
+its own pooled connection and in its own transaction.
+
+Workers time their own stages (metrics.py) and send the totals back with the
+DataFrame, so the parent's summary covers every stage of every table. Rows
+with coerced values travel back the same way and are written to the reject
+tables by the parent (rejects.py).
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+# Foreign-key levels: a table is only loaded after every table in earlier levels
+LOAD_ORDER = [
+    ['customers', 'products'],
+    ['orders'],
+    ['order_items', 'reviews'],
+]
+
+
+def load_level(table_name):
+    """Index of the table's LOAD_ORDER level (unknown tables come after all levels)."""
+    return next((i for i, level in enumerate(LOAD_ORDER) if table_name in level), len(LOAD_ORDER))
+
+
+def tables_in_load_order(table_names):
+    """table_names sorted by LOAD_ORDER (unknown tables go last, in their given order)."""
+    ranked = [t for level in LOAD_ORDER for t in level]
+    known = [t for t in ranked if t in table_names]
+    return known + [t for t in table_names if t not in ranked]
+
+
+def extract_and_clean(table_name, file_path, stage_mode=None, staging_dir=STAGING_DIR):
+    """
+    Worker job: read the whole CSV and run generic + table-specific cleaning.
+    With stage_mode ('replace' / 'upsert') the cleaned table is also written to
+    the Parquet staging area in staging_dir (each worker writes its own table folder).
+    Returns (df, metric records of the worker's stages, reject batches).
+    """
+    metrics = MetricsRecorder()
+    rejects = RejectSink(metrics.run_id)
+    chunks = metrics.timed_chunks(iter_table(table_name, file_path), table_name,
+                                  bytes_read=os.path.getsize(file_path))
+    df = next(chunks)
+    logging.info(f"Loaded {len(df)} rows from {file_path}")
+    df = clean_table(df, table_name, metrics, rejects)
+    if stage_mode is not None:
+        with metrics.stage(table_name, 'stage', rows_in=len(df)) as m:
+            stage_table(df, table_name, mode=stage_mode, staging_dir=staging_dir)
+            m['rows_out'] = len(df)
+    return df, metrics.records(), rejects.batches()
+
+
+def read_from_staging(table_name, file_path=None, staging_dir=STAGING_DIR):
+    """Worker job for re-loads: the cleaned table straight from Parquet staging."""
+    metrics = MetricsRecorder()
+    with metrics.stage(table_name, 'extract', bytes_read=staged_bytes(table_name, staging_dir)) as m:
+        df = read_staged(table_name, staging_dir=staging_dir)
+        m['rows_out'] = len(df)
+    return df, metrics.records(), []
+
+
+def _report_error(table_name, e):
+    logging.error(f"Error in ETL for {table_name}: {e}")
+    print(f"Error in ETL for {table_name}: {e}")
+
+
+def run_parallel(table_files, load_table, max_workers=None, job=extract_and_clean, metrics=None, rejects=None,
+                 load_workers=1):
+    """
+    Run job(table_name, file_path) for every table in a process pool (extract +
+    clean by default), then call load_table(table_name, df) in foreign-key order
+    from this process. job returns (df, metric records, reject batches); they
+    are merged into metrics (a MetricsRecorder) and rejects (a RejectSink)
+    when given.
+
+    Loads run on up to load_workers threads: a table starts loading once the
+    tables of every earlier LOAD_ORDER level are done, so tables of the same
+    level can load side by side.
+
+    Errors are reported per table (like the sequential loop) and do not stop
+    the other tables. Returns {table_name: load_table(...) result}.
+    """
+    if not table_files:
+        return {}
+    if max_workers is None:
+        max_workers = min(len(table_files), os.cpu_count() or 1)
+
+    loads = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool, \
+            ThreadPoolExecutor(max_workers=load_workers, thread_name_prefix='load') as loader:
+        futures = {
+            table_name: pool.submit(job, table_name, file_path)
+            for table_name, file_path in table_files.items()
+        }
+
+        for table_name in tables_in_load_order(list(table_files)):
+            try:
+                df, worker_metrics, worker_rejects = futures[table_name].result()
+                if metrics is not None:
+                    metrics.merge(worker_metrics)
+                if rejects is not None:
+                    rejects.merge(worker_rejects)
+            except Exception as e:
+                _report_error(table_name, e)
+                continue
+            wait([load for parent, load in loads.items() if load_level(parent) < load_level(table_name)])
+            loads[table_name] = loader.submit(load_table, table_name, df)
+
+    results = {}
+    for table_name, load in loads.items():
+        try:
+            results[table_name] = load.result()
+        except Exception as e:
+            _report_error(table_name, e)
+    return results
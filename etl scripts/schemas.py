@@ -0,0 +1,175 @@
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🗂️ Table Schemas
+# ──────────────────────────────────────────────────────────────────────────────
+One place that says what every column of every raw table is. It is used twice:
+
+1. Extract: read_dtypes() gives pd.read_csv() an explicit dtype for every
+   column, so pandas does not guess types (IDs stay strings, no int → str
+   cast afterwards, low-cardinality columns are stored as categoricals)
+2. Clean: the cleaning code works out what to do with a column once instead
+   of re-checking dtypes and re-casting the same column several times
+
+Column kinds:
+    'id'       → key column, always a stripped string (joins / foreign keys)
+    'text'     → free text, stripped, blank/"nan"/"null" become <NA>
+    'category' → like text, but stored as a pandas categorical (few distinct values)
+    'date'     → read as text, parsed with the format in DATE_FORMATS (DATE in PostgreSQL)
+    'number'   → float, missing values filled with 0
+    'int'      → nullable integer (Int64), missing values filled with 0
+    'rating'   → nullable integer (Int64), missing values stay <NA> (ignored by AVG / mean)
+
+Columns that are not listed here are left to pandas type inference and fall
+back to the old dtype based guess (object → 'text', numeric → 'number').
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype('pyarrow')
+except ImportError:
+    STRING_DTYPE = pd.StringDtype()
+
+
+# Bump when cleaning changes in a way the manifest (manifest.py) cannot see,
+# e.g. a new pandas behaviour or a change outside the ETL scripts. The schemas
+# here, the registered rules and the column cleaners are fingerprinted by code.
+SCHEMA_VERSION = 2
+
+TABLE_SCHEMAS = {
+    'customers': {
+        'customer_id': 'id',
+        'name': 'text',
+        'email': 'text',
+        'signup_date': 'date',
+        'city': 'text',
+        'state': 'text',
+        'country': 'text',
+        'dob': 'date',
+        'gender': 'category',
+    },
+    'orders': {
+        'order_id': 'id',
+        'order_date': 'date',
+        'customer_id': 'id',
+        'order_amount': 'number',
+        'payment_method': 'category',
+        'order_status': 'category',
+    },
+    'products': {
+        'product_id': 'id',
+        'product_name': 'text',
+        'category': 'category',
+        'price': 'number',
+        'cost': 'number',
+    },
+    'order_items': {
+        'order_item_id': 'id',
+        'order_id': 'id',
+        'product_id': 'id',
+        'quantity': 'int',
+        'unit_price': 'number',
+    },
+    'reviews': {
+        'review_id': 'id',
+        'order_id': 'id',
+        'customer_id': 'id',
+        'product_id': 'id',
+        'rating': 'rating',
+        'review_text': 'text',
+        'review_date': 'date',
+    },
+}
+
+# Primary keys (as in sql/sqlqueries.sql), used by the incremental upsert load
+PRIMARY_KEYS = {
+    'customers': ['customer_id'],
+    'orders': ['order_id'],
+    'products': ['product_id'],
+    'order_items': ['order_item_id'],
+    'reviews': ['review_id'],
+}
+
+# Indexes built after every load (to_sql() creates none), on top of the
+# primary key: foreign keys used by the joins in sql/sqlqueries.sql, and
+# order_date for month / date-range filters. 'brin' becomes a BRIN index on
+# PostgreSQL when the rows are stored in date order, a btree otherwise
+# (see loaders.ensure_indexes).
+TABLE_INDEXES = {
+    'orders': [('btree', ['customer_id']), ('brin', ['order_date'])],
+    'order_items': [('btree', ['order_id']), ('btree', ['product_id'])],
+    'reviews': [('btree', ['order_id'])],
+}
+
+
+# Foreign keys (as in sql/sqlqueries.sql): table → [(column, parent table, parent column)].
+# Checked on the cleaned frames before every load (see integrity.py)
+FOREIGN_KEYS = {
+    'orders': [('customer_id', 'customers', 'customer_id')],
+    'order_items': [('order_id', 'orders', 'order_id'), ('product_id', 'products', 'product_id')],
+    'reviews': [('order_id', 'orders', 'order_id'), ('customer_id', 'customers', 'customer_id')],
+}
+
+
+def declared_indexes(table_name):
+    """[(kind, columns)] for a table: its primary key first, then TABLE_INDEXES."""
+    key_columns = PRIMARY_KEYS.get(table_name)
+    primary = [('primary', key_columns)] if key_columns else []
+    return primary + TABLE_INDEXES.get(table_name, [])
+
+# Input formats of the date columns (orders.csv is DD-MM-YYYY, the rest ISO)
+DATE_FORMATS = {
+    'customers': {'signup_date': '%Y-%m-%d', 'dob': '%Y-%m-%d'},
+    'orders': {'order_date': '%d-%m-%Y'},
+    'reviews': {'review_date': '%Y-%m-%d'},
+}
+
+# pandas dtype used by pd.read_csv() for each column kind
+KIND_DTYPES = {
+    'id': STRING_DTYPE,
+    'text': STRING_DTYPE,
+    'category': 'category',
+    'date': STRING_DTYPE,
+    'number': 'float64',
+    'int': 'Int64',
+    'rating': 'Int64',
+}
+
+# Strings that mean "missing" once the value has been stripped
+NA_STRINGS = ['', 'nan', 'NaN', 'null', 'NULL', 'None', 'N/A']
+
+# Key columns shared across tables (always strings, even without a schema)
+ID_COLUMNS = ['order_id', 'customer_id', 'order_item_id', 'product_id', 'review_id']
+
+
+def column_kind(table_name, column, dtype):
+    """Kind of one column: from TABLE_SCHEMAS, else guessed from the pandas dtype."""
+    kind = TABLE_SCHEMAS.get(table_name, {}).get(column)
+    if kind is not None:
+        return kind
+    if column in ID_COLUMNS:
+        return 'id'
+    if dtype.kind in 'biufc':
+        return 'number'
+    if dtype.kind in 'OSU':  # object, numpy str and pandas string dtypes
+        return 'text'
+    return None  # bools, datetimes, ... are left untouched
+
+
+def read_dtypes(table_name, numbers_as_text=False):
+    """
+    dtype= argument for pd.read_csv() of a table (None for tables without a schema).
+    numbers_as_text=True reads numeric columns as strings too, so a dirty value
+    ('abc' in a price column) cannot stop the read; cleaning coerces them later.
+    """
+    schema = TABLE_SCHEMAS.get(table_name)
+    if schema is None:
+        return None
+    dtypes = {col: KIND_DTYPES[kind] for col, kind in schema.items()}
+    if numbers_as_text:
+        for col, kind in schema.items():
+            if kind in ('number', 'int', 'rating'):
+                dtypes[col] = STRING_DTYPE
+    return dtypes
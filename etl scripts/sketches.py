@@ -0,0 +1,431 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 🧮 Streaming sketches
+# ──────────────────────────────────────────────────────────────────────────────
+Small summaries that are fed one chunk at a time (update) and can be combined
+(merge: chunks, worker processes, partitions), so a statistic over a whole
+table needs one pass and a fixed amount of memory:
+
+    RunningMoments   count, sum, min, max, mean, variance   exact (Welford, with
+                                                           Chan et al.'s merge
+                                                           between chunks)
+    QuantileSketch   median / any quantile                 KLL: rank error about
+                                                           1.7 / k, exact until
+                                                           the first compaction
+    HyperLogLog      COUNT(DISTINCT ...)                   ~1.04 / sqrt(2^p)
+                                                           relative error (Ertl's
+                                                           improved estimator, no
+                                                           bias tables)
+    HeavyHitters     most frequent values (the mode)       Misra-Gries: counts are
+                                                           low by at most
+                                                           HeavyHitters.error()
+
+Every update() takes a Series / array and is vectorized (NumPy / pandas);
+nulls are skipped like SQL aggregates skip them. Sketches pickle, so worker
+processes can send theirs back to be merged.
+
+HyperLogLogs also have a compact binary form (to_bytes / from_bytes): only
+the non-zero registers while that is smaller (4 bytes each), else all 2^p
+register bytes, so a sketch of a few values takes a few bytes. grouped_hll()
+builds one sketch per group of a frame and merge_sketches() unions stored
+sketches per group, both in one vectorized pass over all groups.
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+# KLL accuracy: the top compactor keeps k items (about 3k in total)
+QUANTILE_SKETCH_K = 2048
+
+# HyperLogLog registers: 2^p one-byte registers (p=14: 16 KiB, ~0.8% error)
+HLL_PRECISION = 14
+
+# Misra-Gries counters: values more frequent than n / (capacity + 1) are always kept
+HEAVY_HITTERS_CAPACITY = 1024
+
+
+def _numbers(values):
+    """The non-null values as a float64 array."""
+    x = np.asarray(pd.to_numeric(pd.Series(values), errors='coerce'), dtype='float64')
+    return x[~np.isnan(x)]
+
+
+def hash_values(values):
+    """64-bit hashes of the non-null values: numbers by value (42 == 42.0), anything else by its text."""
+    s = pd.Series(values)
+    s = s[s.notna()]
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return pd.util.hash_array(s.to_numpy(dtype='float64'))
+    return pd.util.hash_array(s.astype(str).to_numpy(dtype=object))
+
+
+# =====================
+# Moments
+# =====================
+class RunningMoments:
+    """Count, sum, min, max, mean and sample variance of a stream of numbers."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0           # sum of squared deviations from the mean
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        x = _numbers(values)
+        if len(x) == 0:
+            return self
+        # Per chunk: two-pass moments (vectorized), then merged like one Welford step
+        chunk = RunningMoments()
+        chunk.n = len(x)
+        chunk.mean = float(x.mean())
+        chunk.m2 = float(np.square(x - chunk.mean).sum())
+        chunk.total = math.fsum(x)
+        chunk.min = float(x.min())
+        chunk.max = float(x.max())
+        return self.merge(chunk)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.total = math.fsum([self.total, other.total])
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.n = n
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance (SQL VARIANCE / STDDEV); NaN below two values."""
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+# =====================
+# Quantiles
+# =====================
+class QuantileSketch:
+    """
+    KLL quantile sketch. Level h holds items that each stand for 2^h values;
+    a level over its capacity is sorted and every other item (random offset)
+    moves up one level. Lower levels get smaller capacities (factor 2/3).
+    """
+
+    def __init__(self, k=QUANTILE_SKETCH_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        x = _numbers(values)
+        if len(x):
+            self.n += len(x)
+            self.levels[0] = np.concatenate([self.levels[0], x])
+            self._compact()
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compact()
+        return self
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays on this level, so no weight is lost
+                kept = items[len(items) - len(items) % 2:]
+                promoted = items[:len(items) - len(kept)][self._rng.integers(2)::2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q):
+        """PERCENTILE_CONT(q): linear interpolation between the neighbouring ranks (NaN when empty)."""
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype='int64')
+                                  for level, items in enumerate(self.levels)])
+        if weights.sum() == 0:
+            return math.nan
+        items = np.concatenate(self.levels)
+        order = np.argsort(items, kind='stable')
+        items, ends = items[order], np.cumsum(weights[order])
+        position = q * (ends[-1] - 1)
+        lower, upper = math.floor(position), math.ceil(position)
+        low, high = items[np.searchsorted(ends, [lower, upper], side='right')]
+        return float(low + (position - lower) * (high - low))
+
+    @property
+    def exact(self):
+        """True until the first compaction (the quantiles are then exact)."""
+        return len(self.levels) == 1
+
+
+# =====================
+# Distinct counts
+# =====================
+def _bit_length(x):
+    """Bit length of uint64 values (frexp is exact on 32-bit halves)."""
+    high = (x >> np.uint64(32)).astype('float64')
+    low = (x & np.uint64(0xFFFFFFFF)).astype('float64')
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def _check_precision(precision):
+    if not 4 <= precision <= 18:
+        raise ValueError(f"HyperLogLog precision must be between 4 and 18, got {precision}")
+
+
+def hll_registers(values, precision=HLL_PRECISION, hashes=None):
+    """(register index, rank) of every non-null value: the register update each value makes."""
+    if hashes is None:
+        hashes = hash_values(values)
+    q = 64 - precision
+    index = (hashes >> np.uint64(q)).astype(np.intp)
+    rank = (q + 1 - _bit_length(hashes & np.uint64((1 << q) - 1))).astype('uint8')
+    return index, rank
+
+
+def _sigma(x):
+    """Ertl's sigma() for an array of register fractions (inf where x == 1)."""
+    full = x == 1
+    x = np.where(full, 0.0, x)
+    y, z = 1.0, x.copy()
+    while True:
+        x = x * x
+        previous, z = z, z + x * y
+        y += y
+        if np.array_equal(z, previous):
+            return np.where(full, np.inf, z)
+
+
+def _tau(x):
+    """Ertl's tau() for an array of register fractions."""
+    edge = (x == 0) | (x == 1)
+    x = np.where(edge, 0.5, x)
+    y, z = 1.0, 1 - x
+    while True:
+        x = np.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if np.array_equal(z, previous):
+            return np.where(edge, 0.0, z / 3)
+
+
+def hll_estimates(histograms, precision):
+    """
+    Distinct counts (Ertl 2017, improved raw estimator) for a 2-D array of
+    register histograms: row i, column k = registers of sketch i holding k.
+    """
+    m, q = 1 << precision, 64 - precision
+    counts = np.asarray(histograms, dtype='float64')
+    z = m * _tau(1 - counts[:, q + 1] / m)
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + counts[:, k])
+    with np.errstate(divide='ignore'):
+        z = z + m * _sigma(counts[:, 0] / m)
+        return np.rint(m * m / (2 * math.log(2) * z)).astype('int64')
+
+
+# Binary layout (to_bytes): format byte, precision byte, then
+#   HLL_SPARSE  one little-endian uint32 per non-zero register: index << 6 | value
+#   HLL_DENSE   all 2^p registers, one byte each
+# whichever is smaller, so a sketch of a handful of values is a few bytes.
+HLL_SPARSE = 1
+HLL_DENSE = 2
+
+
+def _encode(precision, index, rank):
+    """to_bytes() of a sketch given its non-zero registers (index ascending)."""
+    m = 1 << precision
+    if 4 * len(index) < m:
+        entries = (index.astype('<u4') << 6) | rank.astype('<u4')
+        return bytes([HLL_SPARSE, precision]) + entries.tobytes()
+    registers = np.zeros(m, dtype='uint8')
+    registers[index] = rank
+    return bytes([HLL_DENSE, precision]) + registers.tobytes()
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes of the values."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        _check_precision(precision)
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype='uint8')
+
+    def update(self, values):
+        index, rank = hll_registers(values, self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge HyperLogLog sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        """Estimated number of distinct values."""
+        histogram = np.bincount(self.registers, minlength=64 - self.precision + 2)
+        return int(hll_estimates(histogram[np.newaxis, :], self.precision)[0])
+
+    def to_bytes(self):
+        index = np.flatnonzero(self.registers)
+        return _encode(self.precision, index, self.registers[index])
+
+    @classmethod
+    def from_bytes(cls, data):
+        precision, index, rank = _decode(data)
+        sketch = cls(precision)
+        sketch.registers[index] = rank
+        return sketch
+
+
+def _decode(data):
+    """(precision, register index, value) of the non-zero registers of a to_bytes() sketch."""
+    kind, precision = data[0], data[1]
+    if kind == HLL_SPARSE:
+        entries = np.frombuffer(data, dtype='<u4', offset=2)
+        return precision, (entries >> 6).astype(np.intp), (entries & 0x3F).astype('uint8')
+    if kind == HLL_DENSE:
+        registers = np.frombuffer(data, dtype='uint8', offset=2)
+        index = np.flatnonzero(registers)
+        return precision, index, registers[index]
+    raise ValueError(f"Unknown HyperLogLog format {kind}")
+
+
+def _sketch_groups(registers, by, precision, batch_groups=50_000):
+    """
+    Sketches from register updates: registers has the by columns plus index
+    and rank (any number of rows per register). Returns the groups with
+    'estimate' and 'sketch' (to_bytes()).
+    """
+    if registers.empty:
+        return pd.DataFrame(columns=list(by) + ['estimate', 'sketch'])
+    # Highest rank per (group, register), sorted by group then register
+    registers = registers.groupby(list(by) + ['index'], sort=True, observed=True)['rank'].max().reset_index()
+
+    group = registers.groupby(list(by), sort=False, observed=True).ngroup().to_numpy()
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    ends = np.r_[starts[1:], len(group)]
+    index, rank = registers['index'].to_numpy(), registers['rank'].to_numpy()
+
+    # Histograms in batches of groups (batch_groups x 66 counts at most at once)
+    width = 64 - precision + 2
+    estimates = np.empty(len(starts), dtype='int64')
+    for first in range(0, len(starts), batch_groups):
+        last = min(first + batch_groups, len(starts))
+        rows_from, rows_to = starts[first], ends[last - 1]
+        local = group[rows_from:rows_to] - group[rows_from]
+        histograms = np.bincount(local * width + rank[rows_from:rows_to],
+                                 minlength=(last - first) * width).reshape(last - first, width)
+        histograms[:, 0] = (1 << precision) - (ends[first:last] - starts[first:last])
+        estimates[first:last] = hll_estimates(histograms, precision)
+
+    # Sparse sketches are slices of one buffer of encoded registers
+    entries = ((index.astype('<u4') << 6) | rank.astype('<u4')).tobytes()
+    sparse = bytes([HLL_SPARSE, precision])
+    dense = 4 * (ends - starts) >= (1 << precision)
+    result = registers.iloc[starts][list(by)].reset_index(drop=True)
+    result['estimate'] = estimates
+    result['sketch'] = [_encode(precision, index[s:e], rank[s:e]) if is_dense else sparse + entries[4 * s:4 * e]
+                        for s, e, is_dense in zip(starts.tolist(), ends.tolist(), dense.tolist())]
+    return result
+
+
+def grouped_hll(frame, by, column, precision=HLL_PRECISION):
+    """
+    One HyperLogLog of frame[column] per group of the by columns, in a single
+    vectorized pass (no per-row Python). Rows with a null key or value are
+    skipped. Returns the groups with 'estimate' and 'sketch' (to_bytes()).
+    """
+    _check_precision(precision)
+    rows = frame.dropna(subset=list(by) + [column])
+    index, rank = hll_registers(rows[column], precision)
+    registers = pd.DataFrame({**{col: rows[col].to_numpy() for col in by}, 'index': index, 'rank': rank})
+    return _sketch_groups(registers, by, precision)
+
+
+def merge_sketches(frame, by, column='sketch'):
+    """
+    Union of the to_bytes() sketches in frame[column] per group of the by
+    columns (e.g. the months of a date range per product). Returns the groups
+    with 'estimate' and the merged 'sketch'.
+    """
+    if frame.empty:
+        return pd.DataFrame(columns=list(by) + ['estimate', 'sketch'])
+    decoded = [_decode(bytes(data)) for data in frame[column]]
+    precisions = {precision for precision, _, _ in decoded}
+    if len(precisions) > 1:
+        raise ValueError(f"Cannot merge HyperLogLog sketches of precisions {sorted(precisions)}")
+    sizes = [len(index) for _, index, _ in decoded]
+    registers = pd.DataFrame({
+        **{col: np.repeat(frame[col].to_numpy(), sizes) for col in by},
+        'index': np.concatenate([index for _, index, _ in decoded]),
+        'rank': np.concatenate([rank for _, _, rank in decoded]),
+    })
+    return _sketch_groups(registers, by, precisions.pop())
+
+
+# =====================
+# Heavy hitters
+# =====================
+class HeavyHitters:
+    """Misra-Gries summary: at most capacity counters, merged by subtracting the (capacity+1)-th count."""
+
+    def __init__(self, capacity=HEAVY_HITTERS_CAPACITY):
+        self.capacity = capacity
+        self.n = 0
+        self.counts = pd.Series(dtype='int64')
+
+    def update(self, values):
+        s = pd.Series(values)
+        s = s[s.notna()]
+        self.n += len(s)
+        return self._add(s.value_counts(sort=False))
+
+    def merge(self, other):
+        self.n += other.n
+        return self._add(other.counts)
+
+    def _add(self, counts):
+        if len(self.counts):
+            counts = self.counts.add(counts, fill_value=0)
+        if len(counts) > self.capacity:
+            cut = np.partition(counts.to_numpy(), -(self.capacity + 1))[-(self.capacity + 1)]
+            counts = counts[counts > cut] - cut
+        self.counts = counts.astype('int64')
+        return self
+
+    def error(self):
+        """Most a kept count can be below the true count."""
+        return (self.n - int(self.counts.sum())) // (self.capacity + 1)
+
+    def top(self, n=1):
+        """The n values with the highest counts, as a Series value → count."""
+        return self.counts.sort_values(ascending=False, kind='stable').head(n)
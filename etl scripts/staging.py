@@ -0,0 +1,191 @@
+import logging
+import os
+import shutil
+
+import pandas as pd
+
+from schemas import PRIMARY_KEYS, STRING_DTYPE
+
+"""
+# ──────────────────────────────────────────────────────────────────────────────
+# 📦 Parquet Staging
+# ──────────────────────────────────────────────────────────────────────────────
+Cleaned tables used to go straight from memory into the database, so every
+re-load or backfill had to parse and clean the CSVs again. Now each cleaned
+table is also written to a Parquet staging area:
+
+    staging/
+      customers/part-0-0.parquet
+      orders/order_month=2024-01/part-0-0.parquet     ← partitioned by month
+      orders/order_month=2024-02/...
+      ...
+
+Loads (LOAD_FROM_STAGING in etl_pipeline.py) and analytics read it back
+through Arrow: string columns stay Arrow-backed (no copy into Python
+objects) and filters on the partition column only open the matching files.
+
+Needs pyarrow (pip install pyarrow).
+# ──────────────────────────────────────────────────────────────────────────────
+"""
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+STAGING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'staging')
+
+# table → (date column, name of the month partition column derived from it)
+PARTITIONS = {
+    'orders': ('order_date', 'order_month'),
+}
+
+# Folder name pyarrow gives the partition of rows without a date
+HIVE_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def staging_available():
+    return ds is not None
+
+
+def _require_pyarrow():
+    if ds is None:
+        raise ImportError("Parquet staging needs pyarrow: pip install pyarrow")
+
+
+def table_dir(table_name, staging_dir=STAGING_DIR):
+    return os.path.join(staging_dir, table_name)
+
+
+def has_staged(table_name, staging_dir=STAGING_DIR):
+    return os.path.isdir(table_dir(table_name, staging_dir))
+
+
+def _with_partition_column(df, table_name):
+    if table_name not in PARTITIONS:
+        return df, None
+    date_col, part_col = PARTITIONS[table_name]
+    months = df[date_col].dt.strftime('%Y-%m').astype(STRING_DTYPE)
+    return df.assign(**{part_col: months}), part_col
+
+
+def _write(df, table_name, staging_dir, basename, existing_data_behavior):
+    # Categoricals are staged as plain strings: every chunk has its own
+    # categories, and Parquet dictionary-encodes the strings anyway
+    categoricals = {col: STRING_DTYPE for col, dtype in df.dtypes.items()
+                    if isinstance(dtype, pd.CategoricalDtype)}
+    df, part_col = _with_partition_column(df.astype(categoricals), table_name)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table,
+        table_dir(table_name, staging_dir),
+        format='parquet',
+        partitioning=[part_col] if part_col else None,
+        partitioning_flavor='hive' if part_col else None,
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior=existing_data_behavior,
+    )
+
+
+def stage_table(df, table_name, chunk_index=0, mode='replace', staging_dir=STAGING_DIR):
+    """
+    Write one cleaned DataFrame (whole table or one chunk) to the staging area.
+
+    - replace: chunk 0 wipes the table's staging folder, later chunks add files
+    - upsert: the batch is merged into what is staged already, by primary key
+      (for partitioned tables only the month partitions that receive rows or
+      hold a staged copy of one of the batch's keys are rewritten)
+    """
+    _require_pyarrow()
+    path = table_dir(table_name, staging_dir)
+
+    if mode == 'upsert' and os.path.isdir(path):
+        _merge_into_staged(df, table_name, staging_dir)
+    else:
+        if chunk_index == 0 and os.path.isdir(path):
+            shutil.rmtree(path)
+        _write(df, table_name, staging_dir, f"part-{chunk_index}", 'overwrite_or_ignore')
+    logging.debug(f"Staged {len(df)} rows of {table_name} in {path}")
+
+
+def _merge_into_staged(df, table_name, staging_dir):
+    """Upsert a batch into the staged table: staged rows with the same key are replaced."""
+    key_columns = PRIMARY_KEYS[table_name]
+    part = PARTITIONS.get(table_name)
+
+    if part is None:
+        merged = pd.concat([read_staged(table_name, staging_dir=staging_dir), df], ignore_index=True)
+        merged = merged.drop_duplicates(subset=key_columns, keep='last')
+        shutil.rmtree(table_dir(table_name, staging_dir))
+        _write(merged, table_name, staging_dir, 'part-0', 'overwrite_or_ignore')
+        return
+
+    # Only the month partitions that receive rows, or hold the staged copy of
+    # a row whose date moved to another month, are read and rewritten
+    date_col, part_col = part
+    batch_months = df[date_col].dt.strftime('%Y-%m')
+    staged = staged_dataset(table_name, staging_dir).to_table(columns=key_columns + [part_col]).to_pandas()
+    holding = staged.merge(df[key_columns].drop_duplicates(), on=key_columns, how='inner')[part_col]
+    months = set(batch_months.dropna()) | set(holding.dropna())
+    with_null = bool(batch_months.isna().any() or holding.isna().any())
+
+    existing = read_staged(table_name, filter=_partition_filter(part_col, months, with_null), staging_dir=staging_dir)
+    merged = pd.concat([existing, df], ignore_index=True)
+    merged = merged.drop_duplicates(subset=key_columns, keep='last')
+    _write(merged, table_name, staging_dir, 'part-0', 'delete_matching')
+
+    # delete_matching only replaces the partitions written to: drop the ones
+    # whose last row moved away
+    written = merged[date_col].dt.strftime('%Y-%m')
+    emptied = [month for month in months if month not in set(written.dropna())]
+    if with_null and not written.isna().any():
+        emptied.append(HIVE_NULL_PARTITION)
+    for month in emptied:
+        shutil.rmtree(os.path.join(table_dir(table_name, staging_dir), f"{part_col}={month}"), ignore_errors=True)
+
+
+def _partition_filter(part_col, months, with_null=False):
+    """pyarrow filter for the given month partitions (with_null: also the one of rows without a date)."""
+    expression = ds.field(part_col).isin(pa.array(sorted(months), type=pa.string()))
+    return expression | ds.field(part_col).is_null() if with_null else expression
+
+
+def staged_dataset(table_name, staging_dir=STAGING_DIR):
+    """pyarrow Dataset over the staged table (lazy: nothing is read yet)."""
+    _require_pyarrow()
+    partitioning = 'hive' if table_name in PARTITIONS else None
+    return ds.dataset(table_dir(table_name, staging_dir), format='parquet', partitioning=partitioning)
+
+
+def _to_pandas(table, table_name):
+    # Strings stay Arrow-backed (string[pyarrow]), so no per-value Python objects
+    df = table.to_pandas(types_mapper={pa.string(): STRING_DTYPE, pa.large_string(): STRING_DTYPE}.get)
+    if table_name in PARTITIONS:
+        df = df.drop(columns=[PARTITIONS[table_name][1]], errors='ignore')
+    return df
+
+
+def staged_bytes(table_name, staging_dir=STAGING_DIR):
+    """Size on disk of the staged table's Parquet files."""
+    return sum(os.path.getsize(path) for path in staged_dataset(table_name, staging_dir).files)
+
+
+def read_staged(table_name, columns=None, filter=None, staging_dir=STAGING_DIR):
+    """
+    Read a staged table back as a DataFrame.
+    filter is a pyarrow expression, e.g. ds.field('order_month') >= '2024-01'.
+    """
+    table = staged_dataset(table_name, staging_dir).to_table(columns=columns, filter=filter)
+    return _to_pandas(table, table_name)
+
+
+def iter_staged(table_name, chunk_size=None, staging_dir=STAGING_DIR):
+    """Yield the staged table as DataFrames (whole table, or about chunk_size rows each)."""
+    dataset = staged_dataset(table_name, staging_dir)
+    if chunk_size is None:
+        yield _to_pandas(dataset.to_table(), table_name)
+        return
+    for batch in dataset.to_batches(batch_size=chunk_size):
+        if batch.num_rows:
+            yield _to_pandas(pa.Table.from_batches([batch]), table_name)
@@ -7,10 +7,10 @@ Tracking customer retention and churn risk.
 Monitoring revenue trends and operational KPIs.
 */
 --create adatbase named retail_analytics
-create database retail_analytics
+create database retail_analytics;
 
 --use the datbase
-select current_database()
+select current_database();
 
 --drops the table if already exists
 DROP TABLE IF EXISTS reviews CASCADE;
@@ -78,7 +78,21 @@ CREATE TABLE reviews (
   review_date DATE
 );
 
-select * from customers; where signup_date is not null;
+-- indexes, also only for reference: the etl script builds them after every load
+-- (schemas.declared_indexes → loaders.ensure_indexes) and runs ANALYZE.
+-- Join keys have the same type on both sides (VARCHAR here, VARCHAR(50) in the
+-- tables the etl script creates), so joins need no casts.
+-- primary keys: declared in the CREATE TABLEs above (the etl script builds them as
+-- unique ux_<table>_<key> indexes and promotes those to PRIMARY KEY)
+-- foreign keys used by the joins below
+CREATE INDEX IF NOT EXISTS ix_orders_customer_id ON orders (customer_id);
+CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id);
+CREATE INDEX IF NOT EXISTS ix_order_items_product_id ON order_items (product_id);
+CREATE INDEX IF NOT EXISTS ix_reviews_order_id ON reviews (order_id);
+-- order_date: BRIN when orders are stored in date order (pg_stats correlation >= 0.9), else btree
+CREATE INDEX IF NOT EXISTS ix_orders_order_date ON orders USING brin (order_date);
+
+select * from customers where signup_date is not null;
 select * from products;
 select * from orders;
 select * from order_items;
@@ -183,7 +197,7 @@ SELECT
     DATE_TRUNC('month', o.order_date)::date AS month,
     ROUND(SUM(oi.unit_price * oi.quantity)::numeric, 2) AS total_revenue
 FROM orders o
-JOIN order_items oi ON o.order_id:: bigint = oi.order_id::bigint
+JOIN order_items oi ON o.order_id = oi.order_id -- same type on both sides: no cast, so the order_id indexes can be used
 GROUP BY month
 ORDER BY month;
 
@@ -198,8 +212,28 @@ JOIN products p ON oi.product_id = p.product_id
 GROUP BY p.category
 ORDER BY avg_order_value DESC;
 
+-- The same two reports from the revenue_cube table the ETL keeps pre-aggregated
+-- (revenue_cube.py: revenue / quantity / order_count per day, category, payment
+-- method, status and customer location). Only the cube's cells are summed.
+SELECT
+    DATE_TRUNC('month', order_date)::date AS month,
+    ROUND(SUM(revenue)::numeric, 2) AS total_revenue
+FROM revenue_cube
+GROUP BY month
+ORDER BY month;
+
+SELECT
+    category,
+    ROUND(SUM(revenue)::numeric / SUM(order_count), 2) AS avg_order_value
+FROM revenue_cube
+GROUP BY category
+ORDER BY avg_order_value DESC;
+
 
 -- statstical summary
+-- The ETL also streams this row into the order_stats table while orders load
+-- (order_stats.py: one pass, approximate median / unique_customers / mode):
+--   SELECT * FROM order_stats;
 drop view  if exists vw_statics;
 create or replace view vw_statics as
 SELECT 
@@ -234,28 +268,25 @@ FROM orders;
  what is the total spend by the customer
 - Helps identify VIP customers vs at-risk customers.
 Business Value:
-Supports targeted retention campaigns and loyalty programs.*/
+Supports targeted retention campaigns and loyalty programs.
+The scores are precomputed by the ETL (etl scripts/rfm.py) into customer_rfm
+after every load, so the view no longer aggregates and ranks all orders:
+  customer_rfm(customer_id, last_order_date, frequency, monetary, r_score, f_score, m_score)
+  r_score: NTILE(5) by last_order_date ASC = recency DESC (lower the better)
+  f_score: NTILE(5) by frequency ASC, m_score: NTILE(5) by monetary ASC*/
+DROP VIEW IF EXISTS vw_customer_rfm; -- column types changed (frequency is INTEGER now)
 CREATE OR REPLACE VIEW vw_customer_rfm AS
-WITH last_purchase AS (
-  SELECT 
-    customer_id,
-    MAX(order_date) AS last_orde,
-    COUNT(*) AS frequency,
-    SUM(order_amount) AS monetary
-  FROM orders
-  GROUP BY customer_id
-)
 SELECT 
   c.customer_id,
   c.name,
-  (CURRENT_DATE - last_order) as recency,  
-  frequency,
-  monetary,
-  NTILE(5) OVER (ORDER BY (CURRENT_DATE - last_order) DESC) AS r_score, --lower the better so desc
-  NTILE(5) OVER (ORDER BY frequency ASC) AS f_score,
-  NTILE(5) OVER (ORDER BY monetary ASC) AS m_score
-FROM last_purchase lp
-JOIN customers c ON lp.customer_id = c.customer_id;
+  (CURRENT_DATE - r.last_order_date) as recency,  
+  r.frequency,
+  r.monetary,
+  r.r_score,
+  r.f_score,
+  r.m_score
+FROM customer_rfm r
+JOIN customers c ON r.customer_id = c.customer_id;
 
 
 -- 2. Pareto Analysis – Top 10% Customers
@@ -278,7 +309,10 @@ Solution:
 - Top 10 products identified for strategic focus.
 Business Value: 
 Informs inventory management, promotions, and product portfolio optimization.*/
-drop view if exists vw_productcust 
+-- Unique buyers per product / category / cohort for any month range, without
+-- COUNT(DISTINCT): merge the HyperLogLog sketches of customer_sketches
+-- (customer_sketches.unique_customers(), refreshed by the ETL).
+drop view if exists vw_productcust;
 CREATE OR REPLACE VIEW vw_productcust AS
 SELECT 
     p.product_id,
@@ -299,56 +333,28 @@ LIMIT 10;
 
 DROP VIEW IF EXISTS vw_cohort_retention;
 
-4. cohort retention
+-- 4. cohort retention
 /*Are customers retained over time? How do cohorts behave month-over-month?
 Solution:
 - `vw_cohort_retention` view calculates active customers per cohort month.
 - Provides retention metrics for each signup cohort.
+- The full cohort x month_number matrix is precomputed by the ETL
+  (etl scripts/cohorts.py) into cohort_retention:
+  cohort_retention(cohort_month, month_number, active_customers, total_customers, retention_rate)
+  month_number = months from signup month to order month + 1 (same month = 1)
+- Filter on month_number for one offset (month_number = 1 is the old view).
 Business Value:
 Helps assess marketing effectiveness and churn risk, 
 guiding engagement strategies.*/
 CREATE OR REPLACE VIEW vw_cohort_retention AS
-WITH cohort_base AS (
-  SELECT 
-      c.customer_id,
-      DATE_TRUNC('month', c.signup_date)::date AS cohort_month,
-      DATE_TRUNC('month', o.order_date)::date AS order_month
-  FROM customers c
-  JOIN orders o 
-      ON c.customer_id = o.customer_id
-),
-cohort_labeled AS (
-  SELECT
-      cohort_month,
-      order_month,
-      COUNT(DISTINCT customer_id) AS active_customers
-  FROM cohort_base
-  GROUP BY cohort_month, order_month
-),
-cohort_size AS (
-  SELECT 
-      DATE_TRUNC('month', signup_date)::date AS cohort_month,
-      COUNT(DISTINCT customer_id) AS total_customers
-  FROM customers
-  GROUP BY DATE_TRUNC('month', signup_date)::date
-),
-filtered_result AS (
-  SELECT
-      c.cohort_month,
-      c.active_customers,
-      ROUND(100.0 * c.active_customers / cs.total_customers, 2) AS retention_rate,
-      (EXTRACT(YEAR FROM c.order_month) - EXTRACT(YEAR FROM c.cohort_month)) * 12 +
-      (EXTRACT(MONTH FROM c.order_month) - EXTRACT(MONTH FROM c.cohort_month)) + 1 AS month_number
-  FROM cohort_labeled c
-  JOIN cohort_size cs USING (cohort_month)
-)
 SELECT
   cohort_month,
+  month_number,
   active_customers,
+  total_customers,
   retention_rate
-FROM filtered_result
-WHERE month_number = 1
-ORDER BY cohort_month;
+FROM cohort_retention
+ORDER BY cohort_month, month_number;
 
 
 